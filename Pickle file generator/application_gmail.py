@@ -1,10 +1,12 @@
-import pickle
 import os.path
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
+import sys
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+# google_credentials.py se trouve à la racine du projet
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import google_credentials
+
 # Nom du fichier pickle contenant les informations d'identification.
 PICKLE_FILE = 'eva.pickle'
 # Scopes requis par l'application. Doivent correspondre à ceux du jeton.
@@ -14,22 +16,12 @@ def get_gmail_service():
     """
     Charge les informations d'identification et retourne un objet service pour l'API Gmail.
     """
-    creds = None
-    if os.path.exists(PICKLE_FILE):
-        with open(PICKLE_FILE, 'rb') as token:
-            creds = pickle.load(token)
-
-    # Si les informations d'identification ne sont pas valides, les rafraîchir ou arrêter.
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-            # Sauvegarder les nouvelles informations pour les prochaines exécutions.
-            with open(PICKLE_FILE, 'wb') as token:
-                pickle.dump(creds, token)
-        else:
-            print(f"Erreur: Fichier '{PICKLE_FILE}' non trouvé ou invalide.")
-            print("Veuillez d'abord exécuter le script de génération de jeton.")
-            return None # Retourne None si l'authentification échoue.
+    # Le gestionnaire rafraîchit le jeton si nécessaire et ne réécrit le fichier que s'il a changé.
+    creds = google_credentials.get_manager(PICKLE_FILE, refresh_ahead=False).get()
+    if not creds:
+        print(f"Erreur: Fichier '{PICKLE_FILE}' non trouvé ou invalide.")
+        print("Veuillez d'abord exécuter le script de génération de jeton.")
+        return None # Retourne None si l'authentification échoue.
 
     try:
         service = build('gmail', 'v1', credentials=creds)
@@ -1,7 +1,10 @@
-import pickle
 import os.path
+import sys
 from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
+
+# google_credentials.py se trouve à la racine du projet
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import google_credentials
 
 # Ce scope accorde un accès complet à la boîte aux lettres.
 SCOPES = [
@@ -24,31 +27,20 @@ def create_pickle_file():
         print("Erreur : Le nom du fichier ne peut pas être vide. Opération annulée.")
         return
 
-    creds = None
-    # Si le fichier pickle existe déjà, on le charge.
-    if os.path.exists(pickle_filename):
-        with open(pickle_filename, 'rb') as token:
-            creds = pickle.load(token)
-
-    # Si les informations d'identification n'existent pas ou ne sont pas valides.
-    if not creds or not creds.valid:
-        # Si le jeton est expiré et qu'un jeton de rafraîchissement existe, on le rafraîchit.
-        if creds and creds.expired and creds.refresh_token:
-            print("Rafraîchissement du jeton...")
-            creds.refresh(Request())
-        else:
-            # Sinon, on lance le flux d'authentification pour en obtenir un nouveau.
-            print("Lancement de la procédure d'authentification...")
-            flow = InstalledAppFlow.from_client_secrets_file(
-                'client_secret.json', SCOPES)
-            creds = flow.run_local_server(port=0)
+    # Le gestionnaire charge le fichier existant, rafraîchit le jeton expiré si possible
+    # et l'enregistre de façon atomique s'il a changé.
+    manager = google_credentials.CredentialManager(pickle_filename, refresh_ahead=False)
+    creds = manager.get()
 
-        # On enregistre les informations d'identification (nouvelles ou rafraîchies).
-        with open(pickle_filename, 'wb') as token:
-            pickle.dump(creds, token)
-        print(f"Le fichier '{pickle_filename}' a été créé/mis à jour avec succès.")
+    if creds:
+        print(f"Le fichier '{pickle_filename}' est valide.")
     else:
-        print(f"Le fichier '{pickle_filename}' est déjà valide.")
+        # Aucun jeton utilisable : on lance le flux d'authentification pour en obtenir un nouveau.
+        print("Lancement de la procédure d'authentification...")
+        flow = InstalledAppFlow.from_client_secrets_file(
+            'client_secret.json', SCOPES)
+        manager.set(flow.run_local_server(port=0))
+        print(f"Le fichier '{pickle_filename}' a été créé/mis à jour avec succès.")
 
 if __name__ == '__main__':
     create_pickle_file()
\ No newline at end of file
@@ -3,20 +3,20 @@
 import os
 import time
 import json
-import pickle
 import asyncio
 import websockets
 import argparse
 import base64
 from email.message import EmailMessage
-from email.utils import parseaddr
 
 # --- Bibliothèques Google ---
-from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+import google_credentials
+import google_services
+from gmail_mirror import GmailMirror
+
 # ==============================================================================
 # --- CONFIGURATION (CORRIGÉE) ---
 # ==============================================================================
@@ -48,31 +48,19 @@ SCOPES = [
 processed_message_ids = set()
 
 def get_google_credentials(token_file):
-    creds = None
-    if os.path.exists(token_file):
-        with open(token_file, 'rb') as token:
-            creds = pickle.load(token)
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            try:
-                creds.refresh(Request())
-                with open(token_file, 'wb') as token:
-                    pickle.dump(creds, token)
-            except Exception as e:
-                print(f"Erreur lors du rafraîchissement de {token_file} : {e}")
-                return None
-        else:
-            print(f"Aucun identifiant valide trouvé dans {token_file}. Veuillez exécuter le script de génération de jeton.")
-            return None
+    # Identifiants gardés en mémoire : le minuteur du gestionnaire les rafraîchit avant expiration,
+    # le service Gmail construit une seule fois reste donc utilisable indéfiniment.
+    creds = google_credentials.get_manager(token_file).get()
+    if not creds:
+        print(f"Aucun identifiant valide trouvé dans {token_file}. Veuillez exécuter le script de génération de jeton.")
     return creds
 
-def check_for_new_emails(service, reply_all_mode, silent_mode):
+def check_for_new_emails(service, mirror, reply_all_mode, silent_mode):
     """Vérifie les emails non lus en fonction du mode et applique la liste d'exclusion par préfixe."""
-    query = ""
+    senders = None
     if reply_all_mode:
         if not silent_mode:
             print("Vérification de TOUS les emails non lus...")
-        query = "is:unread"
     else:
         if not CONTACTS_TO_MONITOR:
             if not silent_mode:
@@ -80,12 +68,13 @@ def check_for_new_emails(service, reply_all_mode, silent_mode):
             return []
         if not silent_mode:
             print(f"Vérification des emails pour les contacts surveillés...")
-        from_query = " OR ".join(CONTACTS_TO_MONITOR)
-        query = f"from:({from_query}) is:unread"
+        senders = CONTACTS_TO_MONITOR
 
     try:
-        results = service.users().messages().list(userId='me', q=query).execute()
-        messages = results.get('messages', [])
+        # Un seul appel history.list par vérification : seuls les nouveaux messages sont récupérés,
+        # la sélection des non lus se fait ensuite dans le miroir local.
+        mirror.sync()
+        messages = mirror.list_messages(("UNREAD",), senders=senders, limit=100)
         email_details = []
         if not messages:
             return email_details
@@ -93,34 +82,26 @@ def check_for_new_emails(service, reply_all_mode, silent_mode):
         if not silent_mode:
             print(f"  -> {len(messages)} email(s) non lu(s) trouvé(s) initialement.")
 
-        for msg_ref in messages:
-            if msg_ref['id'] in processed_message_ids:
+        for msg in messages:
+            if msg['id'] in processed_message_ids:
                 continue
-                
-            msg = service.users().messages().get(userId='me', id=msg_ref['id'], format='full').execute()
-            headers = msg.get('payload', {}).get('headers', [])
-            sender_raw = next((h['value'] for h in headers if h['name'].lower() == 'from'), '')
-            _, sender_email = parseaddr(sender_raw)
-            sender_email_lower = sender_email.lower()
+            sender_email = msg['sender_email']
 
             # --- LOGIQUE CORRIGÉE ---
             # Vérifie si l'email de l'expéditeur commence par un des préfixes exclus.
-            is_excluded = any(sender_email_lower.startswith(prefix) for prefix in EXCLUDED_PREFIXES)
+            is_excluded = any(sender_email.startswith(prefix) for prefix in EXCLUDED_PREFIXES)
 
             if is_excluded:
                 if not silent_mode:
                     print(f"  -> Email de '{sender_email}' ignoré (préfixe d'exclusion).")
-                mark_email_as_read(service, msg_ref['id'])
-                processed_message_ids.add(msg_ref['id'])
+                mark_email_as_read(service, msg['id'])
+                processed_message_ids.add(msg['id'])
                 continue
             # --- FIN DE LA CORRECTION ---
 
-            subject = next((h['value'] for h in headers if h['name'].lower() == 'subject'), 'Sans objet')
-            message_id_header = next((h['value'] for h in headers if h['name'].lower() == 'message-id'), None)
-
             email_details.append({
-                "id": msg['id'], "threadId": msg['threadId'], "message_id_header": message_id_header,
-                "subject": subject, "snippet": msg.get('snippet', ''), "sender_email": sender_email
+                "id": msg['id'], "threadId": msg['thread_id'], "message_id_header": msg['message_id_header'],
+                "subject": msg['subject'] or 'Sans objet', "snippet": msg['snippet'], "sender_email": sender_email
             })
         return email_details
     except HttpError as error:
@@ -200,13 +181,15 @@ async def main(token_file, silent_mode, reply_all_mode):
     creds = get_google_credentials(token_file)
     if not creds: return
         
-    gmail_service = build('gmail', 'v1', credentials=creds)
+    gmail_service = google_services.get_service('gmail', 'v1', credentials=creds)
+    # Miroir propre à ce compte, synchronisé à chaque vérification via l'API History
+    mirror = GmailMirror(os.path.splitext(token_file)[0] + "_mirror.sqlite", lambda: gmail_service)
 
     while True:
         if not silent_mode:
             print(f"\n[{time.strftime('%Y-%m-%d %H:%M:%S')}] Lancement de la vérification...")
         
-        new_emails = check_for_new_emails(gmail_service, reply_all_mode, silent_mode)
+        new_emails = check_for_new_emails(gmail_service, mirror, reply_all_mode, silent_mode)
         
         if not new_emails:
             if not silent_mode:
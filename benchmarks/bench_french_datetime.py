@@ -0,0 +1,69 @@
+# bench_french_datetime.py
+"""
+Vérifie l'analyseur de dates françaises sur le corpus de référence, puis mesure son débit
+à froid (cache vidé) et avec mémorisation (commandes d'agenda répétées).
+
+Usage (depuis la racine du projet) :
+    python benchmarks/bench_french_datetime.py
+    python benchmarks/bench_french_datetime.py --repeats 10 --show 20
+
+Le code de sortie est 1 si au moins une phrase du corpus n'est pas analysée comme attendu.
+"""
+import os
+import sys
+import time
+import argparse
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import french_datetime
+from french_datetime_corpus import REFERENCE, build_corpus
+
+def check(corpus, show):
+    failures = []
+    for phrase, expected in corpus:
+        result = french_datetime.parse_french_datetime(phrase, now=REFERENCE)
+        if result != expected:
+            failures.append((phrase, expected, result))
+    for phrase, expected, result in failures[:show]:
+        print(f"ÉCHEC {phrase!r}: attendu {expected}, obtenu {result}")
+    return failures
+
+def bench(phrases, repeats, cold):
+    timings = []
+    for _ in range(repeats):
+        if cold:
+            french_datetime._parse_cached.cache_clear()
+        start = time.perf_counter()
+        for phrase in phrases:
+            french_datetime.parse_french_datetime(phrase, now=REFERENCE)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description="Vérification et benchmark de french_datetime.")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--show", type=int, default=10, help="Nombre d'échecs affichés")
+    parser.add_argument("--working-set", type=int, default=1000, help="Phrases distinctes du scénario mémorisé")
+    args = parser.parse_args()
+
+    corpus = build_corpus()
+    failures = check(corpus, args.show)
+    print(f"Corpus: {len(corpus)} phrases | réussites: {len(corpus) - len(failures)} | échecs: {len(failures)}")
+
+    phrases = [phrase for phrase, _ in corpus]
+    cold = bench(phrases, args.repeats, cold=True)
+    # Mémorisé : un jeu de phrases tenant dans le cache, rejoué (mêmes expressions d'une commande à l'autre)
+    working_set = phrases[::max(1, len(phrases) // args.working_set)][:args.working_set]
+    bench(working_set, 1, cold=False) # Remplit le cache
+    warm = bench(working_set, args.repeats, cold=False)
+    print(f"{'mode':<10} {'total (ms)':>11} {'µs/phrase':>10} {'phrases/s':>11}")
+    for mode, best, count in (("froid", cold, len(phrases)), ("mémorisé", warm, len(working_set))):
+        print(f"{mode:<10} {best * 1000:>11.1f} {best / count * 1e6:>10.2f} {count / best:>11.0f}")
+    print(f"Cache: {french_datetime.stats()}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
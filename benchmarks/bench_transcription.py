@@ -0,0 +1,93 @@
+# bench_transcription.py
+"""
+Compare le facteur temps réel (RTF = temps de calcul / durée de l'audio) des moteurs
+de transcription sur les fichiers audio de référence.
+
+Usage (depuis la racine du projet) :
+    python benchmarks/bench_transcription.py
+    python benchmarks/bench_transcription.py --backends openai ctranslate2 --model base --beam 1 fichier.mp3
+
+Sans fichier en argument, les audios de benchmarks/fixtures/ sont utilisés ; si le dossier
+est vide, un extrait français est généré une fois avec gTTS.
+Un RTF inférieur à 1 signifie une transcription plus rapide que le temps réel.
+"""
+import os
+import sys
+import glob
+import time
+import argparse
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import transcription
+
+FIXTURES_DIR = os.path.join(BENCH_DIR, "fixtures")
+FIXTURE_TEXT = (
+    "Bonjour EVA. Peux-tu ajouter une réunion avec l'équipe projet demain à quatorze heures trente ? "
+    "Envoie ensuite un e-mail à Marie pour lui confirmer l'ordre du jour, puis rappelle-moi "
+    "d'acheter du pain, du lait et des pommes en rentrant ce soir. Quel temps fera-t-il ce week-end à Annecy ?"
+)
+
+def ensure_fixtures():
+    files = sorted(glob.glob(os.path.join(FIXTURES_DIR, "*.mp3")) + glob.glob(os.path.join(FIXTURES_DIR, "*.wav")))
+    if files:
+        return files
+    from gtts import gTTS
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    fixture_path = os.path.join(FIXTURES_DIR, "fr_commandes.mp3")
+    print(f"Génération de l'audio de référence : {fixture_path}")
+    gTTS(text=" ".join([FIXTURE_TEXT] * 4), lang="fr").save(fixture_path)
+    return [fixture_path]
+
+def bench_backend(config, audios, repeats):
+    load_start = time.perf_counter()
+    backend = transcription.load_backend(config)
+    load_time = time.perf_counter() - load_start
+    backend.transcribe(audios[0][1][:transcription.SAMPLE_RATE * 5]) # Échauffement
+
+    rows = []
+    for name, audio in audios:
+        duration = len(audio) / transcription.SAMPLE_RATE
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            text = backend.transcribe(audio)
+            timings.append(time.perf_counter() - start)
+        best = min(timings)
+        rows.append((name, duration, best, best / duration, text))
+    return load_time, rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark RTF des moteurs Whisper.")
+    parser.add_argument("files", nargs="*", help="Fichiers audio (défaut : benchmarks/fixtures/)")
+    parser.add_argument("--backends", nargs="+", default=list(transcription.BACKENDS))
+    parser.add_argument("--model", default=os.getenv("WHISPER_MODEL_SIZE", "base"))
+    parser.add_argument("--compute-type", default=os.getenv("WHISPER_COMPUTE_TYPE", "int8"))
+    parser.add_argument("--beam", type=int, default=int(os.getenv("WHISPER_BEAM_SIZE", "1")))
+    parser.add_argument("--language", default=os.getenv("WHISPER_LANGUAGE", "fr"))
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    files = args.files or ensure_fixtures()
+    # Les fichiers ne sont décodés qu'une fois : seul le moteur est mesuré
+    audios = [(os.path.basename(path), transcription.load_audio(path)) for path in files]
+
+    print(f"Modèle: {args.model} | compute_type: {args.compute_type} | beam: {args.beam} | langue: {args.language}")
+    print(f"{'moteur':<12} {'fichier':<28} {'durée (s)':>10} {'calcul (s)':>11} {'RTF':>7}")
+    for backend_name in args.backends:
+        config = transcription.TranscriptionConfig(
+            backend=backend_name, model_size=args.model, compute_type=args.compute_type,
+            beam_size=args.beam, language=args.language,
+        )
+        try:
+            load_time, rows = bench_backend(config, audios, args.repeats)
+        except ImportError as e:
+            print(f"{backend_name:<12} ignoré (bibliothèque manquante : {e})")
+            continue
+        for name, duration, best, rtf, text in rows:
+            print(f"{backend_name:<12} {name[:28]:<28} {duration:>10.1f} {best:>11.2f} {rtf:>7.3f}")
+        print(f"{backend_name:<12} chargement du modèle : {load_time:.1f} s | extrait : {rows[0][4][:70]!r}")
+
+if __name__ == "__main__":
+    main()
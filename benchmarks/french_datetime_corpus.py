@@ -0,0 +1,102 @@
+# french_datetime_corpus.py
+"""
+Corpus de phrases de date/heure en français avec le résultat attendu, calculé à partir d'une
+date de référence fixe. Sert à la vérification et au benchmark de french_datetime.
+
+Les phrases sont construites par combinaison (jour × heure × tournure) : le résultat attendu
+est connu par construction, sans passer par l'analyseur.
+"""
+import calendar
+import datetime
+
+REFERENCE = datetime.datetime(2025, 6, 18, 10, 37) # Un mercredi
+
+MONTH_NAMES = ["janvier", "février", "mars", "avril", "mai", "juin", "juillet", "août",
+               "septembre", "octobre", "novembre", "décembre"]
+WEEKDAY_NAMES = ["lundi", "mardi", "mercredi", "jeudi", "vendredi", "samedi", "dimanche"]
+
+# (suffixe, (heure, minute)) ; None = heure par défaut (9h)
+TIME_SUFFIXES = [
+    ("", None), (" à 14h", (14, 0)), (" à 10h30", (10, 30)), (" à 8h15", (8, 15)), (" à 18:45", (18, 45)),
+    (" à 0h", (0, 0)), (" à 23h59", (23, 59)), (" matin", (9, 0)), (" midi", (12, 0)),
+    (" après-midi", (14, 0)), (" soir", (20, 0)), (" à 8h du soir", (20, 0)), (" à 9h du matin", (9, 0)),
+]
+PREFIXES = ["", "le ", "rendez-vous "]
+
+
+def _at(day, time_of_day):
+    hour, minute = time_of_day or (9, 0)
+    return datetime.datetime.combine(day, datetime.time(hour, minute))
+
+
+def _add_months(day, months):
+    month_index = day.month - 1 + months
+    year, month = day.year + month_index // 12, month_index % 12 + 1
+    return day.replace(year=year, month=month, day=min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def build_corpus(reference=REFERENCE):
+    """Liste de (phrase, datetime attendu ou None), sans doublon."""
+    today = reference.date()
+    cases = {}
+
+    def add(phrase, expected):
+        cases.setdefault(phrase, expected)
+
+    keywords = {"demain": 1, "aujourd'hui": 0, "ce jour": 0, "après-demain": 2, "apres-demain": 2}
+    for keyword, offset in keywords.items():
+        for suffix, time_of_day in TIME_SUFFIXES:
+            add(keyword + suffix, _at(today + datetime.timedelta(days=offset), time_of_day))
+            add(keyword.capitalize() + suffix, _at(today + datetime.timedelta(days=offset), time_of_day))
+
+    add("ce soir", _at(today, (20, 0)))
+    for hour in range(13, 24):
+        add(f"ce soir à {hour}h", _at(today, (hour, 0)))
+        add(f"ce soir à {hour - 12}h", _at(today, (hour, 0)))
+
+    for index, name in enumerate(WEEKDAY_NAMES):
+        day = today + datetime.timedelta(days=(index - today.weekday() - 1) % 7 + 1)
+        for suffix, time_of_day in TIME_SUFFIXES:
+            for qualifier in ("", " prochain"):
+                add(f"{name}{qualifier}{suffix}", _at(day, time_of_day))
+                add(f"{name.capitalize()}{qualifier}{suffix}", _at(day, time_of_day))
+
+    for month, month_name in enumerate(MONTH_NAMES, start=1):
+        for day_number in (1, 2, 10, 15, 18, 28, 30, 31):
+            if day_number > calendar.monthrange(today.year, month)[1]:
+                add(f"le {day_number} {month_name}", None)
+                continue
+            day = datetime.date(today.year, month, day_number)
+            for prefix in PREFIXES:
+                day_word = "1er" if day_number == 1 and prefix else str(day_number)
+                for suffix, time_of_day in TIME_SUFFIXES[:7]:
+                    rolled = day.replace(year=today.year + 1) if month < today.month else day
+                    add(f"{prefix}{day_word} {month_name}{suffix}", _at(rolled, time_of_day))
+                    rolled_next = day.replace(year=today.year + 1) if day < today else day
+                    add(f"{prefix}{day_word} {month_name} prochain{suffix}", _at(rolled_next, time_of_day))
+                    for year in (2024, 2026):
+                        explicit = day.replace(year=year)
+                        add(f"{prefix}{day_word} {month_name} {year}{suffix}", _at(explicit, time_of_day))
+                        add(f"{prefix}{day_word} {month_name} l'année {year}{suffix}", _at(explicit, time_of_day))
+            rolled = day.replace(year=today.year + 1) if month < today.month else day
+            add(f"{day_number:02d}/{month:02d}", _at(rolled, None))
+            add(f"{day_number}/{month} à 16h", _at(rolled, (16, 0)))
+            add(f"{day_number:02d}/{month:02d}/2026 à 11h", _at(day.replace(year=2026), (11, 0)))
+            add(f"{day_number}.{month}.26", _at(day.replace(year=2026), None))
+            add(f"2026-{month:02d}-{day_number:02d} 15:30", _at(day.replace(year=2026), (15, 30)))
+
+    numbers = {"un": 1, "une": 1, "deux": 2, "trois": 3}
+    numbers.update({str(n): n for n in range(1, 13)})
+    for word, amount in numbers.items():
+        for suffix, time_of_day in TIME_SUFFIXES[:5]:
+            add(f"dans {word} semaine{'s' if amount > 1 else ''}{suffix}", _at(today + datetime.timedelta(weeks=amount), time_of_day))
+            add(f"dans {word} mois{suffix}", _at(_add_months(today, amount), time_of_day))
+            add(f"dans {word} jour{'s' if amount > 1 else ''}{suffix}", _at(today + datetime.timedelta(days=amount), time_of_day))
+        instant = reference.replace(second=0, microsecond=0)
+        add(f"dans {word} heure{'s' if amount > 1 else ''}", instant + datetime.timedelta(hours=amount))
+        add(f"dans {word} minute{'s' if amount > 1 else ''}", instant + datetime.timedelta(minutes=amount))
+
+    for phrase in ("", "n'importe quoi", "bientôt", "la semaine des quatre jeudis", "le 30 février",
+                   "le 31 avril à 10h", "demain à 25h", "demain à 10h75", "31/02", "2026-13-01"):
+        add(phrase, None)
+    return list(cases.items())
@@ -0,0 +1,226 @@
+# calendar_store.py
+"""
+Copie locale des événements Google Calendar.
+
+Une synchronisation complète initiale (occurrences des événements récurrents développées),
+puis des synchronisations incrémentales avec le `syncToken` renvoyé par l'API : seuls les
+événements créés, modifiés ou annulés depuis la dernière synchro sont transférés. Un jeton
+expiré (410 Gone) déclenche une nouvelle synchronisation complète. Les écritures faites par
+l'application mettent la copie à jour immédiatement, sans attendre la synchro suivante.
+
+Chaque événement est analysé une seule fois (`EventEntry`, heures converties en Europe/Paris
+avec zoneinfo) et rangé dans un index d'intervalles trié par début : une requête de
+chevauchement (instant précis ou journée) se fait par recherche dichotomique, bornée par la
+durée maximale des événements. Les événements très longs sont gardés à part pour ne pas
+élargir cette borne.
+"""
+import os
+import copy
+import time
+import bisect
+import datetime
+import threading
+from zoneinfo import ZoneInfo
+
+from googleapiclient.errors import HttpError
+
+MAX_STALENESS_S = float(os.getenv("CALENDAR_MAX_STALENESS_S", "30")) # Au-delà, une lecture déclenche une synchro incrémentale
+PAGE_SIZE = 2500 # Maximum accepté par events.list
+LONG_EVENT_S = 7 * 86400 # Au-delà, l'événement est exclu de l'index trié (liste à part)
+PARIS_TZ = ZoneInfo("Europe/Paris")
+
+
+def parse_event_time(value):
+    """Champ start/end de l'API -> (datetime conscient du fuseau, journée entière ?)."""
+    if "dateTime" in value:
+        parsed = datetime.datetime.fromisoformat(value["dateTime"].replace("Z", "+00:00"))
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=ZoneInfo(value["timeZone"]) if value.get("timeZone") else datetime.timezone.utc)
+        return parsed, False
+    # Journée entière : minuit heure de Paris (la date est la même quel que soit le fuseau de l'agenda)
+    return datetime.datetime.strptime(value["date"], "%Y-%m-%d").replace(tzinfo=PARIS_TZ), True
+
+
+def to_aware(dt):
+    """Les dates produites par parse_french_datetime sont naïves, en heure de Paris."""
+    return dt.replace(tzinfo=PARIS_TZ) if dt.tzinfo is None else dt
+
+
+class EventEntry:
+    """Forme pré-analysée d'un événement : bornes en secondes epoch et en heure de Paris."""
+    __slots__ = ("event", "start_ts", "end_ts", "start_local", "end_local", "all_day", "summary_lower")
+
+    def __init__(self, event):
+        start, self.all_day = parse_event_time(event["start"])
+        end, _ = parse_event_time(event["end"])
+        self.event = event
+        self.start_ts = start.timestamp()
+        self.end_ts = max(end.timestamp(), self.start_ts)
+        self.start_local = start.astimezone(PARIS_TZ).replace(tzinfo=None)
+        self.end_local = end.astimezone(PARIS_TZ).replace(tzinfo=None)
+        self.summary_lower = event.get("summary", "").lower()
+
+
+class IntervalIndex:
+    """
+    Index statique d'intervalles [début, fin) trié par début. Un intervalle qui chevauche
+    [a, b) commence avant b et après a - durée_max : bisect délimite ces candidats.
+    """
+
+    def __init__(self, entries):
+        self.long_entries = [e for e in entries if e.end_ts - e.start_ts > LONG_EVENT_S]
+        short = sorted((e for e in entries if e.end_ts - e.start_ts <= LONG_EVENT_S), key=lambda e: e.start_ts)
+        self.entries = short
+        self.starts = [e.start_ts for e in short]
+        self.max_duration = max((e.end_ts - e.start_ts for e in short), default=0.0)
+
+    def overlapping(self, start_ts, end_ts):
+        """Entrées chevauchant [start_ts, end_ts) ; un intervalle vide désigne l'instant start_ts."""
+        lo = bisect.bisect_left(self.starts, start_ts - self.max_duration)
+        hi = bisect.bisect_right(self.starts, end_ts) if end_ts == start_ts else bisect.bisect_left(self.starts, end_ts)
+        result = [e for e in self.entries[lo:hi] if self._overlaps(e, start_ts, end_ts)]
+        result.extend(e for e in self.long_entries if self._overlaps(e, start_ts, end_ts))
+        result.sort(key=lambda e: e.start_ts)
+        return result
+
+    @staticmethod
+    def _overlaps(entry, start_ts, end_ts):
+        if end_ts == start_ts: # Instant : en cours, ou commençant exactement à cet instant
+            return entry.start_ts <= start_ts < entry.end_ts or entry.start_ts == start_ts
+        return entry.start_ts < end_ts and entry.end_ts > start_ts
+
+
+class CalendarStore:
+    """`service_factory()` retourne un client Calendar, ou None sans autorisation."""
+
+    def __init__(self, service_factory, calendar_id="primary", max_staleness_s=MAX_STALENESS_S):
+        self.service_factory = service_factory
+        self.calendar_id = calendar_id
+        self.max_staleness_s = max_staleness_s
+        self._events = {} # id -> EventEntry
+        self._index = None # IntervalIndex, reconstruit paresseusement après un changement
+        self._sync_token = None
+        self._last_sync = 0.0
+        self._lock = threading.RLock()
+        self._stats = {"full_syncs": 0, "incremental_syncs": 0, "changes_received": 0, "local_writes": 0}
+
+    # --- Synchronisation ---
+    def ensure_fresh(self):
+        """Synchronise si la copie n'a jamais été chargée ou date de plus de `max_staleness_s`. Peut lever HttpError."""
+        with self._lock:
+            if self._sync_token is not None and time.monotonic() - self._last_sync < self.max_staleness_s:
+                return True
+            service = self.service_factory()
+            if service is None:
+                return False
+            if self._sync_token is None:
+                self._full_sync(service)
+            else:
+                try:
+                    self._incremental_sync(service)
+                except HttpError as error:
+                    if error.resp.status != 410:
+                        raise
+                    print("INFO [calendar_store]: syncToken expiré, synchronisation complète.")
+                    self._full_sync(service)
+            self._last_sync = time.monotonic()
+            return True
+
+    def _pages(self, service, **params):
+        page_token = None
+        while True:
+            response = service.events().list(
+                calendarId=self.calendar_id, singleEvents=True, showDeleted=True,
+                maxResults=PAGE_SIZE, pageToken=page_token, **params
+            ).execute()
+            yield response
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                return
+
+    def _full_sync(self, service):
+        events, sync_token = {}, None
+        for response in self._pages(service):
+            for event in response.get("items", []):
+                entry = self._entry(event)
+                if entry is not None:
+                    events[event["id"]] = entry
+            sync_token = response.get("nextSyncToken", sync_token)
+        self._events, self._sync_token, self._index = events, sync_token, None
+        self._stats["full_syncs"] += 1
+        print(f"INFO [calendar_store]: Synchronisation complète, {len(events)} événement(s).")
+
+    def _incremental_sync(self, service):
+        for response in self._pages(service, syncToken=self._sync_token):
+            for event in response.get("items", []):
+                self._apply(event)
+                self._stats["changes_received"] += 1
+            self._sync_token = response.get("nextSyncToken", self._sync_token)
+        self._stats["incremental_syncs"] += 1
+
+    @staticmethod
+    def _entry(event):
+        if event.get("status") == "cancelled":
+            return None
+        try:
+            return EventEntry(event)
+        except (KeyError, ValueError) as e:
+            print(f"AVERTISSEMENT [calendar_store]: Événement {event.get('id')} ignoré (dates illisibles: {e})")
+            return None
+
+    def _apply(self, event):
+        entry = self._entry(event)
+        if entry is None:
+            self._events.pop(event["id"], None)
+        else:
+            self._events[event["id"]] = entry
+        self._index = None
+
+    # --- Écritures locales (après un appel réussi à l'API) ---
+    def upsert(self, event):
+        with self._lock:
+            self._apply(event)
+            self._stats["local_writes"] += 1
+
+    def remove(self, event_id):
+        with self._lock:
+            self._events.pop(event_id, None)
+            self._index = None
+            self._stats["local_writes"] += 1
+
+    # --- Lectures ---
+    def get(self, event_id):
+        """Copie modifiable d'un événement, ou None."""
+        with self._lock:
+            entry = self._events.get(event_id)
+        return copy.deepcopy(entry.event) if entry is not None else None
+
+    def _current_index(self):
+        with self._lock:
+            if self._index is None:
+                self._index = IntervalIndex(list(self._events.values()))
+            return self._index
+
+    def overlapping(self, start, end=None):
+        """EventEntry chevauchant [start, end) (datetimes, naïfs = heure de Paris) ; sans `end`, l'instant `start`."""
+        start_ts = to_aware(start).timestamp()
+        end_ts = to_aware(end).timestamp() if end is not None else start_ts
+        return self._current_index().overlapping(start_ts, end_ts)
+
+    def on_day(self, day):
+        """EventEntry ayant lieu (même en partie) pendant la journée `day` (date), heure de Paris."""
+        start = datetime.datetime.combine(day, datetime.time(0, 0))
+        return self.overlapping(start, start + datetime.timedelta(days=1))
+
+    def upcoming(self, now=None, days=90, limit=250):
+        """Événements en cours ou à venir dans les `days` prochains jours, triés par début."""
+        now = now or datetime.datetime.now(datetime.timezone.utc)
+        entries = self.overlapping(now, now + datetime.timedelta(days=days))
+        return [entry.event for entry in entries[:limit]]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["events"] = len(self._events)
+            stats["synced"] = self._sync_token is not None
+        return stats
@@ -0,0 +1,299 @@
+# contact_io.py
+"""
+Import et export en masse du carnet d'adresses (vCard 3.0 / 4.0 et CSV).
+
+Les fichiers sont lus ligne à ligne depuis un flux binaire (fichier ouvert en 'rb' ou envoi
+HTTP) : le fichier n'est jamais chargé en entier, seuls les contacts retenus sont gardés
+avant l'enregistrement. Chaque adresse est validée avec EMAIL_RE ; les doublons (dans le
+fichier ou déjà présents dans le carnet avec la même adresse) sont ignorés, puis tout le lot
+est appliqué par ContactStore.bulk_update : un seul enregistrement sur disque, tout ou rien.
+
+Usage en ligne de commande (serveur arrêté : le serveur garde le carnet en mémoire ; sinon
+passer par POST /api/contacts/import) :
+    python contact_io.py import contacts.vcf
+    python contact_io.py import export_crm.csv --overwrite
+    python contact_io.py export contacts.csv
+"""
+import io
+import os
+import csv
+import sys
+import argparse
+
+from contact_store import ContactStore, EMAIL_RE, normalize_name, normalize_email
+
+FORMATS = ("vcard", "csv")
+MIME_TYPES = {"vcard": "text/vcard", "csv": "text/csv"}
+EXTENSIONS = {"vcard": "vcf", "csv": "csv"}
+FALLBACK_ENCODING = "cp1252" # Exports CSV d'Excel / Outlook sous Windows
+
+# En-têtes CSV reconnus (minuscules) : Google Contacts, Outlook, exports CRM courants
+_CSV_NAME_COLUMNS = ("name", "display name", "full name", "nom complet", "nom", "contact", "file as")
+_CSV_GIVEN_COLUMNS = ("given name", "first name", "prénom", "prenom")
+_CSV_FAMILY_COLUMNS = ("family name", "last name", "surname", "nom de famille")
+_VCARD_ESCAPES = {"n": "\n", "N": "\n", ",": ",", ";": ";", "\\": "\\"}
+
+
+def detect_format(filename, default="vcard"):
+    extension = os.path.splitext(filename or "")[1].lower()
+    if extension in (".vcf", ".vcard"):
+        return "vcard"
+    if extension in (".csv", ".txt"):
+        return "csv"
+    return default
+
+
+def text_lines(binary_stream):
+    """Lignes décodées d'un flux binaire (UTF-8, BOM ignoré ; repli cp1252 ligne par ligne), fins de ligne conservées."""
+    first = True
+    for raw in binary_stream:
+        if first:
+            raw = raw[3:] if raw.startswith(b"\xef\xbb\xbf") else raw
+            first = False
+        try:
+            yield raw.decode("utf-8")
+        except UnicodeDecodeError:
+            yield raw.decode(FALLBACK_ENCODING, errors="replace")
+
+
+# --- vCard ---
+def _unescape(value):
+    if "\\" not in value:
+        return value
+    out, chars = [], iter(value)
+    for char in chars:
+        if char == "\\":
+            following = next(chars, "")
+            out.append(_VCARD_ESCAPES.get(following, following))
+        else:
+            out.append(char)
+    return "".join(out)
+
+
+def _split_unescaped(value, separator):
+    parts, current, escaped = [], [], False
+    for char in value:
+        if escaped:
+            current.append("\\" + char)
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif char == separator:
+            parts.append("".join(current))
+            current = []
+        else:
+            current.append(char)
+    parts.append("".join(current))
+    return parts
+
+
+def _unfold(lines):
+    """Recolle les lignes repliées (suite commençant par un espace ou une tabulation)."""
+    current = None
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if line[:1] in (" ", "\t") and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield current
+        current = line
+    if current is not None:
+        yield current
+
+
+def _is_preferred(params):
+    for param in params:
+        key, _, value = param.partition("=")
+        key, value = key.strip().upper(), value.strip().strip('"').lower()
+        if key == "PREF" or (key == "TYPE" and "pref" in value.split(",")): # 2.1 / 4.0 : PREF ; 3.0 : TYPE=pref
+            return True
+    return False
+
+
+def iter_vcard(lines):
+    """Contacts {"display_name", "email"} d'un flux vCard (2.1 / 3.0 / 4.0) ; une fiche sans nom ni adresse donne email/nom vides."""
+    card = None
+    for line in _unfold(lines):
+        name_part, sep, value = line.partition(":")
+        if not sep:
+            continue
+        params = name_part.split(";")
+        prop = params[0].split(".")[-1].upper() # « item1.EMAIL » (Apple)
+        if prop == "BEGIN" and value.strip().upper() == "VCARD":
+            card = {"fn": "", "n": "", "emails": []}
+        elif card is None:
+            continue
+        elif prop == "END" and value.strip().upper() == "VCARD":
+            emails = card["emails"]
+            preferred = next((email for email, pref in emails if pref), None)
+            email = preferred or (emails[0][0] if emails else "")
+            yield {"display_name": card["fn"] or card["n"], "email": email}
+            card = None
+        elif prop == "FN":
+            card["fn"] = " ".join(_unescape(value).split())
+        elif prop == "N":
+            # N:Famille;Prénom;Autres;Préfixe;Suffixe -> « Prénom Famille »
+            parts = [_unescape(part).strip() for part in _split_unescaped(value, ";")] + [""] * 5
+            card["n"] = " ".join(part for part in (parts[3], parts[1], parts[2], parts[0], parts[4]) if part)
+        elif prop == "EMAIL":
+            email = _unescape(value).strip()
+            if email.lower().startswith("mailto:"):
+                email = email[7:]
+            card["emails"].append((email, _is_preferred(params[1:])))
+
+
+# --- CSV ---
+def _find_column(header, candidates):
+    lowered = [column.strip().lower() for column in header]
+    for candidate in candidates:
+        if candidate in lowered:
+            return lowered.index(candidate)
+    return None
+
+
+def _email_columns(header):
+    """Colonnes d'adresse : « E-mail 1 - Value » (Google), « E-mail Address » (Outlook), « Email », « Courriel »..."""
+    columns = []
+    for index, column in enumerate(header):
+        lowered = column.strip().lower()
+        if ("mail" in lowered or "courriel" in lowered) and not any(word in lowered for word in ("type", "label", "display")):
+            columns.append(index)
+    return columns
+
+
+def iter_csv(lines):
+    """Contacts {"display_name", "email"} d'un CSV avec en-tête (séparateur ',', ';' ou tabulation détecté)."""
+    lines = iter(lines)
+    first = next(lines, None)
+    if first is None:
+        return
+    delimiter = max((",", ";", "\t"), key=first.count)
+    reader = csv.reader(_chain(first, lines), delimiter=delimiter)
+    header = next(reader, None)
+    if not header:
+        return
+    name_column = _find_column(header, _CSV_NAME_COLUMNS)
+    given_column = _find_column(header, _CSV_GIVEN_COLUMNS)
+    family_column = _find_column(header, _CSV_FAMILY_COLUMNS)
+    if given_column is not None and family_column is None:
+        family_column = _find_column(header, ("nom",)) # « Prénom;Nom » : « Nom » est le nom de famille
+    if name_column == family_column:
+        name_column = None
+    email_columns = _email_columns(header)
+    if not email_columns:
+        raise ValueError(f"Aucune colonne d'adresse e-mail dans l'en-tête CSV : {header}")
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        # Prénom + nom de famille d'abord ; la colonne de nom complet sert quand ils sont vides
+        name = " ".join(part for part in (_cell(row, given_column), _cell(row, family_column)) if part) or _cell(row, name_column)
+        # Google Contacts : « a@x.fr ::: b@y.fr » dans une même cellule
+        emails = [email.strip() for index in email_columns for email in _cell(row, index).split(":::") if email.strip()]
+        yield {"display_name": " ".join(name.split()), "email": emails[0] if emails else ""}
+
+
+def _cell(row, index):
+    return row[index].strip() if index is not None and index < len(row) else ""
+
+
+def _chain(first, rest):
+    yield first
+    yield from rest
+
+
+# --- Import ---
+def import_contacts(store, binary_stream, fmt="vcard", overwrite=False):
+    """
+    Importe un flux binaire dans `store` en une seule transaction. Un contact existant du même nom
+    n'est remplacé que si `overwrite`. Retourne les compteurs de ContactStore.bulk_update, plus
+    "read" (fiches lues), "invalid" (nom vide ou adresse invalide) et "duplicates". Peut lever
+    ValueError (format ou en-tête CSV non reconnu) et OSError (écriture du carnet).
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Format inconnu '{fmt}' (attendu : {', '.join(FORMATS)}).")
+    parser = iter_vcard if fmt == "vcard" else iter_csv
+    counts = {"read": 0, "invalid": 0, "duplicates": 0}
+    upserts, seen_names, seen_emails = [], set(), set()
+    for contact in parser(text_lines(binary_stream)):
+        counts["read"] += 1
+        key, email_key = normalize_name(contact["display_name"]), normalize_email(contact["email"])
+        if not key or not EMAIL_RE.match(contact["email"]):
+            counts["invalid"] += 1
+            continue
+        existing = store.get_by_email(email_key)
+        if key in seen_names or email_key in seen_emails or (existing and normalize_name(existing["display_name"]) != key):
+            counts["duplicates"] += 1 # Doublon du fichier, ou adresse déjà enregistrée sous un autre nom
+            continue
+        seen_names.add(key)
+        seen_emails.add(email_key)
+        upserts.append(contact)
+    counts.update(store.bulk_update(upserts, replace=lambda existing, new: overwrite))
+    return counts
+
+
+# --- Export ---
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace(",", "\\,").replace(";", "\\;")
+
+
+def _fold(line, width=75):
+    if len(line) <= width:
+        return line + "\r\n"
+    chunks = [line[:width]] + [" " + line[i:i + width - 1] for i in range(width, len(line), width - 1)]
+    return "\r\n".join(chunks) + "\r\n"
+
+
+def iter_export(contacts, fmt="vcard"):
+    """Morceaux de texte du carnet exporté (vCard 3.0, la plus largement importée, ou CSV UTF-8), contact par contact."""
+    if fmt == "vcard":
+        for contact in contacts:
+            words = contact["display_name"].split()
+            family, given = (words[-1], " ".join(words[:-1])) if len(words) > 1 else ("", contact["display_name"])
+            yield "".join((
+                "BEGIN:VCARD\r\n", "VERSION:3.0\r\n",
+                _fold(f"FN:{_escape(contact['display_name'])}"),
+                _fold(f"N:{_escape(family)};{_escape(given)};;;"),
+                _fold(f"EMAIL;TYPE=INTERNET:{contact['email']}"),
+                "END:VCARD\r\n",
+            ))
+    elif fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(("Name", "E-mail Address"))
+        for contact in contacts:
+            writer.writerow((contact["display_name"], contact["email"]))
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+    else:
+        raise ValueError(f"Format inconnu '{fmt}' (attendu : {', '.join(FORMATS)}).")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import / export du carnet d'adresses d'EVA (vCard ou CSV).")
+    parser.add_argument("action", choices=("import", "export"))
+    parser.add_argument("file", help="Fichier à importer, ou fichier de sortie de l'export ('-' : sortie standard)")
+    parser.add_argument("--format", choices=FORMATS, help="Déduit de l'extension par défaut (.vcf / .csv)")
+    parser.add_argument("--overwrite", action="store_true", help="Remplace les contacts existants du même nom")
+    parser.add_argument("--contacts", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "contacts.json"))
+    args = parser.parse_args()
+
+    store = ContactStore(args.contacts).load()
+    fmt = args.format or detect_format(args.file)
+    if args.action == "import":
+        with open(args.file, "rb") as f:
+            counts = import_contacts(store, f, fmt, overwrite=args.overwrite)
+        print(f"Import terminé ({len(store)} contacts dans le carnet) : {counts}")
+    elif args.file == "-":
+        sys.stdout.writelines(iter_export(store.all(), fmt))
+    else:
+        with open(args.file, "w", encoding="utf-8", newline="") as f:
+            f.writelines(iter_export(store.all(), fmt))
+        print(f"{len(store)} contacts exportés vers {args.file}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
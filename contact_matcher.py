@@ -0,0 +1,186 @@
+# contact_matcher.py
+"""
+Recherche approximative de contacts par nom, tolérante aux erreurs de transcription vocale.
+
+Trois index sont construits à partir du carnet (contact_store) :
+  - trigrammes de caractères du nom normalisé (« Jean Phillipe » ~ « Jean-Philippe ») ;
+  - clé phonétique française de chaque mot (« Filip » ~ « Philippe », « Gautié » ~ « Gauthier ») ;
+  - initiales (« jp » -> Jean-Philippe, Jean Petit...).
+Une requête ne compare que les contacts qui partagent au moins un trigramme, une clé ou des
+initiales avec elle : le coût dépend du nombre de candidats, pas de la taille du carnet.
+Les index sont reconstruits quand la version du carnet change.
+"""
+import re
+import heapq
+import functools
+import threading
+import collections
+
+from french_text import fold_accents
+
+MIN_SCORE = 0.5 # En dessous, le contact n'est pas proposé
+MIN_SHARED_GRAMS = 60 # % des trigrammes de la requête qu'un contact doit partager pour être comparé
+PREFIX_EXTRA_GRAMS = 3 # Trigrammes rares examinés en plus du minimum du filtrage par préfixe
+AMBIGUITY_MARGIN = 0.1 # Deux candidats plus proches que cet écart : demander confirmation
+
+_EMPTY = frozenset()
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_PHONETIC_RULES = [(re.compile(pattern), replacement) for pattern, replacement in (
+    (r"ph", "f"), (r"qu", "k"), (r"gu(?=[eiy])", "g"), (r"g(?=[eiy])", "j"), (r"c(?=[eiy])", "s"),
+    (r"ch", "#"), (r"sh", "#"), (r"sch", "#"), (r"ck", "k"), (r"c", "k"), (r"q", "k"), (r"#", "ch"),
+    (r"eaux?", "o"), (r"aux?", "o"), (r"(?<=[a-z])er$", "e"), (r"(?<=[a-z])ez$", "e"),
+    (r"ai|ei", "e"), (r"ou", "u"), (r"oi", "wa"), (r"y", "i"), (r"(?<!c)h", ""), (r"w", "v"),
+    (r"bv", "v"), (r"x", "ks"), (r"z", "s"), (r"(?<=[aeiou])s(?=[aeiou])", "z"),
+    (r"(?:ain|ein|aim|eim|in|im|un|um)(?![aeiou])", "1"), (r"(?:an|am|en|em)(?![aeiou])", "2"),
+    (r"([a-z12])\1+", r"\1"), (r"(?<=..)[estdxp]+$", ""),
+)]
+
+
+def normalize(text):
+    """'Jean-Philippe  Müller' -> 'jean philippe muller'."""
+    return " ".join(_WORD_RE.findall(fold_accents(text or "")))
+
+
+@functools.lru_cache(maxsize=65536)
+def phonetic_key(word):
+    """Clé phonétique française simplifiée d'un mot déjà normalisé : 'philippe' -> 'filip'."""
+    for pattern, replacement in _PHONETIC_RULES:
+        word = pattern.sub(replacement, word)
+    return word
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class _Entry:
+    __slots__ = ("contact", "name", "keys", "grams", "initials")
+
+    def __init__(self, contact):
+        self.contact = contact
+        self.name = normalize(contact.get("display_name"))
+        words = self.name.split()
+        self.keys = {phonetic_key(word) for word in words}
+        self.grams = trigrams(self.name)
+        self.initials = "".join(word[0] for word in words)
+
+
+class _Index:
+    """Index figé d'une version du carnet : remplacé d'un bloc, jamais modifié en place."""
+    __slots__ = ("version", "entries", "gram_sizes", "key_sizes", "by_gram", "by_key", "by_initials", "by_email_local")
+
+    def __init__(self, version=None, entries=(), by_gram=None, by_key=None, by_initials=None, by_email_local=None):
+        self.version = version
+        self.entries = list(entries)
+        self.gram_sizes = [len(entry.grams) for entry in self.entries] # Coefficient de Dice sans intersection d'ensembles
+        self.key_sizes = [len(entry.keys) for entry in self.entries]
+        self.by_gram = by_gram or {}
+        self.by_key = by_key or {}
+        self.by_initials = by_initials or {}
+        self.by_email_local = by_email_local or {}
+
+
+class ContactMatcher:
+    """`store` : un ContactStore ; les index suivent ses modifications (attribut `version`)."""
+
+    def __init__(self, store):
+        self.store = store
+        self._index = _Index()
+        self._lock = threading.Lock()
+        self._stats = {"rebuilds": 0, "queries": 0}
+
+    def _ensure_index(self):
+        """Index à jour, lu une seule fois par requête : une reconstruction concurrente ne le modifie pas."""
+        with self._lock:
+            if self._index.version == self.store.version:
+                return self._index
+            version = self.store.version
+            # Les entrées déjà analysées sont réutilisées : seuls les contacts nouveaux ou modifiés sont re-normalisés
+            previous = {(entry.contact.get("display_name"), entry.contact.get("email")): entry for entry in self._index.entries}
+            entries = [previous.get((contact.get("display_name"), contact.get("email"))) or _Entry(contact) for contact in self.store.all()]
+            by_gram, by_key = collections.defaultdict(list), collections.defaultdict(set)
+            by_initials, by_email_local = collections.defaultdict(list), collections.defaultdict(list)
+            for index, entry in enumerate(entries):
+                for gram in entry.grams:
+                    by_gram[gram].append(index)
+                for key in entry.keys:
+                    by_key[key].add(index)
+                # Initiales complètes et leurs préfixes : « jp » désigne aussi Jean-Philippe Martin
+                for length in range(2, len(entry.initials) + 1):
+                    by_initials[entry.initials[:length]].append((index, length == len(entry.initials)))
+                by_email_local[normalize(entry.contact.get("email", "").split("@")[0]).replace(" ", "")].append(index)
+            self._index = _Index(version, entries, dict(by_gram), dict(by_key), dict(by_initials), dict(by_email_local))
+            self._stats["rebuilds"] += 1
+            return self._index
+
+    def match(self, query, limit=5):
+        """Candidats classés [(score, contact)], score dans [0, 1], au moins MIN_SCORE."""
+        snapshot = self._ensure_index()
+        self._stats["queries"] += 1
+        query_name = normalize(query)
+        if not query_name:
+            return []
+        entries, gram_sizes, key_sizes = snapshot.entries, snapshot.gram_sizes, snapshot.key_sizes
+        query_keys = {phonetic_key(word) for word in query_name.split()}
+        query_grams = trigrams(query_name)
+
+        # Filtrage par préfixe : un contact partageant au moins `threshold` trigrammes avec la requête en partage
+        # au moins `need` parmi les `prefix` plus rares. Seuls ces contacts sont comparés en entier.
+        n_grams = len(query_grams)
+        threshold = max(1, -(-n_grams * MIN_SHARED_GRAMS // 100))
+        by_gram = snapshot.by_gram
+        rarest = sorted((gram for gram in query_grams if gram in by_gram), key=lambda gram: len(by_gram[gram]))
+        prefix = min(len(rarest), len(rarest) - threshold + PREFIX_EXTRA_GRAMS)
+        need = threshold - (len(rarest) - prefix)
+        counts = collections.Counter()
+        for gram in rarest[:prefix]:
+            counts.update(by_gram[gram])
+        candidates = [index for index, count in counts.items() if count >= need] if need > 0 else []
+        scored = {}
+        for index in candidates:
+            count = len(query_grams & entries[index].grams)
+            if count >= threshold:
+                scored[index] = 2 * count / (n_grams + gram_sizes[index])
+
+        # Chaque mot de la requête retrouvé (phonétiquement) dans le nom : « filip » -> Jean-Philippe Martin.
+        # Une correspondance partielle n'apporte rien de plus que les trigrammes : seule l'intersection compte.
+        postings = sorted((snapshot.by_key.get(key, _EMPTY) for key in query_keys), key=len)
+        full_matches = postings[0].intersection(*postings[1:]) if postings else _EMPTY
+        n_keys = len(query_keys)
+        for index in full_matches:
+            scored[index] = max(scored.get(index, 0.0), 0.75 + 0.2 * n_keys / max(key_sizes[index], n_keys))
+
+        compact = query_name.replace(" ", "")
+        if len(compact) <= 4:
+            # « jp », « j p » : initiales (complètes, ou début des initiales)
+            for index, complete in snapshot.by_initials.get(compact, ()):
+                scored[index] = max(scored.get(index, 0.0), 0.7 if complete else 0.65)
+        for index in snapshot.by_email_local.get(compact, ()): # « jdupont » : partie locale de l'adresse
+            scored[index] = max(scored.get(index, 0.0), 0.9)
+
+        ranked = heapq.nlargest(limit, ((score, index) for index, score in scored.items() if score >= MIN_SCORE))
+        results = []
+        for score, index in ranked:
+            if entries[index].name == query_name:
+                score = 1.0
+            results.append((round(score, 3), dict(entries[index].contact)))
+        results.sort(key=lambda item: -item[0])
+        return results
+
+    def resolve(self, query):
+        """
+        (contact, candidats) : `contact` est le meilleur candidat s'il se détache nettement,
+        None sinon (aucun candidat, ou plusieurs candidats proches à faire confirmer).
+        """
+        candidates = self.match(query)
+        if not candidates:
+            return None, []
+        if candidates[0][0] >= 1.0 or len(candidates) == 1 or candidates[0][0] - candidates[1][0] >= AMBIGUITY_MARGIN:
+            return candidates[0][1], candidates
+        return None, candidates
+
+    def stats(self):
+        stats = dict(self._stats)
+        stats["indexed"] = len(self._index.entries)
+        return stats
@@ -0,0 +1,182 @@
+# contact_store.py
+"""
+Carnet d'adresses local (contacts.json), partagé entre les threads WebSocket.
+
+Les contacts sont gardés en mémoire avec deux index : nom normalisé -> contact et
+adresse e-mail -> contact, pour des recherches en O(1) dans les deux sens. Toute
+modification est faite sous verrou puis écrite de façon atomique (fichier temporaire
++ os.replace) : un crash pendant l'écriture ne corrompt jamais le fichier, et il n'est
+plus nécessaire de le relire après chaque sauvegarde. Le format du fichier est inchangé :
+{"nom normalisé": {"display_name": ..., "email": ...}}.
+"""
+import os
+import re
+import copy
+import json
+import tempfile
+import threading
+
+EMAIL_RE = re.compile(r"[^@]+@[^@]+\.[^@]+")
+
+
+def normalize_name(name):
+    return " ".join((name or "").split()).lower()
+
+
+def normalize_email(email):
+    return (email or "").strip().casefold()
+
+
+class ContactStore:
+
+    def __init__(self, path):
+        self.path = path
+        self._contacts = {} # nom normalisé -> contact
+        self._by_email = {} # e-mail normalisé -> nom normalisé
+        self._lock = threading.RLock()
+        self._stats = {"saves": 0, "lookups": 0}
+        self.version = 0 # Incrémenté à chaque changement : les index dérivés (contact_matcher) se reconstruisent
+
+    # --- Persistance ---
+    def load(self):
+        """Charge le fichier (créé vide s'il n'existe pas). Un fichier illisible donne un carnet vide."""
+        with self._lock:
+            contacts = {}
+            try:
+                if not os.path.exists(self.path):
+                    self._write({})
+                else:
+                    with open(self.path, 'r', encoding='utf-8') as f:
+                        content = f.read()
+                    loaded = json.loads(content) if content.strip() else {}
+                    if isinstance(loaded, dict):
+                        contacts = loaded
+                    else:
+                        print(f"AVERTISSEMENT [contact_store]: Contenu de {self.path} n'est pas un dictionnaire JSON. Reçu: {type(loaded)}. Initialisation vide.")
+            except json.JSONDecodeError as e:
+                print(f"ERREUR [contact_store]: Décodage JSON échoué pour {self.path}: {e}. Carnet réinitialisé.")
+            self._contacts = {}
+            self._by_email = {}
+            for key, contact in contacts.items():
+                if isinstance(contact, dict) and contact.get("email"):
+                    self._index(normalize_name(key), contact)
+            self.version += 1
+            return self
+
+    def _write(self, data):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".contacts-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=4, ensure_ascii=False)
+            os.replace(tmp_path, self.path) # Atomique : jamais de fichier à moitié écrit
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _commit(self, previous):
+        """Écrit le carnet ; en cas d'échec, l'état mémoire `previous` est restauré et l'erreur relevée."""
+        try:
+            self._write(self._contacts)
+            self._stats["saves"] += 1
+        except Exception:
+            self._contacts, self._by_email = previous
+            raise
+        self.version += 1
+
+    # --- Index ---
+    def _index(self, key, contact):
+        self._unindex(key)
+        self._contacts[key] = contact
+        self._by_email[normalize_email(contact["email"])] = key
+
+    def _unindex(self, key):
+        previous = self._contacts.pop(key, None)
+        if previous is not None:
+            email_key = normalize_email(previous.get("email"))
+            if self._by_email.get(email_key) == key:
+                del self._by_email[email_key]
+        return previous
+
+    def _snapshot(self):
+        return dict(self._contacts), dict(self._by_email)
+
+    # --- Écritures ---
+    def add(self, name, email):
+        """Ajoute ou remplace un contact et l'écrit sur disque. Peut lever OSError ; retourne le contact."""
+        key = normalize_name(name)
+        contact = {"display_name": name.strip(), "email": email.strip()}
+        with self._lock:
+            previous = self._snapshot()
+            self._index(key, contact)
+            self._commit(previous)
+        return dict(contact)
+
+    def remove(self, name):
+        """Supprime un contact et l'écrit sur disque. Retourne le contact supprimé, ou None. Peut lever OSError."""
+        with self._lock:
+            previous = self._snapshot()
+            removed = self._unindex(normalize_name(name))
+            if removed is None:
+                return None
+            self._commit(previous)
+        return removed
+
+    def bulk_update(self, upserts=(), removals=(), replace=None):
+        """
+        Applique un lot de modifications avec un seul enregistrement sur disque (tout ou rien).
+        `upserts` : contacts {"display_name", "email", ...champs libres} ; `removals` : noms à supprimer.
+        `replace(existant, nouveau)` décide si un contact existant du même nom est remplacé (défaut : oui).
+        Retourne les compteurs {"added", "updated", "unchanged", "skipped", "removed"}. Peut lever OSError.
+        """
+        counts = {"added": 0, "updated": 0, "unchanged": 0, "skipped": 0, "removed": 0}
+        with self._lock:
+            previous = self._snapshot()
+            for name in removals:
+                if self._unindex(normalize_name(name)) is not None:
+                    counts["removed"] += 1
+            for contact in upserts:
+                key = normalize_name(contact["display_name"])
+                existing = self._contacts.get(key)
+                if existing is None:
+                    counts["added"] += 1
+                elif existing == contact:
+                    counts["unchanged"] += 1
+                    continue
+                elif replace is not None and not replace(existing, contact):
+                    counts["skipped"] += 1
+                    continue
+                else:
+                    counts["updated"] += 1
+                self._index(key, dict(contact))
+            if counts["added"] or counts["updated"] or counts["removed"]:
+                self._commit(previous)
+        return counts
+
+    # --- Lectures ---
+    def get(self, name):
+        with self._lock:
+            self._stats["lookups"] += 1
+            contact = self._contacts.get(normalize_name(name))
+            return dict(contact) if contact is not None else None
+
+    def get_by_email(self, email):
+        with self._lock:
+            self._stats["lookups"] += 1
+            key = self._by_email.get(normalize_email(email))
+            return dict(self._contacts[key]) if key is not None else None
+
+    def all(self):
+        """Copie de tous les contacts, dans l'ordre d'insertion."""
+        with self._lock:
+            return copy.deepcopy(list(self._contacts.values()))
+
+    def __len__(self):
+        return len(self._contacts)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["contacts"] = len(self._contacts)
+        return stats
@@ -0,0 +1,169 @@
+# email_body.py
+"""
+Extraction du texte d'un message Gmail (payload de l'API au format 'full').
+
+Parcours itératif de l'arbre MIME : la partie text/plain est préférée à text/html
+(multipart/alternative), les pièces jointes sont ignorées et seule la partie retenue est
+décodée. Le décodage base64 et la conversion HTML -> texte se font par blocs et s'arrêtent
+dès que le budget de caractères est atteint : une newsletter de plusieurs centaines de Ko ne
+coûte que le début de son contenu. Les corps décodés sont mis en cache par identifiant de message.
+"""
+import os
+import re
+import base64
+import codecs
+import threading
+import collections
+from html.parser import HTMLParser
+
+MAX_BODY_CHARS = int(os.getenv("EMAIL_BODY_MAX_CHARS", "20000"))
+CACHE_SIZE = int(os.getenv("EMAIL_BODY_CACHE_SIZE", "200"))
+_CHUNK_B64 = 16384 # Multiple de 4 : chaque bloc base64 se décode indépendamment
+
+_CHARSET_RE = re.compile(r'charset="?([\w.:-]+)"?', re.IGNORECASE)
+_SPACES_RE = re.compile(r"[ \t\r\f\v\xa0]+")
+_BLANK_LINES_RE = re.compile(r"\n\s*\n\s*\n+")
+_SPACE_AROUND_NEWLINE_RE = re.compile(r" *\n *")
+
+
+def _header(part, name):
+    name = name.lower()
+    for header in part.get("headers", []):
+        if header["name"].lower() == name:
+            return header["value"]
+    return ""
+
+
+def _is_attachment(part):
+    return bool(part.get("filename")) or _header(part, "Content-Disposition").lower().startswith("attachment")
+
+
+def select_text_part(payload):
+    """Retourne la partie à afficher : le premier text/plain, sinon le premier text/html (ordre du document)."""
+    first_html = None
+    stack = [payload]
+    while stack:
+        part = stack.pop()
+        mime_type = part.get("mimeType", "")
+        if part.get("parts"):
+            stack.extend(reversed(part["parts"])) # reversed : on dépile dans l'ordre du document
+            continue
+        if not part.get("body", {}).get("data") or _is_attachment(part):
+            continue
+        if mime_type == "text/plain":
+            return part
+        if mime_type == "text/html" and first_html is None:
+            first_html = part
+    return first_html
+
+
+def _decoded_chunks(part):
+    """Décode la partie par blocs (base64 URL-safe puis charset) ; générateur de str."""
+    match = _CHARSET_RE.search(_header(part, "Content-Type"))
+    charset = match.group(1) if match else "utf-8"
+    try:
+        decoder = codecs.getincrementaldecoder(charset)(errors="replace")
+    except LookupError:
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    data = part["body"]["data"]
+    for start in range(0, len(data), _CHUNK_B64):
+        chunk = data[start:start + _CHUNK_B64]
+        final = start + _CHUNK_B64 >= len(data)
+        if final:
+            chunk += "=" * (-len(chunk) % 4) # Gmail omet parfois le remplissage
+        yield decoder.decode(base64.urlsafe_b64decode(chunk), final=final)
+
+
+class _HTMLTextExtractor(HTMLParser):
+    SKIPPED = {"style", "script", "head", "title", "noscript", "template"}
+    BLOCKS = {"p", "div", "br", "li", "tr", "h1", "h2", "h3", "h4", "h5", "h6", "table", "blockquote", "hr", "section", "article"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.length = 0
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIPPED:
+            self._skip_depth += 1
+        elif tag in self.BLOCKS:
+            self.parts.append("\n")
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in self.BLOCKS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIPPED:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in self.BLOCKS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self.parts.append(data)
+            self.length += len(data)
+
+
+def _clean(text):
+    text = _SPACES_RE.sub(" ", text)
+    text = _SPACE_AROUND_NEWLINE_RE.sub("\n", text)
+    return _BLANK_LINES_RE.sub("\n\n", text).strip()
+
+
+def extract_text(payload, max_chars=MAX_BODY_CHARS):
+    """Texte du message (au plus ~max_chars caractères), ou None si aucune partie texte."""
+    part = select_text_part(payload or {})
+    if part is None:
+        return None
+    if part.get("mimeType") == "text/plain":
+        collected, length = [], 0
+        for chunk in _decoded_chunks(part):
+            collected.append(chunk)
+            length += len(chunk)
+            if length >= max_chars:
+                break
+        return _clean("".join(collected)[:max_chars])
+
+    parser = _HTMLTextExtractor()
+    for chunk in _decoded_chunks(part):
+        parser.feed(chunk)
+        if parser.length >= max_chars:
+            break # Le reste du document n'est ni décodé ni analysé
+    return _clean("".join(parser.parts))[:max_chars]
+
+
+class BodyCache:
+    """Cache LRU des messages déjà décodés, indexé par identifiant de message Gmail."""
+
+    def __init__(self, max_entries=CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, message_id):
+        with self._lock:
+            value = self._entries.get(message_id)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(message_id)
+            self.hits += 1
+            return value
+
+    def put(self, message_id, value):
+        with self._lock:
+            self._entries[message_id] = value
+            self._entries.move_to_end(message_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+cache = BodyCache()
@@ -0,0 +1,115 @@
+# freebusy.py
+"""
+Disponibilités sur l'ensemble des agendas de l'utilisateur.
+
+Une seule requête `freebusy.query` couvre tous les agendas (liste mise en cache) sur une
+fenêtre de temps ; les plages occupées sont fusionnées, ce qui permet de répondre à
+« suis-je libre jeudi après-midi ? », de proposer des créneaux libres, et de détecter un
+conflit avant la création d'un événement pour le prix d'un seul appel.
+"""
+import os
+import time
+import datetime
+import threading
+
+from calendar_store import PARIS_TZ, to_aware
+
+CALENDAR_LIST_TTL_S = float(os.getenv("CALENDAR_LIST_TTL_S", "3600"))
+MAX_CALENDARS_PER_QUERY = 50 # Limite de freebusy.query (calendarExpansionMax)
+WORKDAY_START_HOUR = int(os.getenv("WORKDAY_START_HOUR", "8"))
+WORKDAY_END_HOUR = int(os.getenv("WORKDAY_END_HOUR", "19"))
+
+
+def _parse_rfc3339(value):
+    return datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def merge_intervals(intervals):
+    """Fusionne des intervalles (début, fin) qui se chevauchent ou se touchent ; résultat trié."""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def free_slots(busy, window_start, window_end, min_duration=datetime.timedelta(minutes=30),
+               day_start_hour=WORKDAY_START_HOUR, day_end_hour=WORKDAY_END_HOUR):
+    """Créneaux libres d'au moins `min_duration` dans la fenêtre, limités aux heures ouvrées (heure de Paris)."""
+    slots = []
+    day = window_start.astimezone(PARIS_TZ).date()
+    last_day = window_end.astimezone(PARIS_TZ).date()
+    while day <= last_day:
+        day_start = max(window_start, datetime.datetime.combine(day, datetime.time(day_start_hour), PARIS_TZ))
+        day_end = min(window_end, datetime.datetime.combine(day, datetime.time(day_end_hour), PARIS_TZ))
+        cursor = day_start
+        for busy_start, busy_end in busy: # `busy` est trié et fusionné
+            if busy_end <= cursor:
+                continue
+            if busy_start >= day_end:
+                break
+            if busy_start - cursor >= min_duration:
+                slots.append((cursor, busy_start))
+            cursor = max(cursor, busy_end)
+        if day_end - cursor >= min_duration:
+            slots.append((cursor, day_end))
+        day += datetime.timedelta(days=1)
+    return slots
+
+
+class FreeBusy:
+    """`service_factory()` retourne un client Calendar, ou None sans autorisation."""
+
+    def __init__(self, service_factory):
+        self.service_factory = service_factory
+        self._calendar_ids = None
+        self._calendar_ids_time = 0.0
+        self._lock = threading.Lock()
+        self._stats = {"queries": 0, "calendar_list_refreshes": 0}
+
+    def calendar_ids(self, service):
+        """Agendas affichés par l'utilisateur (liste mise en cache CALENDAR_LIST_TTL_S secondes)."""
+        with self._lock:
+            if self._calendar_ids is None or time.monotonic() - self._calendar_ids_time > CALENDAR_LIST_TTL_S:
+                ids, page_token = [], None
+                while True:
+                    response = service.calendarList().list(pageToken=page_token).execute()
+                    ids.extend(item["id"] for item in response.get("items", []) if item.get("selected", item.get("primary", False)))
+                    page_token = response.get("nextPageToken")
+                    if not page_token:
+                        break
+                self._calendar_ids = ids or ["primary"]
+                self._calendar_ids_time = time.monotonic()
+                self._stats["calendar_list_refreshes"] += 1
+            return self._calendar_ids
+
+    def busy(self, start, end):
+        """Plages occupées fusionnées (datetimes Paris) entre `start` et `end`, tous agendas confondus."""
+        service = self.service_factory()
+        if service is None:
+            return None
+        start, end = to_aware(start), to_aware(end)
+        ids = self.calendar_ids(service)[:MAX_CALENDARS_PER_QUERY]
+        response = service.freebusy().query(body={
+            "timeMin": start.isoformat(), "timeMax": end.isoformat(),
+            "timeZone": "Europe/Paris", "items": [{"id": calendar_id} for calendar_id in ids],
+        }).execute()
+        self._stats["queries"] += 1
+        intervals = []
+        for calendar_id, calendar in response.get("calendars", {}).items():
+            if calendar.get("errors"):
+                print(f"AVERTISSEMENT [freebusy]: Agenda {calendar_id} ignoré: {calendar['errors']}")
+            for period in calendar.get("busy", []):
+                intervals.append((
+                    max(_parse_rfc3339(period["start"]).astimezone(PARIS_TZ), start),
+                    min(_parse_rfc3339(period["end"]).astimezone(PARIS_TZ), end),
+                ))
+        return merge_intervals(intervals)
+
+    def stats(self):
+        stats = dict(self._stats)
+        stats["calendars"] = len(self._calendar_ids) if self._calendar_ids is not None else None
+        return stats
@@ -0,0 +1,198 @@
+# french_datetime.py
+"""
+Analyse des dates et heures exprimées en français (« demain à 14h », « mardi prochain »,
+« le 25 décembre 2025 à 10h30 », « 12/03 », « ce soir », « dans 2 semaines »...).
+
+Un seul motif précompilé découpe la phrase en jetons en une passe ; une grammaire combine
+ensuite les jetons (jour + heure, moment de la journée, report à l'année suivante). Le résultat
+est mémorisé par (phrase normalisée, jour de référence) : les commandes d'agenda analysent
+souvent plusieurs fois la même expression. Les expressions relatives à l'heure courante
+(« dans 2 heures ») sont mémorisées sous forme de décalage et appliquées à chaque appel.
+"""
+import re
+import calendar
+import datetime
+import functools
+
+MONTHS = {
+    "janvier": 1, "février": 2, "fevrier": 2, "mars": 3, "avril": 4, "mai": 5, "juin": 6,
+    "juillet": 7, "août": 8, "aout": 8, "septembre": 9, "octobre": 10, "novembre": 11,
+    "décembre": 12, "decembre": 12,
+}
+WEEKDAYS = {"lundi": 0, "mardi": 1, "mercredi": 2, "jeudi": 3, "vendredi": 4, "samedi": 5, "dimanche": 6}
+PERIOD_HOURS = {"matin": 9, "midi": 12, "après-midi": 14, "apres-midi": 14, "soir": 20, "minuit": 0}
+# Plages (heure de début, heure de fin) désignées par un moment de la journée sans heure précise
+PERIOD_WINDOWS = {"matin": (8, 12), "midi": (12, 14), "après-midi": (14, 18), "apres-midi": (14, 18), "soir": (18, 22)}
+NUMBER_WORDS = {"un": 1, "une": 1, "deux": 2, "trois": 3, "quatre": 4, "cinq": 5}
+DEFAULT_HOUR = 9 # Heure retenue quand la phrase n'en précise pas
+
+_MONTH_ALT = "|".join(sorted(MONTHS, key=len, reverse=True))
+_WEEKDAY_ALT = "|".join(WEEKDAYS)
+_NUMBER_ALT = r"\d+|" + "|".join(NUMBER_WORDS)
+
+_TOKEN_RE = re.compile(rf"""
+    (?P<iso>\b(?P<iso_y>\d{{4}})-(?P<iso_m>\d{{1,2}})-(?P<iso_d>\d{{1,2}})\b)
+  | (?P<numdate>\b(?P<num_d>\d{{1,2}})[/.](?P<num_m>\d{{1,2}})(?:[/.](?P<num_y>\d{{4}}|\d{{2}}))?\b)
+  | (?P<relative>\bdans\s+(?P<rel_n>{_NUMBER_ALT})\s+(?P<rel_unit>semaines?|mois|jours?|heures?|minutes?)\b)
+  | (?P<daymonth>\b(?P<dm_d>\d{{1,2}})(?:er)?\s+(?P<dm_m>{_MONTH_ALT})\b(?:\s+(?:de\s+)?(?:l'année\s+)?(?P<dm_y>\d{{4}})\b)?)
+  | (?P<time>\b(?P<hour>\d{{1,2}})\s*(?:h|:)\s*(?P<minute>\d{{2}})?(?![a-z]))
+  | (?P<afterday>\baprès[- ]demain\b|\bapres[- ]demain\b)
+  | (?P<tomorrow>\bdemain\b)
+  | (?P<today>\baujourd'hui\b|\bce\s+jour\b)
+  | (?P<tonight>\bce\s+soir\b)
+  | (?P<weekday>\b(?P<wd>{_WEEKDAY_ALT})\b)
+  | (?P<period>\baprès-midi\b|\bapres-midi\b|\bmatin\b|\bmidi\b|\bsoir\b|\bminuit\b)
+  | (?P<next>\bprochaine?\b)
+""", re.VERBOSE | re.IGNORECASE)
+
+
+def _number(word):
+    return NUMBER_WORDS.get(word) or int(word)
+
+
+def _add_months(day, months):
+    month_index = day.month - 1 + months
+    year, month = day.year + month_index // 12, month_index % 12 + 1
+    return day.replace(year=year, month=month, day=min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def _full_year(year_str):
+    year = int(year_str)
+    return year + 2000 if year < 100 else year
+
+
+def _parse(text, today):
+    """
+    Retourne ("absolute", datetime), ("offset", timedelta) ou None.
+    Ne dépend que de la phrase normalisée et du jour de référence, d'où la mémorisation.
+    """
+    day = None # date retenue
+    year_given = False
+    hour = minute = None
+    period_hour = None
+    is_next = False
+    weekday = None
+
+    for match in _TOKEN_RE.finditer(text):
+        kind = match.lastgroup # Nom du groupe externe : les sous-groupes se ferment avant lui
+        if kind == "relative":
+            amount, unit = _number(match.group("rel_n").lower()), match.group("rel_unit").lower()
+            if unit.startswith("heure"):
+                return ("offset", datetime.timedelta(hours=amount))
+            if unit.startswith("minute"):
+                return ("offset", datetime.timedelta(minutes=amount))
+            if unit.startswith("semaine"):
+                day = today + datetime.timedelta(weeks=amount)
+            elif unit.startswith("jour"):
+                day = today + datetime.timedelta(days=amount)
+            else:
+                day = _add_months(today, amount)
+            year_given = True # Date déjà dans le futur : pas de report d'année
+        elif kind == "iso":
+            day = datetime.date(int(match.group("iso_y")), int(match.group("iso_m")), int(match.group("iso_d")))
+            year_given = True
+        elif kind == "numdate":
+            year_str = match.group("num_y")
+            year_given = year_str is not None
+            day = datetime.date(_full_year(year_str) if year_given else today.year, int(match.group("num_m")), int(match.group("num_d")))
+        elif kind == "daymonth":
+            year_str = match.group("dm_y")
+            year_given = year_str is not None
+            day = datetime.date(int(year_str) if year_given else today.year, MONTHS[match.group("dm_m").lower()], int(match.group("dm_d")))
+        elif kind == "time":
+            hour, minute = int(match.group("hour")), int(match.group("minute") or 0)
+        elif kind == "afterday":
+            day = today + datetime.timedelta(days=2)
+        elif kind == "tomorrow":
+            day = today + datetime.timedelta(days=1)
+        elif kind == "today":
+            day = today
+        elif kind == "tonight":
+            day, period_hour = today, PERIOD_HOURS["soir"]
+        elif kind == "weekday":
+            weekday = WEEKDAYS[match.group("wd").lower()]
+        elif kind == "period":
+            period_hour = PERIOD_HOURS[match.group(0).lower()]
+        elif kind == "next":
+            is_next = True
+
+    if day is None and weekday is not None:
+        # Prochaine occurrence de ce jour, aujourd'hui exclu (« mardi » dit un mardi = mardi suivant)
+        day = today + datetime.timedelta(days=(weekday - today.weekday() - 1) % 7 + 1)
+    if day is None:
+        if hour is None and period_hour is None:
+            return None
+        day = today # Heure seule (« à 15h », « ce midi ») : aujourd'hui
+
+    if hour is None:
+        hour, minute = (period_hour, 0) if period_hour is not None else (DEFAULT_HOUR, 0)
+    elif period_hour is not None and period_hour >= 12 and hour < 12:
+        hour += 12 # « 8h du soir »
+    if not (0 <= hour <= 23 and 0 <= minute <= 59):
+        return None
+
+    # Date passée sans année explicite : l'année suivante si « prochain » ou si le mois est passé
+    if not year_given and day < today and (is_next or day.month < today.month):
+        day = day.replace(year=day.year + 1, day=min(day.day, calendar.monthrange(day.year + 1, day.month)[1]))
+    return ("absolute", datetime.datetime.combine(day, datetime.time(hour, minute)))
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_cached(text, today):
+    try:
+        return _parse(text, today)
+    except ValueError: # Date impossible (31 février...) : l'échec est mémorisé lui aussi
+        return None
+
+
+def _normalize(text):
+    return " ".join(text.lower().replace("’", "'").split())
+
+
+@functools.lru_cache(maxsize=4096)
+def _components(text):
+    """{type de jeton: texte} des jetons reconnus dans la phrase normalisée."""
+    return {match.lastgroup: match.group(0) for match in _TOKEN_RE.finditer(text)}
+
+
+def is_time_only(text):
+    """True si la phrase ne donne qu'une heure (« 18h », « à 18h30 du soir »), sans jour."""
+    components = _components(_normalize(text or ""))
+    return "time" in components and set(components) <= {"time", "period"}
+
+
+def is_date_only(text):
+    """True si la phrase désigne un jour sans heure ni moment de la journée (« jeudi », « le 12 mars »)."""
+    components = _components(_normalize(text or ""))
+    if components.keys() & {"time", "period", "tonight"}:
+        return False
+    return not re.search(r"heure|minute", components.get("relative", "")) # « dans 2 heures » désigne un instant
+
+
+def period_window(text):
+    """(heure de début, heure de fin) du moment de la journée cité sans heure précise (« jeudi après-midi »), sinon None."""
+    components = _components(_normalize(text or ""))
+    if "time" in components:
+        return None
+    if "tonight" in components:
+        return PERIOD_WINDOWS["soir"]
+    return PERIOD_WINDOWS.get(components.get("period", ""))
+
+
+def parse_french_datetime(text, now=None):
+    """Datetime naïf (heure locale) décrit par `text`, ou None si la phrase n'est pas comprise."""
+    if not text:
+        return None
+    now = now or datetime.datetime.now()
+    normalized = _normalize(text)
+    result = _parse_cached(normalized, now.date())
+    if result is None:
+        return None
+    kind, value = result
+    if kind == "offset":
+        return (now + value).replace(second=0, microsecond=0)
+    return value
+
+
+def stats():
+    return _parse_cached.cache_info()._asdict()
@@ -0,0 +1,39 @@
+# french_text.py
+"""
+Normalisation de texte français pour l'indexation et la recherche.
+
+Passage en minuscules, suppression des accents, des élisions (l', d', qu'...) et
+racinisation légère (pluriels) : « Les réunions d'équipe » et « reunion equipe »
+produisent les mêmes termes.
+"""
+import re
+import unicodedata
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_ELISION_RE = re.compile(r"\b(?:l|d|j|m|n|s|t|c|qu|jusqu|lorsqu|puisqu)['’]", re.IGNORECASE)
+
+
+def fold_accents(text):
+    """'Réunion à Noël' -> 'reunion a noel'."""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def stem(token):
+    """Racinisation légère : retire les marques de pluriel les plus courantes."""
+    if len(token) > 4 and token.endswith("aux"):
+        return token[:-3] + "al" # journaux -> journal
+    if len(token) > 3 and token[-1] in "sx":
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    """Termes normalisés d'un texte, dans l'ordre."""
+    if not text:
+        return []
+    return [stem(token) for token in _TOKEN_RE.findall(fold_accents(_ELISION_RE.sub(" ", text)))]
+
+
+def normalize(text):
+    return " ".join(tokenize(text))
@@ -0,0 +1,40 @@
+# gmail_batch.py
+"""
+Récupération groupée de messages Gmail.
+
+Au lieu d'un appel `messages.get` par message (N+1 allers-retours), les requêtes sont
+regroupées dans des requêtes batch HTTP de Gmail : une liste de 10 e-mails ne coûte plus qu'un
+seul aller-retour. Utilisé par main.py et auto_reply.py.
+"""
+import google_batch
+
+
+def fetch_messages(service, message_ids, format="metadata", metadata_headers=None, user_id="me"):
+    """
+    Retourne les messages dans l'ordre des identifiants fournis. Un message introuvable vaut None ;
+    les erreurs transitoires (quota, 5xx) sont réessayées une fois dans un batch suivant.
+    Une erreur d'authentification (401) est relevée telle quelle pour que l'appelant invalide le jeton.
+    """
+    message_ids = list(message_ids)
+
+    def request_factory(message_id):
+        kwargs = {"userId": user_id, "id": message_id, "format": format}
+        if metadata_headers and format == "metadata":
+            kwargs["metadataHeaders"] = metadata_headers
+        return lambda: service.users().messages().get(**kwargs)
+
+    # Les request_id d'un batch doivent être uniques
+    factories = {message_id: request_factory(message_id) for message_id in dict.fromkeys(message_ids)}
+    results, errors = google_batch.execute(service, factories)
+    for message_id, exception in errors.items():
+        print(f"AVERTISSEMENT [gmail_batch]: Message {message_id} non récupéré: {exception}")
+    return [results.get(message_id) for message_id in message_ids]
+
+
+def get_header(message, name, default=None):
+    """Valeur d'un en-tête (insensible à la casse) d'un message renvoyé par l'API."""
+    name = name.lower()
+    for header in message.get("payload", {}).get("headers", []):
+        if header["name"].lower() == name:
+            return header["value"]
+    return default
@@ -0,0 +1,392 @@
+# gmail_mirror.py
+"""
+Miroir local (SQLite) des métadonnées Gmail.
+
+Un thread de synchronisation amorce le miroir une seule fois (les messages les plus récents et
+tous les non lus), puis le fait avancer avec `users.history.list` à partir du dernier historyId
+connu : seuls les messages nouveaux ou modifiés coûtent des appels à l'API. Les questions sur les e-mails sont
+ensuite résolues localement en quelques millisecondes. Si l'historyId est trop ancien
+(404), le miroir est réamorcé. `is_complete()` indique si le miroir contient tous les messages
+pouvant répondre à une requête ; sinon l'appelant interroge l'API en ligne.
+
+Un index plein texte (FTS5) couvre les sujets et, au fil des synchronisations de fond, les corps
+décodés des messages. Les textes sont normalisés pour le français (accents, élisions, pluriels)
+avant indexation, et les résultats sont classés par pertinence (bm25).
+"""
+import os
+import time
+import sqlite3
+import threading
+from email.utils import parseaddr
+
+from googleapiclient.errors import HttpError
+
+import gmail_batch
+import french_text
+
+SYNC_INTERVAL_S = float(os.getenv("GMAIL_MIRROR_SYNC_INTERVAL_S", "30"))
+MAX_STALENESS_S = float(os.getenv("GMAIL_MIRROR_MAX_STALENESS_S", "10")) # Au-delà, une requête déclenche une synchro
+BOOTSTRAP_MAX = int(os.getenv("GMAIL_MIRROR_BOOTSTRAP_MAX", "500"))
+UNREAD_BOOTSTRAP_MAX = 5000 # Non lus amorcés en plus des messages récents (auto_reply, list_emails)
+BODY_INDEX_BATCH = int(os.getenv("GMAIL_MIRROR_BODY_INDEX_BATCH", "50")) # Corps téléchargés par cycle de fond
+METADATA_HEADERS = ["From", "To", "Subject", "Date", "Message-ID"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id TEXT PRIMARY KEY,
+    thread_id TEXT,
+    internal_date INTEGER,
+    sender TEXT,
+    sender_email TEXT,
+    recipients TEXT,
+    subject TEXT,
+    date_header TEXT,
+    message_id_header TEXT,
+    snippet TEXT,
+    labels TEXT, -- ' INBOX UNREAD ' : espaces en bordure pour filtrer avec LIKE '% INBOX %'
+    body_indexed INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_messages_date ON messages (internal_date DESC);
+CREATE INDEX IF NOT EXISTS idx_messages_sender ON messages (sender_email, internal_date DESC);
+CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT);
+-- rowid = messages.rowid ; textes déjà normalisés par french_text
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5 (subject, body, tokenize = 'unicode61 remove_diacritics 2');
+"""
+MESSAGE_COLUMNS = (
+    "id", "thread_id", "internal_date", "sender", "sender_email", "recipients",
+    "subject", "date_header", "message_id_header", "snippet", "labels",
+)
+
+
+def _labels_column(label_ids):
+    return " " + " ".join(label_ids or []) + " "
+
+
+class GmailMirror:
+    """
+    `service_factory()` retourne un client Gmail (ou None sans autorisation) ;
+    `on_auth_error()` est appelé quand l'API répond 401 ;
+    `body_extractor(payload)` décode le corps d'un message complet pour l'index plein texte
+    (sans extracteur, seuls les sujets sont indexés).
+    """
+
+    def __init__(self, db_path, service_factory, on_auth_error=None, body_extractor=None, sync_interval_s=SYNC_INTERVAL_S):
+        self.db_path = db_path
+        self.service_factory = service_factory
+        self.on_auth_error = on_auth_error
+        self.body_extractor = body_extractor
+        self.sync_interval_s = sync_interval_s
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        if self._db.execute("SELECT name FROM sqlite_master WHERE name = 'messages'").fetchone():
+            columns = [row["name"] for row in self._db.execute("PRAGMA table_info(messages)")]
+            if "body_indexed" not in columns: # Base créée avant l'index plein texte
+                self._db.execute("ALTER TABLE messages ADD COLUMN body_indexed INTEGER DEFAULT 0")
+        self._db.executescript(SCHEMA)
+        with self._db:
+            if self._db.execute("SELECT 1 FROM state WHERE key = 'history_id'").fetchone() and \
+                    not self._db.execute("SELECT 1 FROM state WHERE key = 'covered_since'").fetchone():
+                # Miroir amorcé avant le suivi de sa couverture : réamorcé à la prochaine synchro
+                self._db.execute("DELETE FROM state WHERE key = 'history_id'")
+        self._db_lock = threading.RLock() # Une connexion partagée : accès sérialisés
+        self._sync_lock = threading.Lock() # Une seule synchronisation à la fois
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._last_sync = 0.0
+        self._stats = {"bootstraps": 0, "syncs": 0, "sync_errors": 0, "messages_fetched": 0, "bodies_indexed": 0, "queries": 0, "searches": 0}
+
+    # --- Cycle de vie ---
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="gmail-mirror", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            if self.sync() and self.body_extractor:
+                self.index_bodies()
+            self._wakeup.wait(self.sync_interval_s)
+            self._wakeup.clear()
+
+    def request_sync(self):
+        """Demande une synchronisation anticipée au thread de fond (ex. après l'envoi d'un e-mail)."""
+        self._wakeup.set()
+
+    # --- État ---
+    def _get_state(self, key):
+        with self._db_lock:
+            row = self._db.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+
+    def _set_state(self, key, value):
+        self._db.execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def is_ready(self):
+        return self._get_state("history_id") is not None
+
+    def is_complete(self, label_ids=None, after=None, rows=None, limit=None):
+        """
+        True si le miroir contient tous les messages qui pourraient figurer dans la réponse :
+        boîte entière amorcée, période demandée (`after`) postérieure au début du miroir,
+        messages non lus (tous amorcés), ou `rows` : `limit` résultats classés par date, tous
+        postérieurs au début du miroir (un message plus ancien ne pourrait pas les déplacer).
+        """
+        covered_since = self._get_state("covered_since")
+        if covered_since is None:
+            return False
+        covered_since = int(covered_since)
+        if covered_since == 0:
+            return True
+        if after is not None and after.timestamp() * 1000 >= covered_since:
+            return True
+        if label_ids and "UNREAD" in label_ids and self._get_state("unread_complete") == "1":
+            return True
+        return bool(rows is not None and limit and len(rows) >= limit and min(row["internal_date"] for row in rows) >= covered_since)
+
+    def ensure_fresh(self, max_staleness_s=MAX_STALENESS_S):
+        """Synchronise en ligne si la dernière synchro date de plus de `max_staleness_s` (un appel history.list)."""
+        if time.monotonic() - self._last_sync > max_staleness_s:
+            self.sync()
+
+    # --- Synchronisation ---
+    def sync(self):
+        with self._sync_lock:
+            try:
+                service = self.service_factory()
+                if service is None:
+                    return False # Pas encore d'autorisation Google
+                history_id = self._get_state("history_id")
+                if history_id is None:
+                    self._bootstrap(service)
+                else:
+                    try:
+                        self._sync_history(service, history_id)
+                    except HttpError as error:
+                        if error.resp.status != 404:
+                            raise
+                        # historyId trop ancien (Gmail ne conserve l'historique que quelques jours)
+                        print("INFO [gmail_mirror]: historyId expiré, réamorçage du miroir.")
+                        self._bootstrap(service)
+                self._last_sync = time.monotonic()
+                return True
+            except HttpError as error:
+                self._stats["sync_errors"] += 1
+                if error.resp.status == 401 and self.on_auth_error:
+                    self.on_auth_error()
+                else:
+                    print(f"ERREUR [gmail_mirror]: Synchronisation impossible: {error}")
+            except Exception as e:
+                self._stats["sync_errors"] += 1
+                print(f"ERREUR [gmail_mirror]: Synchronisation impossible: {type(e).__name__} - {e}")
+            return False
+
+    def _bootstrap(self, service):
+        # historyId relevé AVANT le listage : aucun changement ne peut passer entre les deux
+        history_id = service.users().getProfile(userId="me").execute()["historyId"]
+        recent_ids, recent_complete = self._list_ids(service, BOOTSTRAP_MAX)
+        unread_ids, unread_complete = self._list_ids(service, UNREAD_BOOTSTRAP_MAX, labelIds=["UNREAD"])
+        message_ids = list(dict.fromkeys(recent_ids + unread_ids))
+        messages = [m for m in gmail_batch.fetch_messages(service, message_ids, metadata_headers=METADATA_HEADERS) if m]
+        # Début de la couverture complète : date du plus ancien message récent amorcé (0 : boîte entière)
+        recent = set(recent_ids)
+        covered_since = 0 if recent_complete else min(
+            (int(m.get("internalDate", 0)) for m in messages if m["id"] in recent), default=0)
+        with self._db_lock, self._db:
+            self._db.execute("DELETE FROM messages")
+            self._db.execute("DELETE FROM messages_fts")
+            self._store(messages)
+            self._set_state("history_id", history_id)
+            self._set_state("covered_since", covered_since)
+            self._set_state("unread_complete", int(unread_complete))
+        self._stats["bootstraps"] += 1
+        self._stats["messages_fetched"] += len(messages)
+        print(f"INFO [gmail_mirror]: Miroir amorcé avec {len(messages)} message(s){'' if recent_complete else ' (boîte partielle)'}.")
+
+    def _list_ids(self, service, max_ids, **params):
+        """(ids, complet) : au plus `max_ids` messages, du plus récent au plus ancien."""
+        message_ids, page_token = [], None
+        while len(message_ids) < max_ids:
+            response = service.users().messages().list(
+                userId="me", maxResults=min(500, max_ids - len(message_ids)), pageToken=page_token, **params
+            ).execute()
+            message_ids.extend(m["id"] for m in response.get("messages", []))
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                return message_ids, True
+        return message_ids, False
+
+    def _sync_history(self, service, history_id):
+        added, deleted, labels = [], set(), {}
+        page_token, latest_history_id = None, history_id
+        while True:
+            response = service.users().history().list(
+                userId="me", startHistoryId=history_id, pageToken=page_token,
+                historyTypes=["messageAdded", "messageDeleted", "labelAdded", "labelRemoved"],
+            ).execute()
+            for record in response.get("history", []):
+                for item in record.get("messagesAdded", []):
+                    added.append(item["message"]["id"])
+                for item in record.get("messagesDeleted", []):
+                    deleted.add(item["message"]["id"])
+                for item in record.get("labelsAdded", []) + record.get("labelsRemoved", []):
+                    # Chaque enregistrement porte la liste complète des libellés après le changement
+                    labels[item["message"]["id"]] = item["message"].get("labelIds", [])
+            latest_history_id = response.get("historyId", latest_history_id)
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                break
+
+        # Un message hors du miroir qui change de libellés (ancien message remis en non lu) y entre aussi
+        with self._db_lock:
+            known = {row["id"] for row in self._db.execute(
+                f"SELECT id FROM messages WHERE id IN ({', '.join('?' for _ in labels)})", list(labels))} if labels else set()
+        added.extend(message_id for message_id in labels if message_id not in known)
+        added = [message_id for message_id in dict.fromkeys(added) if message_id not in deleted]
+        messages = [m for m in gmail_batch.fetch_messages(service, added, metadata_headers=METADATA_HEADERS) if m]
+        with self._db_lock, self._db:
+            self._store(messages)
+            fetched = {m["id"] for m in messages}
+            self._db.executemany(
+                "UPDATE messages SET labels = ? WHERE id = ?",
+                [(_labels_column(label_ids), message_id) for message_id, label_ids in labels.items() if message_id not in fetched],
+            )
+            deleted_rows = [(message_id,) for message_id in deleted]
+            self._db.executemany("DELETE FROM messages_fts WHERE rowid IN (SELECT rowid FROM messages WHERE id = ?)", deleted_rows)
+            self._db.executemany("DELETE FROM messages WHERE id = ?", deleted_rows)
+            self._set_state("history_id", latest_history_id)
+        self._stats["syncs"] += 1
+        self._stats["messages_fetched"] += len(messages)
+
+    def _store(self, messages):
+        # UPSERT plutôt que REPLACE : le rowid reste stable et sert de clé à l'index plein texte
+        upsert = (
+            f"INSERT INTO messages ({', '.join(MESSAGE_COLUMNS)}, body_indexed) VALUES ({', '.join('?' for _ in MESSAGE_COLUMNS)}, 0) "
+            f"ON CONFLICT(id) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in MESSAGE_COLUMNS[1:])}, body_indexed = 0"
+        )
+        for msg in messages:
+            sender = gmail_batch.get_header(msg, "From", "")
+            subject = gmail_batch.get_header(msg, "Subject", "")
+            self._db.execute(upsert, (
+                msg["id"], msg.get("threadId"), int(msg.get("internalDate", 0)),
+                sender, parseaddr(sender)[1].lower(), gmail_batch.get_header(msg, "To", ""),
+                subject, gmail_batch.get_header(msg, "Date"),
+                gmail_batch.get_header(msg, "Message-ID"), msg.get("snippet", ""),
+                _labels_column(msg.get("labelIds")),
+            ))
+            rowid = self._db.execute("SELECT rowid FROM messages WHERE id = ?", (msg["id"],)).fetchone()[0]
+            # Le corps est indexé plus tard par index_bodies() ; l'extrait sert en attendant
+            self._db.execute(
+                "INSERT OR REPLACE INTO messages_fts (rowid, subject, body) VALUES (?, ?, ?)",
+                (rowid, french_text.normalize(subject), french_text.normalize(msg.get("snippet", ""))),
+            )
+
+    def index_bodies(self, batch_size=BODY_INDEX_BATCH):
+        """Télécharge et indexe les corps d'un lot de messages récents pas encore indexés."""
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT rowid, id, snippet FROM messages WHERE body_indexed = 0 ORDER BY internal_date DESC LIMIT ?", (batch_size,)
+            ).fetchall()
+        if not rows:
+            return 0
+        try:
+            service = self.service_factory()
+            if service is None:
+                return 0
+            fetched = gmail_batch.fetch_messages(service, [row["id"] for row in rows], format="full")
+        except Exception as e:
+            print(f"ERREUR [gmail_mirror]: Indexation des corps impossible: {type(e).__name__} - {e}")
+            return 0
+        updates = []
+        for row, msg in zip(rows, fetched):
+            body = ""
+            if msg is not None:
+                try:
+                    body = self.body_extractor(msg.get("payload", {})) or ""
+                except Exception as e:
+                    print(f"AVERTISSEMENT [gmail_mirror]: Corps du message {row['id']} illisible: {e}")
+            updates.append((french_text.normalize(body or row["snippet"]), row["rowid"]))
+        with self._db_lock, self._db:
+            self._db.executemany("UPDATE messages_fts SET body = ? WHERE rowid = ?", updates)
+            self._db.executemany("UPDATE messages SET body_indexed = 1 WHERE rowid = ?", [(rowid,) for _, rowid in updates])
+        self._stats["bodies_indexed"] += len(updates)
+        return len(updates)
+
+    # --- Requêtes locales ---
+    def list_messages(self, label_ids=None, senders=None, subject_words=None, limit=10, exclude_labels=("SPAM", "TRASH")):
+        """
+        Messages les plus récents portant tous les libellés donnés, filtrés par expéditeur / mots du sujet.
+        Les messages portant un des `exclude_labels` sont ignorés (par défaut spam et corbeille, comme la recherche Gmail).
+        """
+        clauses, params = [], []
+        for label in label_ids or ():
+            clauses.append("labels LIKE ?")
+            params.append(f"% {label} %")
+        for label in exclude_labels or ():
+            clauses.append("labels NOT LIKE ?")
+            params.append(f"% {label} %")
+        if senders:
+            clauses.append(f"sender_email IN ({', '.join('?' for _ in senders)})")
+            params.extend(sender.lower() for sender in senders)
+        for word in subject_words or ():
+            clauses.append("subject LIKE ?") # LIKE est insensible à la casse pour l'ASCII
+            params.append(f"%{word}%")
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._db_lock:
+            rows = self._db.execute(
+                f"SELECT * FROM messages {where} ORDER BY internal_date DESC LIMIT ?", (*params, int(limit))
+            ).fetchall()
+        self._stats["queries"] += 1
+        return [dict(row) for row in rows]
+
+    def search(self, text=None, subject_text=None, senders=None, after=None, before=None, label_ids=None, limit=10, by_date=False):
+        """
+        Recherche plein texte classée par pertinence (bm25, le sujet pèse plus que le corps), puis par date.
+        `text` porte sur le sujet et le corps, `subject_text` sur le sujet seul ; `after` / `before`
+        sont des datetime (bornes sur la date de réception). Sans termes, ou avec `by_date`, les
+        messages trouvés sont renvoyés du plus récent au plus ancien.
+        """
+        clauses, params = [], []
+        # Chaque terme en préfixe ("factur"* couvre facture / factures / facturation)
+        terms = [f'"{term}"*' for term in french_text.tokenize(text or "")]
+        subject_terms = [f'"{term}"*' for term in french_text.tokenize(subject_text or "")]
+        if subject_terms:
+            terms.append(f"subject : ({' AND '.join(subject_terms)})")
+        if terms:
+            clauses.append("messages_fts MATCH ?")
+            params.append(" AND ".join(terms))
+        for label in label_ids or ():
+            clauses.append("m.labels LIKE ?")
+            params.append(f"% {label} %")
+        if senders:
+            clauses.append(f"m.sender_email IN ({', '.join('?' for _ in senders)})")
+            params.extend(sender.lower() for sender in senders)
+        if after is not None:
+            clauses.append("m.internal_date >= ?")
+            params.append(int(after.timestamp() * 1000))
+        if before is not None:
+            clauses.append("m.internal_date < ?")
+            params.append(int(before.timestamp() * 1000))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        order = "bm25(messages_fts, 4.0, 1.0), m.internal_date DESC" if terms and not by_date else "m.internal_date DESC"
+        with self._db_lock:
+            rows = self._db.execute(
+                f"SELECT m.* FROM messages_fts JOIN messages m ON m.rowid = messages_fts.rowid {where} ORDER BY {order} LIMIT ?",
+                (*params, int(limit)),
+            ).fetchall()
+        self._stats["searches"] += 1
+        return [dict(row) for row in rows]
+
+    def stats(self):
+        with self._db_lock:
+            count = self._db.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+            indexed = self._db.execute("SELECT COUNT(*) FROM messages WHERE body_indexed = 1").fetchone()[0]
+        stats = dict(self._stats)
+        stats["messages"] = count
+        stats["bodies_in_index"] = indexed
+        stats["history_id"] = self._get_state("history_id")
+        stats["covered_since"] = self._get_state("covered_since")
+        stats["unread_complete"] = self._get_state("unread_complete") == "1"
+        stats["seconds_since_sync"] = round(time.monotonic() - self._last_sync, 1) if self._last_sync else None
+        return stats
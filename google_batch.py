@@ -0,0 +1,72 @@
+# google_batch.py
+"""
+Exécution de requêtes Google API regroupées en requêtes batch HTTP.
+
+Les requêtes sont envoyées par paquets de BATCH_SIZE dans un seul aller-retour ; les erreurs
+transitoires (quota, 5xx) sont réessayées une fois dans un batch suivant, après une attente
+exponentielle (ou celle demandée par l'en-tête Retry-After, plafonnée). Utilisé par
+gmail_batch.py (lecture de messages) et main.py (création / complétion / suppression de tâches).
+"""
+import time
+
+from googleapiclient.errors import HttpError
+
+BATCH_SIZE = 50 # Les API Google acceptent 100 requêtes par batch mais limitent le débit au-delà de ~50
+RETRYABLE_STATUSES = (429, 500, 503)
+MAX_ATTEMPTS = 2
+BACKOFF_S = 1.0 # 1 s, 2 s, 4 s... avant chaque nouvel envoi
+MAX_RETRY_AFTER_S = 10.0 # Plafond de l'attente demandée par Retry-After
+
+
+def _retry_delay(attempt, exceptions):
+    """Attente avant le nouvel envoi : backoff exponentiel, ou le plus long Retry-After (en secondes) des erreurs."""
+    delay = BACKOFF_S * 2 ** attempt
+    for exception in exceptions:
+        retry_after = getattr(exception, "resp", None) and exception.resp.get("retry-after")
+        try:
+            delay = max(delay, min(float(retry_after), MAX_RETRY_AFTER_S))
+        except (TypeError, ValueError):
+            pass # Absent, ou date HTTP : le backoff suffit
+    return delay
+
+
+def execute(service, request_factories, batch_size=BATCH_SIZE):
+    """
+    `request_factories` : {request_id: fonction sans argument retournant la requête (HttpRequest)}.
+    Retourne (réponses, erreurs), deux dictionnaires indexés par request_id. Une erreur
+    d'authentification (401) est relevée telle quelle pour que l'appelant invalide le jeton.
+    """
+    results, errors = {}, {}
+    pending = list(request_factories)
+    for attempt in range(MAX_ATTEMPTS):
+        retry = {}
+        for start in range(0, len(pending), batch_size):
+            chunk = pending[start:start + batch_size]
+            chunk_errors = {}
+
+            def callback(request_id, response, exception):
+                if exception is None:
+                    results[request_id] = response
+                else:
+                    chunk_errors[request_id] = exception
+
+            batch = service.new_batch_http_request(callback=callback)
+            for request_id in chunk:
+                batch.add(request_factories[request_id](), request_id=request_id)
+            batch.execute()
+
+            for request_id, exception in chunk_errors.items():
+                status = exception.resp.status if isinstance(exception, HttpError) else None
+                if status == 401:
+                    # googleapiclient a déjà rafraîchi le jeton (PooledHttp.credentials) et renvoyé la
+                    # partie une fois : un 401 restant signifie une autorisation révoquée.
+                    raise exception
+                if status in RETRYABLE_STATUSES and attempt < MAX_ATTEMPTS - 1:
+                    retry[request_id] = exception
+                else:
+                    errors[request_id] = exception
+        if not retry:
+            break
+        time.sleep(_retry_delay(attempt, retry.values())) # Renvoyer aussitôt retomberait dans la même fenêtre de quota
+        pending = list(retry)
+    return results, errors
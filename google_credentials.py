@@ -0,0 +1,174 @@
+# google_credentials.py
+"""
+Gestion centralisée des identifiants OAuth Google.
+
+Les identifiants sont chargés une seule fois depuis le fichier pickle puis gardés en mémoire.
+Un minuteur les rafraîchit avant leur expiration, et le fichier n'est réécrit (de façon
+atomique : fichier temporaire puis renommage) que lorsque le jeton a réellement changé.
+Utilisé par main.py, auto_reply.py et les scripts de génération de jetons.
+"""
+import os
+import pickle
+import datetime
+import tempfile
+import threading
+
+from google.auth.transport.requests import Request
+
+REFRESH_MARGIN_S = int(os.getenv("GOOGLE_TOKEN_REFRESH_MARGIN_S", "300")) # Rafraîchir 5 min avant l'expiration
+RETRY_DELAY_S = 60 # Nouvel essai après un échec réseau du rafraîchissement anticipé
+
+
+def _utcnow():
+    # google-auth stocke `expiry` en UTC naïf
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+class CredentialManager:
+    """Identifiants d'un fichier de jetons, partagés par tous les threads du processus."""
+
+    def __init__(self, token_file, refresh_ahead=True, refresh_margin_s=REFRESH_MARGIN_S):
+        self.token_file = token_file
+        self.refresh_ahead = refresh_ahead
+        self.refresh_margin_s = refresh_margin_s
+        self._creds = None
+        self._loaded_mtime = None # mtime du fichier lu, pour recharger un jeton créé par un autre processus
+        self._saved_token = None
+        self._timer = None
+        self._lock = threading.RLock()
+        self._stats = {"loads": 0, "refreshes": 0, "refresh_errors": 0, "saves": 0, "invalidations": 0}
+
+    def get(self):
+        """Retourne des identifiants valides, ou None si l'utilisateur doit (ré)autoriser l'application."""
+        with self._lock:
+            if self._creds is None:
+                self._load()
+            creds = self._creds
+            if creds is None:
+                return None
+            if not creds.valid:
+                if not (creds.expired and creds.refresh_token):
+                    return None
+                if not self._refresh():
+                    return None
+            return self._creds
+
+    def set(self, creds):
+        """Enregistre de nouveaux identifiants (callback OAuth, script de génération)."""
+        with self._lock:
+            self._creds = creds
+            self._save()
+            self._schedule_refresh()
+
+    def invalidate(self):
+        """Oublie les identifiants révoqués et supprime le fichier : une nouvelle autorisation sera nécessaire."""
+        with self._lock:
+            self._cancel_timer()
+            self._creds = None
+            self._saved_token = None
+            self._stats["invalidations"] += 1
+            if os.path.exists(self.token_file):
+                os.remove(self.token_file)
+            self._loaded_mtime = None
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["authorized"] = self._creds is not None
+            stats["expiry"] = self._creds.expiry.isoformat() + "Z" if self._creds is not None and self._creds.expiry else None
+        return stats
+
+    # --- Interne ---
+    def _load(self):
+        try:
+            mtime = os.path.getmtime(self.token_file)
+        except OSError:
+            return
+        if mtime == self._loaded_mtime:
+            return # Fichier déjà lu et inutilisable : inutile de le désérialiser à chaque appel
+        self._loaded_mtime = mtime
+        try:
+            with open(self.token_file, 'rb') as token:
+                self._creds = pickle.load(token)
+        except Exception as e:
+            print(f"Erreur lors de la lecture de {self.token_file} : {e}")
+            self._creds = None
+            return
+        self._saved_token = self._creds.token
+        self._stats["loads"] += 1
+        self._schedule_refresh()
+
+    def _refresh(self):
+        try:
+            self._creds.refresh(Request())
+        except Exception as e:
+            print(f"Erreur lors du rafraîchissement des tokens ({self.token_file}): {e}. L'utilisateur devra se réauthentifier.")
+            self._stats["refresh_errors"] += 1
+            self.invalidate()
+            return False
+        self._stats["refreshes"] += 1
+        self._save()
+        self._schedule_refresh()
+        return True
+
+    def _save(self):
+        if self._creds is None or self._creds.token == self._saved_token:
+            return
+        directory = os.path.dirname(os.path.abspath(self.token_file))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".token-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as token_file:
+                pickle.dump(self._creds, token_file)
+            os.replace(tmp_path, self.token_file) # Atomique : jamais de fichier à moitié écrit
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._saved_token = self._creds.token
+        self._loaded_mtime = os.path.getmtime(self.token_file)
+        self._stats["saves"] += 1
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _schedule_refresh(self, delay=None):
+        self._cancel_timer()
+        creds = self._creds
+        if not self.refresh_ahead or creds is None or not creds.refresh_token or not creds.expiry:
+            return
+        if delay is None:
+            delay = (creds.expiry - _utcnow()).total_seconds() - self.refresh_margin_s
+        self._timer = threading.Timer(max(delay, 0), self._refresh_ahead)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _refresh_ahead(self):
+        with self._lock:
+            if self._creds is None:
+                return
+            try:
+                self._creds.refresh(Request())
+            except Exception as e:
+                # Une erreur réseau ne signifie pas une révocation : on réessaie plus tard,
+                # et get() tranchera si le jeton finit par expirer.
+                print(f"AVERTISSEMENT: Rafraîchissement anticipé des tokens impossible ({self.token_file}): {e}")
+                self._stats["refresh_errors"] += 1
+                self._schedule_refresh(delay=RETRY_DELAY_S)
+                return
+            self._stats["refreshes"] += 1
+            self._save()
+            self._schedule_refresh()
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+def get_manager(token_file, refresh_ahead=True):
+    """Retourne le gestionnaire unique associé à un fichier de jetons."""
+    key = os.path.abspath(token_file)
+    with _managers_lock:
+        if key not in _managers:
+            _managers[key] = CredentialManager(token_file, refresh_ahead=refresh_ahead)
+        return _managers[key]
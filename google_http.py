@@ -0,0 +1,86 @@
+# google_http.py
+"""
+Transport HTTP mutualisé pour les clients d'API Google.
+
+googleapiclient s'appuie par défaut sur httplib2, qui n'est pas sûr entre threads et ouvre une
+nouvelle connexion TLS pour chaque objet service. `PooledHttp` expose l'interface `request()`
+d'httplib2 attendue par googleapiclient, mais s'appuie sur une session `requests` autorisée
+(google-auth) avec un pool de connexions keep-alive partagé par tous les threads.
+"""
+import os
+import threading
+
+import httplib2
+import requests
+from requests.adapters import HTTPAdapter
+from google.auth.transport.requests import AuthorizedSession
+
+POOL_SIZE = int(os.getenv("GOOGLE_HTTP_POOL_SIZE", "10"))
+CONNECT_TIMEOUT_S = float(os.getenv("GOOGLE_HTTP_CONNECT_TIMEOUT_S", "5"))
+READ_TIMEOUT_S = float(os.getenv("GOOGLE_HTTP_READ_TIMEOUT_S", "30"))
+
+# En-têtes décrivant le corps brut : requests a déjà décompressé le contenu
+_STRIPPED_HEADERS = ("content-encoding", "content-length", "transfer-encoding")
+
+
+class PooledHttp:
+    """Objet compatible httplib2.Http, sûr entre threads, adossé à un pool de connexions."""
+
+    def __init__(self, credentials=None, pool_size=POOL_SIZE, timeout=(CONNECT_TIMEOUT_S, READ_TIMEOUT_S)):
+        self.session = AuthorizedSession(credentials) if credentials is not None else requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.timeout = timeout
+
+    @property
+    def credentials(self):
+        """
+        Identifiants google-auth de la session (None sans autorisation). googleapiclient les lit
+        (`http.credentials`) pour signer les parties d'un batch et rafraîchir le jeton quand
+        une partie répond 401, avant de la renvoyer dans un second batch.
+        """
+        return getattr(self.session, "credentials", None)
+
+    def request(self, uri, method="GET", body=None, headers=None, redirections=None, connection_type=None):
+        response = self.session.request(method, uri, data=body, headers=headers, timeout=self.timeout)
+        info = {key.lower(): value for key, value in response.headers.items() if key.lower() not in _STRIPPED_HEADERS}
+        info["status"] = str(response.status_code)
+        resp = httplib2.Response(info)
+        resp.reason = response.reason # httplib2.Response ne lit pas la raison dans le dict (« Ok » par défaut)
+        return resp, response.content
+
+    def close(self):
+        self.session.close()
+
+
+_transports = {} # id(credentials) -> (credentials, PooledHttp)
+_transports_lock = threading.Lock()
+
+
+def get_http(credentials=None):
+    """Retourne le transport partagé associé à ces identifiants (un pool par jeu d'identifiants)."""
+    key = id(credentials)
+    with _transports_lock:
+        cached = _transports.get(key)
+        if cached is not None and cached[0] is credentials:
+            return cached[1]
+        http = PooledHttp(credentials)
+        if credentials is not None:
+            # Après une réautorisation, les anciens identifiants ne servent plus : leur pool est
+            # abandonné (et non fermé, une requête en cours peut encore l'utiliser).
+            for old_key, (old_credentials, _) in list(_transports.items()):
+                if old_credentials is not None:
+                    del _transports[old_key]
+        _transports[key] = (credentials, http)
+        return http
+
+
+def stats():
+    with _transports_lock:
+        pools = [http.session.get_adapter("https://") for _, http in _transports.values()]
+        return {
+            "transports": len(_transports),
+            "pool_size": POOL_SIZE,
+            "open_pools": sum(len(adapter.poolmanager.pools) for adapter in pools),
+        }
@@ -0,0 +1,82 @@
+# google_services.py
+"""
+Registre des clients d'API Google.
+
+`build()` analyse un document de découverte volumineux (et peut le télécharger) à chaque
+appel. Ici chaque document est lu une seule fois depuis les documents statiques fournis avec
+google-api-python-client, puis les clients sont construits à partir du document déjà analysé
+et mis en cache. Les clients s'appuient sur le transport mutualisé de google_http (sûr entre
+threads, pool de connexions keep-alive) : une seule instance est partagée par tous les threads,
+reconstruite si les identifiants changent.
+"""
+import json
+import threading
+
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+
+import google_http
+
+_documents = {} # (api, version) -> document de découverte analysé, ou None si absent du paquet
+_documents_lock = threading.Lock()
+_services = {} # (api, version, clé d'API) -> (identifiants, client)
+_services_lock = threading.Lock()
+_stats = {"builds": 0, "cache_hits": 0, "static_documents": 0, "network_builds": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def _discovery_document(api, version):
+    key = (api, version)
+    with _documents_lock:
+        if key not in _documents:
+            raw = get_static_doc(api, version)
+            _documents[key] = json.loads(raw) if raw else None
+            if raw:
+                _count("static_documents")
+        return _documents[key]
+
+
+def get_service(api, version, credentials=None, developer_key=None):
+    """Retourne le client d'API partagé, construit une seule fois par identifiants."""
+    key = (api, version, developer_key)
+    with _services_lock:
+        cached = _services.get(key)
+        if cached is not None and cached[0] is credentials:
+            _count("cache_hits")
+            return cached[1]
+
+        http = google_http.get_http(credentials)
+        document = _discovery_document(api, version)
+        if document is not None:
+            service = build_from_document(document, http=http, developerKey=developer_key)
+        else:
+            # API absente des documents statiques : téléchargement, une fois par identifiants
+            service = build(api, version, http=http, developerKey=developer_key, cache_discovery=False)
+            _count("network_builds")
+        _count("builds")
+        _services[key] = (credentials, service)
+        return service
+
+
+def stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    with _documents_lock:
+        stats["documents"] = sorted(f"{api}/{version}" for api, version in _documents)
+    return stats
+
+
+def preload(apis):
+    """Analyse les documents de découverte en arrière-plan, avant la première requête."""
+    def target():
+        for api, version in apis:
+            try:
+                _discovery_document(api, version)
+            except Exception as e:
+                print(f"AVERTISSEMENT: Document de découverte {api}/{version} indisponible: {e}")
+    threading.Thread(target=target, name="google-discovery-preload", daemon=True).start()
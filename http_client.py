@@ -0,0 +1,126 @@
+# http_client.py
+"""
+Client HTTP mutualisé pour les pages Web (recherche YouTube, process_url, lecture approfondie).
+
+Une seule session `requests` partagée par tous les threads : connexions keep-alive réutilisées
+(un pool par hôte), compression gzip / deflate et brotli (si le paquet `brotli` est installé),
+User-Agent unique, et nouvelles tentatives avec attente exponentielle pour les GET sur erreur
+de connexion ou statut 429 / 5xx (en-tête Retry-After respecté, plafonné à MAX_RETRY_AFTER_S).
+Une requête soumise à une échéance (lecture approfondie) n'est jamais retentée. Le nombre de
+requêtes simultanées vers un même hôte est limité par un sémaphore pour ne pas saturer un site.
+"""
+import os
+import threading
+import contextlib
+import urllib.parse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry, make_headers
+
+USER_AGENT = os.getenv("HTTP_USER_AGENT", "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36 EVA/1.0")
+MAX_PER_HOST = int(os.getenv("HTTP_MAX_PER_HOST", "4"))
+RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+POOL_HOSTS = 32 # Pools d'hôtes gardés ouverts (les plus anciens sont fermés au-delà)
+BACKOFF_FACTOR = 0.5 # 0.5 s, 1 s, 2 s...
+MAX_RETRY_AFTER_S = float(os.getenv("HTTP_MAX_RETRY_AFTER_S", "5")) # Un « Retry-After: 3600 » ne bloque pas un thread une heure
+DEFAULT_TIMEOUT = (5, 20) # (connexion, lecture) en secondes
+
+
+class _CappedRetry(Retry):
+    """Retry dont l'attente demandée par l'en-tête Retry-After est bornée à MAX_RETRY_AFTER_S."""
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        return None if retry_after is None else min(retry_after, MAX_RETRY_AFTER_S)
+
+
+def _build_session(retries=RETRIES):
+    retry = _CappedRetry(
+        total=retries, backoff_factor=BACKOFF_FACTOR, status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({"GET", "HEAD"}), respect_retry_after_header=True, raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=MAX_PER_HOST, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(make_headers(accept_encoding=True)) # « gzip,deflate,br » quand brotli est disponible
+    session.headers["User-Agent"] = USER_AGENT
+    session.headers["Accept-Language"] = "fr-FR,fr;q=0.9,en;q=0.5"
+    return session
+
+
+_session = _build_session()
+_session_no_retry = _build_session(retries=0) # Requêtes avec échéance : une nouvelle tentative la dépasserait
+_host_slots = {} # hôte -> BoundedSemaphore(MAX_PER_HOST)
+_lock = threading.Lock()
+_stats = {"requests": 0, "errors": 0, "retries": 0, "host_waits": 0}
+
+
+def _count(name, value=1):
+    with _lock:
+        _stats[name] += value
+
+
+@contextlib.contextmanager
+def _host_slot(url, timeout):
+    """Réserve une des MAX_PER_HOST places de l'hôte ; attend au plus le délai de connexion."""
+    host = urllib.parse.urlsplit(url).netloc.lower()
+    with _lock:
+        slot = _host_slots.setdefault(host, threading.BoundedSemaphore(MAX_PER_HOST))
+    if not slot.acquire(blocking=False):
+        _count("host_waits")
+        wait_s = timeout[0] if isinstance(timeout, tuple) else timeout
+        if not slot.acquire(timeout=wait_s):
+            raise requests.exceptions.ConnectTimeout(f"Trop de requêtes simultanées vers {host}.")
+    try:
+        yield
+    finally:
+        slot.release()
+
+
+def _record(response):
+    retries = getattr(response.raw, "retries", None)
+    if retries is not None and retries.history:
+        _count("retries", len(retries.history))
+
+
+def get(url, timeout=DEFAULT_TIMEOUT, **kwargs):
+    """GET avec corps lu entièrement (mêmes arguments que requests.get). Lève requests.exceptions.RequestException."""
+    _count("requests")
+    try:
+        with _host_slot(url, timeout):
+            response = _session.get(url, timeout=timeout, **kwargs)
+            response.content # Corps téléchargé avant de libérer la place de l'hôte
+    except requests.exceptions.RequestException:
+        _count("errors")
+        raise
+    _record(response)
+    return response
+
+
+@contextlib.contextmanager
+def stream(url, timeout=DEFAULT_TIMEOUT, deadline=None, **kwargs):
+    """
+    GET en flux : `with stream(url) as response:` ; la place de l'hôte est gardée jusqu'à la sortie du bloc.
+    Avec `deadline` (temps time.monotonic()), la requête n'est pas retentée : `timeout` doit tenir dans l'échéance.
+    """
+    _count("requests")
+    session = _session if deadline is None else _session_no_retry
+    try:
+        with _host_slot(url, timeout):
+            with session.get(url, timeout=timeout, stream=True, **kwargs) as response:
+                _record(response)
+                yield response
+    except requests.exceptions.RequestException:
+        _count("errors")
+        raise
+
+
+def stats():
+    with _lock:
+        stats = dict(_stats)
+        stats["hosts"] = len(_host_slots)
+    stats["open_pools"] = sum(len(session.get_adapter("https://").poolmanager.pools) for session in (_session, _session_no_retry))
+    stats["accept_encoding"] = _session.headers.get("Accept-Encoding")
+    return stats
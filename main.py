@@ -5,19 +5,15 @@ import sys
 import base64
 import traceback
 import re
-import pickle # Pour stocker les tokens OAuth (exemple simple)
 import datetime # Pour l'exemple avec Google Calendar
 from email.mime.text import MIMEText # Pour créer le corps de l'e-mail
 from email.utils import parsedate_to_datetime # Pour parser les dates d'email
 import json # Ajouté pour WebSockets et carnet d'adresses
 import time
-import calendar # Ajouté pour la gestion des mois
 import subprocess # Pour exécuter des scripts et lancer des applications
 import webbrowser # Pour ouvrir des pages web
 import contextlib # Pour redirect_stdout avec exec
-import tempfile # Pour gérer les fichiers temporaires
 import math # Pour la visualisation 3D
-import threading # Pour le nettoyage des fichiers temporaires
 import urllib.parse
 
 # --- Configuration Initiale (Chargement .env AVANT tout le reste) ---
@@ -31,14 +27,19 @@ print("ATTENTION: OAUTHLIB_INSECURE_TRANSPORT activé. Pour développement local
 # !!!!! FIN DE L'AVERTISSEMENT !!!!!
 
 # --- Configuration de Whisper ---
+# Moteur choisi par .env : WHISPER_BACKEND ("openai" ou "ctranslate2"), WHISPER_MODEL_SIZE,
+# WHISPER_COMPUTE_TYPE, WHISPER_BEAM_SIZE et WHISPER_LANGUAGE (défaut "fr", évite la détection de langue).
 try:
-    import whisper
+    import transcription # Moteurs Whisper + découpage VAD + transcription parallèle
+    import streaming_stt # Reconnaissance vocale en flux (/api/audio_ws)
+    whisper_config = transcription.TranscriptionConfig.from_env()
+    whisper_backend = transcription.load_backend(whisper_config)
+    whisper_transcriber = transcription.ParallelTranscriber(whisper_backend, whisper_config)
     whisper_available = True
-    whisper_model = whisper.load_model("base") # "tiny", "base", "small", "medium", "large"
-    print("DEBUG: Modèle Whisper chargé.")
-except ImportError:
-    print("AVERTISSESEMENT: Bibliothèque 'openai-whisper' non trouvée.")
-    print("             Pour l'installer: pip install openai-whisper")
+    print(f"DEBUG: Modèle Whisper chargé (moteur: {whisper_config.backend}, modèle: {whisper_config.model_size}).")
+except ImportError as e:
+    print(f"AVERTISSESEMENT: Bibliothèque de transcription non trouvée ({e}).")
+    print("             Pour l'installer: pip install openai-whisper (ou faster-whisper pour WHISPER_BACKEND=ctranslate2)")
     print("             La fonctionnalité de transcription audio sera DÉSACTIVÉE.")
     whisper_available = False
 except Exception as e:
@@ -49,6 +50,7 @@ except Exception as e:
 try:
     import requests
     from bs4 import BeautifulSoup
+    import http_client # Session partagée : keep-alive, compression, nouvelles tentatives (voir http_client.py)
     url_processing_available = True
     # print("DEBUG: Bibliothèques 'requests' et 'BeautifulSoup' trouvées.")
 except ImportError:
@@ -71,7 +73,7 @@ except ImportError:
 print("--- Fin Configuration gTTS ---")
 
 # --- Autres Importations (Flask, Pillow, etc.) ---
-from flask import Flask, request, jsonify, redirect, session, url_for
+from flask import Flask, Response, request, jsonify, redirect, session, url_for
 from flask_cors import CORS
 from PIL import Image # Pillow pour la manipulation d'images
 from flask_sock import Sock
@@ -80,12 +82,30 @@ from werkzeug.utils import secure_filename
 # --- Imports pour Google OAuth et API Client ---
 from google_auth_oauthlib.flow import Flow
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build # Utilisé pour Google APIs y compris Custom Search
-from google.auth.transport.requests import Request
 from googleapiclient.errors import HttpError # Utilisé pour gérer les erreurs des API Google
 
 from simple_websocket.errors import ConnectionClosed
 
+from temp_reaper import TempFileReaper
+import google_credentials
+import google_services
+import google_http
+import gmail_batch
+import google_batch
+import email_body
+from gmail_mirror import GmailMirror
+from calendar_store import CalendarStore, PARIS_TZ, parse_event_time
+import freebusy
+from tasks_store import TasksStore
+from contact_store import ContactStore, EMAIL_RE, normalize_name as normalize_contact_name
+from contact_matcher import ContactMatcher
+from people_sync import PeopleSync
+import contact_io
+from search_cache import SearchCache, QuotaExceeded
+import web_digest
+import french_datetime
+from french_datetime import parse_french_datetime
+
 
 # Récupérer les clés API et configurations
 gemini_api_key = os.getenv("GEMINI_API_KEY")
@@ -132,220 +152,82 @@ SCOPES = [
     'https://www.googleapis.com/auth/gmail.send',
     'https://www.googleapis.com/auth/gmail.modify',
     'https://www.googleapis.com/auth/tasks',
+    'https://www.googleapis.com/auth/contacts.readonly',
 ]
 TOKEN_PICKLE_FILE = 'token.pickle'
+# Identifiants gardés en mémoire et rafraîchis avant expiration (voir google_credentials.py)
+google_credential_manager = google_credentials.get_manager(TOKEN_PICKLE_FILE)
+google_services.preload([('calendar', 'v3'), ('gmail', 'v1'), ('tasks', 'v1'), ('people', 'v1'), ('customsearch', 'v1')])
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 CONTACTS_FILE = os.path.join(BASE_DIR, 'contacts.json')
+PEOPLE_SYNC_STATE_FILE = os.path.join(BASE_DIR, 'people_sync_state.json')
+SEARCH_CACHE_FILE = os.path.join(BASE_DIR, 'search_cache.json')
+GMAIL_MIRROR_DB = os.path.join(BASE_DIR, 'gmail_mirror.sqlite')
 TEMP_AUDIO_DIR = os.path.join(BASE_DIR, 'temp_audio')
 os.makedirs(TEMP_AUDIO_DIR, exist_ok=True)
+# Un seul thread supprime les fichiers temporaires à échéance et balaie les orphelins (âge, quota)
+temp_reaper = TempFileReaper(TEMP_AUDIO_DIR).start()
 # print(f"DEBUG: Chemin absolu pour contacts.json: {CONTACTS_FILE}")
 
-# Variable globale pour le carnet d'adresses
-CONTACT_BOOK = {}
-
-# Dictionnaire pour la conversion des mois français en numéros
-MONTH_FR_TO_NUM = {
-    'janvier': 1, 'février': 2, 'fevrier': 2, 'mars': 3, 'avril': 4, 'mai': 5, 'juin': 6,
-    'juillet': 7, 'août': 8, 'aout': 8, 'septembre': 9, 'octobre': 10, 'novembre': 11, 'décembre': 12
-}
+# Carnet d'adresses : index nom/e-mail en mémoire, écritures atomiques (voir contact_store.py)
+contact_store = ContactStore(CONTACTS_FILE).load()
+# Recherche approchée (trigrammes, phonétique, initiales) pour les noms mal transcrits (voir contact_matcher.py)
+contact_matcher = ContactMatcher(contact_store)
+# Résultats Custom Search en cache disque, compteur du quota quotidien (voir search_cache.py)
+search_cache = SearchCache(SEARCH_CACHE_FILE)
 
 # --- Fonctions pour le carnet d'adresses ---
-def load_contacts():
-    global CONTACT_BOOK
-    try:
-        if not os.path.exists(CONTACTS_FILE):
-            with open(CONTACTS_FILE, 'w', encoding='utf-8') as f:
-                json.dump({}, f)
-            CONTACT_BOOK = {}
-            return
-        with open(CONTACTS_FILE, 'r', encoding='utf-8') as f:
-            file_content = f.read()
-            if not file_content.strip():
-                CONTACT_BOOK = {}
-            else:
-                f.seek(0)
-                loaded_data = json.load(f)
-                if isinstance(loaded_data, dict):
-                    CONTACT_BOOK = loaded_data
-                else:
-                    print(f"AVERTISSEMENT [load_contacts]: Contenu de {CONTACTS_FILE} n'est pas un dictionnaire JSON. Reçu: {type(loaded_data)}. Initialisation vide.")
-                    CONTACT_BOOK = {}
-    except json.JSONDecodeError as e:
-        print(f"ERREUR [load_contacts]: Décodage JSON échoué pour {CONTACTS_FILE}: {e}. CONTACT_BOOK réinitialisé.")
-        CONTACT_BOOK = {}
-    except Exception as e:
-        print(f"ERREUR [load_contacts]: Erreur inattendue: {e}. CONTACT_BOOK réinitialisé.")
-        traceback.print_exc()
-        CONTACT_BOOK = {}
-
-def save_contacts():
-    global CONTACT_BOOK
+def add_contact_to_book(name, email):
+    email_addr = email.strip()
+    if not normalize_contact_name(name): return "Le nom du contact ne peut pas être vide."
+    if not EMAIL_RE.match(email_addr): return f"L'adresse e-mail '{email_addr}' ne semble pas valide."
     try:
-        with open(CONTACTS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(CONTACT_BOOK, f, indent=4, ensure_ascii=False)
-        if os.path.exists(CONTACTS_FILE) and os.path.getsize(CONTACTS_FILE) < 2 and len(CONTACT_BOOK) > 0:
-            print(f"AVERTISSEMENT [save_contacts]: Fichier {CONTACTS_FILE} semble vide après sauvegarde alors que CONTACT_BOOK n'est pas vide!")
-        return True
+        contact_store.add(name, email_addr)
     except Exception as e:
-        print(f"ERREUR critique [save_contacts] lors de la sauvegarde dans {CONTACTS_FILE}: {e}")
+        print(f"ERREUR critique [add_contact_to_book] lors de la sauvegarde dans {CONTACTS_FILE}: {e}")
         traceback.print_exc()
-        return False
-
-def add_contact_to_book(name, email):
-    global CONTACT_BOOK
-    normalized_name = name.lower().strip()
-    email_addr = email.strip()
-    if not normalized_name: return "Le nom du contact ne peut pas être vide."
-    if not re.match(r"[^@]+@[^@]+\.[^@]+", email_addr): return f"L'adresse e-mail '{email_addr}' ne semble pas valide."
-    CONTACT_BOOK[normalized_name] = {"display_name": name, "email": email_addr}
-    if save_contacts():
-        load_contacts() # Recharger pour s'assurer de la cohérence
-        if normalized_name in CONTACT_BOOK and CONTACT_BOOK[normalized_name]["email"] == email_addr:
-            return f"Contact '{name}' ajouté avec l'email '{email_addr}'."
-        else:
-            print(f"AVERTISSEMENT [add_contact_to_book]: Échec de confirmation du contact '{normalized_name}' après rechargement. CONTACT_BOOK: {CONTACT_BOOK}")
-            return f"Erreur de vérification après sauvegarde du contact '{name}'."
-    else:
-        load_contacts()
         return f"Erreur lors de la sauvegarde du contact '{name}'."
+    return f"Contact '{name}' ajouté avec l'email '{email_addr}'."
 
 def get_contact_email(name):
-    global CONTACT_BOOK
-    normalized_name = name.lower().strip()
-    contact_info = CONTACT_BOOK.get(normalized_name)
+    contact_info = contact_store.get(name)
     if contact_info:
         return contact_info["email"], contact_info.get("display_name", name)
     return None, name # Return None for email, and original name as display_name fallback
 
+def resolve_contact(name):
+    """
+    Returns (contact, None) when `name` designates one contact (approximate match included),
+    (None, question) when several candidates need confirmation, and (None, None) when nothing matches.
+    """
+    contact, candidates = contact_matcher.resolve(name)
+    if contact:
+        if normalize_contact_name(contact["display_name"]) != normalize_contact_name(name):
+            print(f"INFO [resolve_contact]: '{name}' -> '{contact['display_name']}' (score {candidates[0][0]})")
+        return contact, None
+    if not candidates:
+        return None, None
+    options = ", ".join(f"{c['display_name']} ({c['email']})" for _, c in candidates[:3])
+    return None, f"Plusieurs contacts correspondent à '{name}' : {options}. Lequel voulez-vous ?"
+
 def list_contacts_from_book():
-    global CONTACT_BOOK
-    if not CONTACT_BOOK: return "Votre carnet d'adresses est vide."
-    return "Voici vos contacts :\n" + "\n".join([f"- {c['display_name']} ({c['email']})" for c in CONTACT_BOOK.values()])
+    contacts = contact_store.all()
+    if not contacts: return "Votre carnet d'adresses est vide."
+    return "Voici vos contacts :\n" + "\n".join([f"- {c['display_name']} ({c['email']})" for c in contacts])
 
 def remove_contact_from_book(name):
-    global CONTACT_BOOK
-    normalized_name = name.lower().strip()
-    if normalized_name in CONTACT_BOOK:
-        removed_contact_name = CONTACT_BOOK[normalized_name]["display_name"]
-        del CONTACT_BOOK[normalized_name]
-        if save_contacts():
-            load_contacts()
-            if normalized_name not in CONTACT_BOOK:
-                return f"Contact '{removed_contact_name}' supprimé."
-            else:
-                print(f"AVERTISSEMENT [remove_contact_from_book]: Contact '{removed_contact_name}' toujours présent après rechargement.")
-                return f"Erreur de confirmation de suppression pour '{removed_contact_name}'."
-        else:
-            load_contacts()
-            return f"Erreur de sauvegarde après suppression du contact '{removed_contact_name}'."
-    return f"Contact '{name}' non trouvé."
-
-load_contacts()
-
-# --- Fonctions Google Calendar ---
-def parse_french_datetime(datetime_str):
-    now = datetime.datetime.now()
-    datetime_str_cleaned = datetime_str.strip().lower() # Convert to lowercase for easier matching
-
-    # Helper to extract time
-    def extract_time(text):
-        time_match = re.search(r"(\d{1,2})h(?:(\d{2}))?", text, re.IGNORECASE)
-        if time_match:
-            hour = int(time_match.group(1))
-            minute = int(time_match.group(2)) if time_match.group(2) else 0
-            return hour, minute
-        return 9, 0 # Default to 9 AM if no specific time is found in the relative string
-
-    # Handle "dans X semaine(s)"
-    week_match = re.search(r"dans\s+(\d+|une)\s+semaine(s)?", datetime_str_cleaned)
-    if week_match:
-        num_weeks_str = week_match.group(1)
-        num_weeks = 1 if num_weeks_str == "une" else int(num_weeks_str)
-        target_date = now + datetime.timedelta(weeks=num_weeks)
-        hour, minute = extract_time(datetime_str_cleaned)
-        return target_date.replace(hour=hour, minute=minute, second=0, microsecond=0)
-
-    # Handle "dans X mois"
-    month_match = re.search(r"dans\s+(\d+|un|une)\s+mois", datetime_str_cleaned)
-    if month_match:
-        num_months_str = month_match.group(1)
-        if num_months_str.lower() == "un" or num_months_str.lower() == "une":
-            num_months = 1
-        else:
-            num_months = int(num_months_str)
-
-        current_month = now.month
-        current_year = now.year
-
-        new_month_abs = current_month + num_months
-
-        new_year = current_year + (new_month_abs - 1) // 12
-        new_month = (new_month_abs - 1) % 12 + 1
-
-        last_day_of_new_month = calendar.monthrange(new_year, new_month)[1]
-        new_day = min(now.day, last_day_of_new_month)
-
-        hour, minute = extract_time(datetime_str_cleaned)
-        return datetime.datetime(new_year, new_month, new_day, hour, minute, second=0, microsecond=0)
-
-    if "demain" in datetime_str_cleaned:
-        target_date = now + datetime.timedelta(days=1)
-        hour, minute = extract_time(datetime_str_cleaned)
-        return target_date.replace(hour=hour, minute=minute, second=0, microsecond=0)
-
-    if "aujourd'hui" in datetime_str_cleaned or "ce jour" in datetime_str_cleaned:
-        target_date = now
-        hour, minute = extract_time(datetime_str_cleaned)
-        return target_date.replace(hour=hour, minute=minute, second=0, microsecond=0)
-
-    pattern_datetime = re.compile(
-        r"(?:le\s+|l')?(\d{1,2})\s+(janvier|février|fevrier|mars|avril|mai|juin|juillet|août|aout|septembre|octobre|novembre|décembre)\s*(?:l'année\s*(\d{4})\s*)?(?:à|a)\s*(\d{1,2})h(?:(\d{2}))?",
-        re.IGNORECASE
-    )
-    match_datetime = pattern_datetime.search(datetime_str_cleaned)
-
-    if match_datetime:
-        day_str, month_name_fr, year_str, hour_str, minute_str = match_datetime.groups()
-    else:
-        pattern_date_only = re.compile(
-             r"(?:le\s+|l')?(\d{1,2})\s+(janvier|février|fevrier|mars|avril|mai|juin|juillet|août|aout|septembre|octobre|novembre|décembre)\s*(?:l'année\s*(\d{4})\s*)?",
-             re.IGNORECASE
-        )
-        match_date_only = pattern_date_only.search(datetime_str_cleaned)
-        if match_date_only:
-            day_str, month_name_fr, year_str = match_date_only.groups()
-            hour_str, minute_str = "9", "00" # Default time
-        else:
-            return None
-
     try:
-        day = int(day_str)
-        month_num = MONTH_FR_TO_NUM.get(month_name_fr.lower())
-        if not month_num: return None
-        year = int(year_str) if year_str else datetime.datetime.now().year
-        hour = int(hour_str)
-        minute = int(minute_str) if minute_str else 0
-        if not (1 <= day <= 31 and 0 <= hour <= 23 and 0 <= minute <= 59): return None
-
-        parsed_dt = datetime.datetime(year, month_num, day, hour, minute)
-        # If the parsed date is in the past for the current year (and no year was specified),
-        # and "prochain" or a similar keyword is used, or the month is past, assume next year.
-        if parsed_dt < now and not year_str and \
-           ("prochain" in datetime_str_cleaned or "prochaine" in datetime_str_cleaned or \
-            (month_num < now.month and year == now.year ) ): # Check if month is past for current year
-            year += 1
-            # Ensure day is valid for the new month/year (e.g., Feb 29)
-            last_day_of_new_month_for_specific = calendar.monthrange(year, month_num)[1]
-            day = min(day, last_day_of_new_month_for_specific)
-            parsed_dt = datetime.datetime(year, month_num, day, hour, minute)
-
-        return parsed_dt
-    except ValueError: return None
-    except Exception as e: # Catch any other unexpected errors during parsing
+        removed_contact = contact_store.remove(name)
+    except Exception as e:
+        print(f"ERREUR critique [remove_contact_from_book] lors de la sauvegarde dans {CONTACTS_FILE}: {e}")
         traceback.print_exc()
-        return None
+        return f"Erreur de sauvegarde après suppression du contact '{name}'."
+    if removed_contact is None:
+        return f"Contact '{name}' non trouvé."
+    return f"Contact '{removed_contact['display_name']}' supprimé."
 
+# --- Fonctions Google Calendar ---
 def create_calendar_event(summary, start_datetime_obj, duration_hours=1):
     creds = get_google_credentials()
     if not creds:
@@ -358,6 +240,16 @@ def create_calendar_event(summary, start_datetime_obj, duration_hours=1):
 
     end_datetime_obj = start_datetime_obj + datetime.timedelta(hours=duration_hours)
 
+    # Détection de conflit sur tous les agendas : un seul appel freebusy.query avant l'insertion
+    conflict_warning = ""
+    try:
+        busy = free_busy.busy(start_datetime_obj, end_datetime_obj)
+        if busy:
+            conflicts = ", ".join(f"{b_start.strftime('%Hh%M')}-{b_end.strftime('%Hh%M')}" for b_start, b_end in busy)
+            conflict_warning = f"\nAttention : ce créneau chevauche un autre engagement ({conflicts})."
+    except Exception as e:
+        print(f"AVERTISSEMENT: Vérification des conflits impossible: {e}")
+
     event_body = {
         'summary': summary,
         'start': {'dateTime': start_datetime_obj.isoformat(), 'timeZone': 'Europe/Paris'},
@@ -371,15 +263,16 @@ def create_calendar_event(summary, start_datetime_obj, duration_hours=1):
         },
     }
     try:
-        service = build('calendar', 'v3', credentials=creds)
+        service = google_services.get_service('calendar', 'v3', credentials=creds)
         created_event = service.events().insert(calendarId='primary', body=event_body).execute()
+        calendar_store.upsert(created_event)
         event_link = created_event.get('htmlLink', 'Lien non disponible')
-        return f"Événement '{summary}' ajouté à votre calendrier pour le {start_datetime_obj.strftime('%d %B %Y à %Hh%M')}. Lien: {event_link}"
+        return f"Événement '{summary}' ajouté à votre calendrier pour le {start_datetime_obj.strftime('%d %B %Y à %Hh%M')}. Lien: {event_link}{conflict_warning}"
     except HttpError as error:
         error_content = error.content.decode('utf-8') if error.content else "Aucun détail d'erreur."
         print(f"Erreur API Calendar (création événement): Status={error.resp.status}, Raison={error.resp.reason}, Détails={error_content}")
         if error.resp.status == 401 or 'invalid_grant' in str(error).lower():
-            if os.path.exists(TOKEN_PICKLE_FILE): os.remove(TOKEN_PICKLE_FILE)
+            google_credential_manager.invalidate()
             return "Identifiants Calendar invalides/révoqués. Réauthentifiez-vous."
         return f"Erreur lors de la création de l'événement ({error.resp.status}): {error_content}"
     except Exception as e:
@@ -391,30 +284,12 @@ def format_event_datetime(start_str):
     """
     Formats a Google Calendar start datetime string into a more readable French format.
     Handles both full datetime strings and date-only strings.
-    Converts UTC times to Paris local time.
+    Converts times to Paris local time (zoneinfo, DST-aware for the event's own date).
     """
     try:
-        # Attempt to determine if Paris is currently in DST. This is a simplification.
-        # For full accuracy, use a library like pytz if available, or rely on Google API to return local times.
-        # Assuming Paris is UTC+1 (standard) or UTC+2 (DST)
-        now_paris = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=1))) # CET
-        is_dst = time.localtime().tm_isdst > 0
-        paris_offset_hours = 2 if is_dst else 1
-        paris_tz = datetime.timezone(datetime.timedelta(hours=paris_offset_hours))
-
-
         if 'T' in start_str:  # Indicates a full datetime
-            if 'Z' in start_str: # UTC
-                dt_object_utc = datetime.datetime.fromisoformat(start_str.replace('Z', '+00:00'))
-            elif '+' in start_str[10:] or '-' in start_str[10:]: # Has offset, assume it's already aware
-                 dt_object_utc = datetime.datetime.fromisoformat(start_str) # Potentially already local if API returned it
-                 # If it has an offset that isn't Paris', convert it.
-                 # For simplicity, if it has an offset, we'll assume it's correct or convert from UTC if no offset.
-            else: # No explicit timezone, assume UTC as per Google API common practice for 'dateTime'
-                dt_object_utc = datetime.datetime.fromisoformat(start_str).replace(tzinfo=datetime.timezone.utc)
-
-            dt_object_paris = dt_object_utc.astimezone(paris_tz)
-            return dt_object_paris.strftime("%d %B %Y à %Hh%M")
+            dt_object, _ = parse_event_time({'dateTime': start_str})
+            return dt_object.astimezone(PARIS_TZ).strftime("%d %B %Y à %Hh%M")
         else:  # Date only string (all-day event)
             dt_object_date = datetime.datetime.strptime(start_str, "%Y-%m-%d")
             # For all-day events, the date is the date, no timezone conversion needed for the day itself.
@@ -447,10 +322,10 @@ Tu as la possibilité de coder du python et de l'executer. Tu peux facilement é
 # --- Fin d'instruction sur l'interaction ---
 
 Si la requête semble être une COMMANDE pour effectuer une action spécifique (comme ajouter un événement au calendrier, envoyer un email, chercher sur le web, obtenir un itinéraire, gérer des contacts, créer ou lister des tâches, lister des emails ou des événements de calendrier, obtenir les prévisions météo, obtenir des détails sur les emails d'un contact, analyser une URL ou transcrire un fichier audio), tu DOIS la reformuler en un objet JSON structuré.
-Le JSON doit avoir une clé "action" (valeurs possibles: "create_calendar_event", "list_calendar_events", "update_calendar_event", "delete_calendar_event", "send_email", "list_emails", "get_contact_emails", "create_task", "list_tasks", "update_task", "delete_task", "add_contact", "list_contacts", "remove_contact", "get_contact_email", "get_directions", "web_search", "get_weather_forecast", "process_url", "process_audio", "execute_python_code", "generate_3d_object", "launch_application", "open_webpage","open_youtube_video", "get_current_datetime") et une clé "entities" contenant les informations extraites pertinentes pour cette action.
+Le JSON doit avoir une clé "action" (valeurs possibles: "create_calendar_event", "list_calendar_events", "update_calendar_event", "delete_calendar_event", "check_availability", "send_email", "list_emails", "get_contact_emails", "create_task", "list_tasks", "update_task", "delete_task", "complete_tasks", "delete_tasks", "add_contact", "list_contacts", "remove_contact", "get_contact_email", "get_directions", "web_search", "get_weather_forecast", "process_url", "process_audio", "execute_python_code", "generate_3d_object", "launch_application", "open_webpage","open_youtube_video", "get_current_datetime") et une clé "entities" contenant les informations extraites pertinentes pour cette action.
 Cet objet JSON doit être la SEULE sortie si une commande est identifiée, sans texte explicatif ni formatage markdown autour, SAUF si l'utilisateur demande explicitement du code informatique (Python, HTML etc.), auquel cas ce code sera dans des blocs markdown.
 
-TOUTEFOIS, pour les actions qui retournent des listes d'informations ou des résultats (par exemple, "list_calendar_events", "list_emails", "get_contact_emails" en mode 'summary', "list_tasks", "web_search", "get_weather_forecast", "get_directions", "process_audio"), après avoir fourni le JSON de commande (si applicable), tu DOIS ajouter un commentaire textuel de 2 ou 3 phrases.
+TOUTEFOIS, pour les actions qui retournent des listes d'informations ou des résultats (par exemple, "list_calendar_events", "check_availability", "list_emails", "get_contact_emails" en mode 'summary', "list_tasks", "web_search", "get_weather_forecast", "get_directions", "process_audio"), après avoir fourni le JSON de commande (si applicable), tu DOIS ajouter un commentaire textuel de 2 ou 3 phrases.
 Ce commentaire doit :
 Pour `web_search` : Fournir systématiquement un résumé concis des informations clés trouvées (environ 2-3 phrases). Ce résumé doit clairement indiquer la source principale des informations sous la forme : 'Selon [Source], [résumé des découvertes].' Évite les blagues ou commentaires non directement liés aux résultats de la recherche.
 2.  Pour `get_weather_forecast`: Fournir un très court résumé des conditions météo principales attendues (ex: 'Attendez-vous à du soleil avec environ 25 degrés.' ou 'Il semblerait qu'il pleuve demain.').
@@ -468,17 +343,18 @@ Pour jouer du piano, utilise l'action "fl_studio_play_sequence" (ex: "joue une m
 Exemples d'entités attendues pour chaque action :
 - "create_calendar_event": {"summary": "titre de l'événement", "datetime_str": "description de la date et l'heure comme 'demain à 14h' ou 'le 25 décembre 2025 à 10h30'"}
 - "list_calendar_events": {"event_summary_hint": "partie du nom de l'événement (optionnel)", "specific_datetime_str": "date et heure précises recherchées par l'utilisateur (optionnel)"}
+- "check_availability": {"start_datetime_str": "début du créneau ou jour seul, ex: 'demain à 14h' ou 'le 12 mars'", "end_datetime_str": "fin du créneau, ex: 'demain à 18h' (optionnel)", "duration_minutes": "durée minimale d'un créneau libre à proposer (optionnel, défaut 30)"} (pour « suis-je libre ... ? » ou « trouve-moi un créneau ... »)
 - "send_email": {"recipient_name_or_email": "nom du contact ou adresse email", "subject": "objet de l'email", "body": "contenu du message", "thread_id": "ID du fil de discussion pour répondre (optionnel)", "in_reply_to": "ID du message auquel répondre (optionnel)", "references": "IDs des messages précédents (optionnel)"}
 - "list_emails": {} (pour lister les emails non lus généraux)
-- "get_contact_emails": {"contact_identifier": "nom du contact ou adresse email du contact recherché", "retrieve_mode": "spécifie le type de récupération: 'summary' pour une liste de sujets/dates (défaut à 5 résultats), ou 'full_last' pour le contenu du dernier email de ce contact. Le mode 'summary' peut être accompagné de 'max_summaries' pour changer le nombre de résultats.", "subject_filter": "mot-clé optionnel à rechercher dans l'objet des emails", "max_summaries": "nombre maximum de résumés à afficher si retrieve_mode est 'summary' (défaut 5)"}
-- "create_task": {"title": "titre de la tâche", "notes": "notes additionnelles pour la tâche (optionnel)"}
+- "get_contact_emails": {"contact_identifier": "nom du contact ou adresse email du contact recherché", "retrieve_mode": "spécifie le type de récupération: 'summary' pour une liste de sujets/dates (défaut à 5 résultats), ou 'full_last' pour le contenu du dernier email de ce contact. Le mode 'summary' peut être accompagné de 'max_summaries' pour changer le nombre de résultats.", "subject_filter": "mot-clé optionnel à rechercher dans l'objet des emails", "search_text": "mots optionnels à rechercher dans l'objet ou le contenu des emails", "date_from": "date de début optionnelle AAAA-MM-JJ", "date_to": "date de fin optionnelle AAAA-MM-JJ", "max_summaries": "nombre maximum de résumés à afficher si retrieve_mode est 'summary' (défaut 5)"}
+- "create_task": {"title": "titre de la tâche", "notes": "notes additionnelles pour la tâche (optionnel)"} ; pour plusieurs éléments d'un coup (« ajoute pain, lait et œufs à mes tâches »), utilise {"titles": ["pain", "lait", "œufs"]} dans une seule commande
 - "list_tasks": {} (les entités peuvent être vides)
 - "add_contact": {"name": "nom du contact", "email": "adresse email du contact"}
 - "list_contacts": {} (les entités peuvent être vides)
 - "remove_contact": {"name": "nom du contact à supprimer"}
 - "get_contact_email": {"name": "nom du contact dont on veut l'email"}
 - "get_directions": {"origin": "lieu de départ (optionnel, défaut Thonon-les-Bains si non spécifié par l'utilisateur)", "destination": "lieu d'arrivée"}
-- "web_search": {"query": "la question ou les termes à rechercher"}
+- "web_search": {"query": "la question ou les termes à rechercher", "deep": true uniquement si l'utilisateur demande une recherche approfondie, détaillée ou complète (lecture des pages, plus lente)}
 - "get_weather_forecast": {} (les entités sont vides, la localisation est gérée côté client, mais tu dois fournir un résumé verbal)
 - "get_current_datetime": {} (ne nécessite aucune entité)
 - "process_url": {"url": "l'URL à analyser", "question": "question optionnelle sur l'URL (optionnel)"}
@@ -492,6 +368,8 @@ Exemples d'entités attendues pour chaque action :
 - "delete_calendar_event": {"event_summary": "titre de l'événement à supprimer", "datetime_str": "date et heure de l'événement à supprimer"}
 - "update_task": {"old_task_title": "titre de la tâche à modifier", "new_task_title": "nouveau titre pour la tâche"}
 - "delete_task": {"task_title": "titre de la tâche à supprimer"}
+- "complete_tasks": {"task_titles": ["titre de la tâche terminée", "..."]} (une ou plusieurs tâches à cocher, en une seule commande)
+- "delete_tasks": {"task_titles": ["titre de la tâche à supprimer", "..."]} (pour supprimer plusieurs tâches d'un coup)
 - "spotify_play": {"query": "nom de la piste, de l'artiste ou de l'album, une musique d'ambiance, une musique de concentration, une musique dubstep, etc..."}
 - "spotify_pause": {} (les entités peuvent être vides)
 - "spotify_resume": {} (les entités peuvent être vides, pour reprendre la lecture)
@@ -539,26 +417,45 @@ gemini_conversation_history = []
 MAX_HISTORY_ITEMS = 4
 
 def get_google_credentials():
-    creds = None
-    if os.path.exists(TOKEN_PICKLE_FILE):
-        with open(TOKEN_PICKLE_FILE, 'rb') as token:
-            creds = pickle.load(token)
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            try:
-                creds.refresh(Request())
-            except Exception as e:
-                print(f"Erreur lors du rafraîchissement des tokens: {e}. L'utilisateur devra se réauthentifier.")
-                if os.path.exists(TOKEN_PICKLE_FILE):
-                    os.remove(TOKEN_PICKLE_FILE)
-                return None
-        else:
-            return None # No valid credentials, user needs to authorize
-    # Save the potentially refreshed credentials
-    if creds: # Ensure creds is not None before trying to save
-         with open(TOKEN_PICKLE_FILE, 'wb') as token_file: # wb for writing bytes
-            pickle.dump(creds, token_file)
-    return creds
+    """Returns valid in-memory credentials, or None if the user needs to authorize."""
+    return google_credential_manager.get()
+
+def _gmail_service_or_none():
+    creds = get_google_credentials()
+    return google_services.get_service('gmail', 'v1', credentials=creds) if creds else None
+
+# Miroir SQLite des métadonnées Gmail, tenu à jour en arrière-plan via l'API History
+gmail_mirror = GmailMirror(
+    GMAIL_MIRROR_DB, _gmail_service_or_none,
+    on_auth_error=google_credential_manager.invalidate,
+    body_extractor=email_body.extract_text,
+).start()
+
+def _calendar_service_or_none():
+    creds = get_google_credentials()
+    return google_services.get_service('calendar', 'v3', credentials=creds) if creds else None
+
+# Copie locale de l'agenda principal, tenue à jour par syncToken (voir calendar_store.py)
+calendar_store = CalendarStore(_calendar_service_or_none)
+# Disponibilités sur tous les agendas en un seul appel freebusy.query
+free_busy = freebusy.FreeBusy(_calendar_service_or_none)
+
+def _tasks_service_or_none():
+    creds = get_google_credentials()
+    return google_services.get_service('tasks', 'v1', credentials=creds) if creds else None
+
+# Listes et tâches Google Tasks en mémoire, index par titre (voir tasks_store.py)
+tasks_store = TasksStore(_tasks_service_or_none)
+
+def _people_service_or_none():
+    creds = get_google_credentials()
+    return google_services.get_service('people', 'v1', credentials=creds) if creds else None
+
+# Contacts Google importés dans le carnet local puis resynchronisés en fond par syncToken (voir people_sync.py)
+people_sync = PeopleSync(
+    contact_store, _people_service_or_none, PEOPLE_SYNC_STATE_FILE,
+    on_auth_error=google_credential_manager.invalidate,
+).start()
 
 @app.route('/authorize_google')
 def authorize_google():
@@ -602,9 +499,8 @@ def oauth2callback_google():
         print(f"ERREUR détaillée lors de fetch_token: {traceback.format_exc()}")
         return jsonify({"error": f"Échec de la récupération des tokens OAuth: {e}."}), 500
 
-    credentials = flow.credentials
-    with open(TOKEN_PICKLE_FILE, 'wb') as token_file:
-        pickle.dump(credentials, token_file)
+    google_credential_manager.set(flow.credentials)
+    people_sync.request_sync() # Import des contacts Google sans attendre le prochain cycle
 
     # Return a simple success page that closes itself
     return """
@@ -616,23 +512,33 @@ def oauth2callback_google():
 def list_unread_emails(max_results=10): # Added default value
     creds = get_google_credentials()
     if not creds: return "Authentification Google requise pour Gmail. Veuillez autoriser via /authorize_google."
+    if gmail_mirror.is_ready() and gmail_mirror.is_complete(label_ids=("INBOX", "UNREAD")):
+        # Réponse locale (tous les non lus sont dans le miroir) : au plus un appel history.list si le miroir n'est pas assez frais
+        gmail_mirror.ensure_fresh()
+        rows = gmail_mirror.list_messages(("INBOX", "UNREAD"), limit=int(max_results))
+        if not rows: return "Aucun e-mail non lu trouvé."
+        email_list_details = "Voici vos derniers e-mails non lus :\n"
+        for row in rows:
+            email_list_details += f"- De: {row['sender'] or 'Expéditeur inconnu'}, Sujet: {row['subject'] or 'Pas de sujet'}\n"
+        return email_list_details
     try:
-        service = build('gmail', 'v1', credentials=creds)
+        service = google_services.get_service('gmail', 'v1', credentials=creds)
         results = service.users().messages().list(userId='me', labelIds=['INBOX', 'UNREAD'], maxResults=int(max_results)).execute() # Ensure max_results is int
         messages = results.get('messages', [])
         if not messages: return "Aucun e-mail non lu trouvé."
         email_list_details = "Voici vos derniers e-mails non lus :\n"
-        for msg_ref in messages:
-            msg = service.users().messages().get(userId='me', id=msg_ref['id'], format='metadata', metadataHeaders=['Subject', 'From']).execute()
-            headers = msg.get('payload', {}).get('headers', [])
-            subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'Pas de sujet')
-            sender = next((h['value'] for h in headers if h['name'] == 'From'), 'Expéditeur inconnu')
+        # Un seul aller-retour (requête batch) pour les métadonnées de tous les messages
+        fetched = gmail_batch.fetch_messages(service, [m['id'] for m in messages], metadata_headers=['Subject', 'From'])
+        for msg in fetched:
+            if msg is None: continue
+            subject = gmail_batch.get_header(msg, 'Subject', 'Pas de sujet')
+            sender = gmail_batch.get_header(msg, 'From', 'Expéditeur inconnu')
             email_list_details += f"- De: {sender}, Sujet: {subject}\n"
         return email_list_details
     except HttpError as error:
         print(f"Erreur API Gmail (lecture): {error.resp.status} - {error._get_reason()}")
         if error.resp.status == 401 or 'invalid_grant' in str(error).lower():
-            if os.path.exists(TOKEN_PICKLE_FILE): os.remove(TOKEN_PICKLE_FILE)
+            google_credential_manager.invalidate()
             return "Identifiants Gmail invalides/révoqués. Réauthentifiez-vous."
         return f"Erreur lors de l'accès à Gmail: {error.resp.status} - {error._get_reason()}"
     except Exception as e:
@@ -644,7 +550,7 @@ def send_email(to_address, subject, message_text, thread_id=None, in_reply_to=No
     creds = get_google_credentials()
     if not creds: return "Authentification Google requise pour envoyer des e-mails. Veuillez autoriser via /authorize_google."
     try:
-        service = build('gmail', 'v1', credentials=creds)
+        service = google_services.get_service('gmail', 'v1', credentials=creds)
         mime_message = MIMEText(message_text, 'plain', 'utf-8')
         mime_message['to'] = to_address
         mime_message['subject'] = subject
@@ -674,7 +580,7 @@ def send_email(to_address, subject, message_text, thread_id=None, in_reply_to=No
         error_content = error.content.decode('utf-8') if error.content else "Aucun détail."
         print(f"Erreur API Gmail (envoi): {error.resp.status} - {error.resp.reason} - {error_content}")
         if error.resp.status == 401 or 'invalid_grant' in str(error).lower():
-            if os.path.exists(TOKEN_PICKLE_FILE): os.remove(TOKEN_PICKLE_FILE)
+            google_credential_manager.invalidate()
             return "Identifiants Gmail invalides/révoqués. Réauthentifiez-vous."
         elif error.resp.status == 400: # Bad request, often invalid recipient
             return f"Erreur lors de la préparation de l'e-mail (400): {error_content}. Vérifiez l'adresse du destinataire."
@@ -686,55 +592,10 @@ def send_email(to_address, subject, message_text, thread_id=None, in_reply_to=No
 
 def get_email_body_from_payload(payload):
     """
-    Extracts the text/plain body from a Gmail message payload.
-    Falls back to text/html (cleaned) if text/plain is not found.
-    Handles multipart messages recursively.
+    Extracts the text body from a Gmail message payload (text/plain preferred, cleaned text/html otherwise).
+    Decoding stops once EMAIL_BODY_MAX_CHARS characters are collected (see email_body.py).
     """
-    if payload.get('parts'):
-        plain_text_body = None
-        html_body_content = None # Store the actual HTML content
-
-        for part in payload['parts']:
-            if part['mimeType'] == 'text/plain':
-                if 'data' in part['body']:
-                    plain_text_body = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8', errors='replace')
-                    break # Prefer plain text, so stop searching this level
-            elif part['mimeType'] == 'text/html':
-                if 'data' in part['body']: # Only store if not already found plain_text
-                    html_body_content = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8', errors='replace')
-            elif 'parts' in part: # Nested multipart (e.g., multipart/alternative within multipart/mixed)
-                # Recursively search for plain text in nested parts
-                nested_result = get_email_body_from_payload(part)
-                if nested_result: # If something (hopefully plain text) is found deeper
-                    # This simple recursion returns the first non-None. A more complex one could prioritize.
-                    return nested_result
-
-        if plain_text_body:
-            return plain_text_body
-        elif html_body_content:
-            # Basic cleaning of HTML
-            text = re.sub(r'<style[^>]*?>.*?</style>', '', html_body_content, flags=re.DOTALL | re.IGNORECASE)
-            text = re.sub(r'<script[^>]*?>.*?</script>', '', text, flags=re.DOTALL | re.IGNORECASE)
-            text = re.sub(r'<head[^>]*?>.*?</head>', '', text, flags=re.DOTALL | re.IGNORECASE)
-            text = re.sub(r'<[^>]+>', ' ', text) # Replace tags with space
-            text = re.sub(r'(\s*\n\s*){2,}', '\n', text) # Reduce multiple newlines (from block elements)
-            text = re.sub(r'[ \t]+', ' ', text) # Normalize spaces and tabs
-            return text.strip()
-        return None # No text/plain or text/html part found at this level or in direct recursion
-
-    # Not multipart, direct body check (e.g. email is just plain text)
-    elif payload.get('mimeType') == 'text/plain' and payload.get('body') and payload['body'].get('data'):
-        return base64.urlsafe_b64decode(payload['body']['data']).decode('utf-8', errors='replace')
-    elif payload.get('mimeType') == 'text/html' and payload.get('body') and payload['body'].get('data'):
-        html_body_content = base64.urlsafe_b64decode(payload['body']['data']).decode('utf-8', errors='replace')
-        text = re.sub(r'<style[^>]*?>.*?</style>', '', html_body_content, flags=re.DOTALL | re.IGNORECASE)
-        text = re.sub(r'<script[^>]*?>.*?</script>', '', text, flags=re.DOTALL | re.IGNORECASE)
-        text = re.sub(r'<head[^>]*?>.*?</head>', '', text, flags=re.DOTALL | re.IGNORECASE)
-        text = re.sub(r'<[^>]+>', ' ', text)
-        text = re.sub(r'(\s*\n\s*){2,}', '\n', text)
-        text = re.sub(r'[ \t]+', ' ', text)
-        return text.strip()
-    return None
+    return email_body.extract_text(payload)
 
 
 def create_google_task(title, notes=None):
@@ -742,43 +603,22 @@ def create_google_task(title, notes=None):
     if not creds: return "Authentification Google requise pour créer des tâches. Veuillez autoriser via /authorize_google."
     if not title or not title.strip(): return "Le titre de la tâche ne peut pas être vide."
     try:
-        service = build('tasks', 'v1', credentials=creds)
-        # Try to find a default task list or the first one available
-        tasklists_response = service.tasklists().list(maxResults=10).execute()
-        tasklists = tasklists_response.get('items', [])
-        tasklist_id = None
-        tasklist_title = "par défaut" # Default display name
-
-        if not tasklists: # No task lists exist, create one
-            try:
-                created_list = service.tasklists().insert(body={'title': 'Ma Liste'}).execute()
-                tasklist_id = created_list['id']
-                tasklist_title = created_list['title']
-            except HttpError as list_error:
-                print(f"Erreur lors de la création de la liste de tâches par défaut: {list_error}")
-                return "Aucune liste de tâches trouvée et la création automatique a échoué."
-        else:
-            # Prefer a list named "Ma Liste" or "My Tasks" or similar, otherwise use the first one
-            preferred_list_titles = ["ma liste", "my tasks", "tâches", "tasks"] # common default names
-            for tl in tasklists:
-                if tl.get('title', '').lower() in preferred_list_titles:
-                    tasklist_id = tl['id']
-                    tasklist_title = tl['title']
-                    break
-            if not tasklist_id: # If no preferred list found, use the first list
-                tasklist_id = tasklists[0]['id']
-                tasklist_title = tasklists[0].get('title', 'inconnue')
-
+        service = google_services.get_service('tasks', 'v1', credentials=creds)
+        default_list = tasks_store.default_list() # Résolue une seule fois, créée si aucune liste n'existe
+        if not default_list:
+            return "Authentification Google requise pour créer des tâches. Veuillez autoriser via /authorize_google."
+        tasklist_id, tasklist_title = default_list
 
         task_body = {'title': title}
         if notes and notes.strip(): task_body['notes'] = notes
         created_task = service.tasks().insert(tasklist=tasklist_id, body=task_body).execute()
+        tasks_store.upsert(created_task, tasklist_id)
         return f"Tâche '{created_task['title']}' ajoutée à la liste '{tasklist_title}'."
     except HttpError as error:
         error_content = error.content.decode('utf-8') if error.content else "Aucun détail."
         print(f"Erreur API Tasks (création): {error.resp.status} - {error.resp.reason} - {error_content}")
         if error.resp.status == 401 or 'invalid_grant' in str(error).lower():
-            if os.path.exists(TOKEN_PICKLE_FILE): os.remove(TOKEN_PICKLE_FILE)
+            google_credential_manager.invalidate()
             return "Identifiants Tasks invalides/révoqués. Réauthentifiez-vous."
         return f"Erreur lors de la création de la tâche ({error.resp.status}): {error_content}."
     except Exception as e:
@@ -790,23 +630,10 @@ def list_google_tasks(max_results=10): # Added default value
     creds = get_google_credentials()
     if not creds: return "Authentification Google requise pour Tasks. Veuillez autoriser via /authorize_google."
     try:
-        service = build('tasks', 'v1', credentials=creds)
-        # Get all task lists to find a suitable one
-        all_tasklists_response = service.tasklists().list(maxResults=20).execute() # Increased maxResults for task lists
-        all_tasklists = all_tasklists_response.get('items', [])
-        if not all_tasklists: return "Aucune liste de tâches trouvée."
-
-        tasklist_id = all_tasklists[0]['id'] # Default to the first list if no preferred one is found
-        tasklist_title = all_tasklists[0].get('title', 'par défaut')
-        preferred_list_titles = ["ma liste", "my tasks", "tâches", "tasks"] # common default names
-        for tl in all_tasklists:
-            if tl.get('title', '').lower() in preferred_list_titles:
-                tasklist_id = tl['id']
-                tasklist_title = tl['title']
-                break
-
-        results = service.tasks().list(tasklist=tasklist_id, maxResults=int(max_results), showCompleted=False, showHidden=False).execute() # Ensure max_results is int
-        tasks = results.get('items', [])
+        default_list = tasks_store.default_list()
+        if not default_list: return "Authentification Google requise pour Tasks. Veuillez autoriser via /authorize_google."
+        tasklist_id, tasklist_title = default_list
+        tasks = tasks_store.active_tasks(tasklist_id, limit=int(max_results)) # Copie locale, synchro incrémentale si périmée
         if not tasks: return f"Aucune tâche active trouvée dans la liste '{tasklist_title}'."
         task_list_details = f"Voici vos tâches actives de la liste '{tasklist_title}' :\n"
         for task in tasks:
@@ -818,7 +645,7 @@ def list_google_tasks(max_results=10): # Added default value
         error_content = error.content.decode('utf-8') if error.content else "Aucun détail."
         print(f"Erreur API Tasks (lecture): {error.resp.status} - {error.resp.reason} - {error_content}")
         if error.resp.status == 401 or 'invalid_grant' in str(error).lower():
-            if os.path.exists(TOKEN_PICKLE_FILE): os.remove(TOKEN_PICKLE_FILE)
+            google_credential_manager.invalidate()
             return "Identifiants Tasks invalides/révoqués. Réauthentifiez-vous."
         return f"Erreur lors de l'accès à Tasks ({error.resp.status}): {error_content}"
     except Exception as e:
@@ -826,9 +653,9 @@ def list_google_tasks(max_results=10): # Added default value
         traceback.print_exc()
         return f"Erreur inattendue lors de l'accès à Tasks: {type(e).__name__}"
 
-def find_event_id(service, summary_hint, start_dt_obj, original_datetime_str):
+def find_event_id(summary_hint, start_dt_obj, original_datetime_str):
     """
-    Trouve l'ID d'un événement.
+    Trouve l'ID d'un événement dans la copie locale de l'agenda (index d'intervalles).
     Si une heure est spécifiée, la recherche est précise.
     Sinon, la recherche s'étend sur toute la journée.
     Retourne un tuple (status, data) où status peut être 'success', 'not_found', ou 'multiple_found'.
@@ -836,26 +663,19 @@ def find_event_id(service, summary_hint, start_dt_obj, original_datetime_str):
     summary_hint_lower = summary_hint.lower()
     
     # Déterminer si la recherche doit être sur toute la journée ou à une heure précise
-    is_date_only_query = 'h' not in original_datetime_str.lower()
-
-    if is_date_only_query:
-        # Fenêtre de recherche pour la journée entière (en UTC)
-        time_min = start_dt_obj.replace(hour=0, minute=0, second=0).astimezone(datetime.timezone.utc).isoformat()
-        time_max = start_dt_obj.replace(hour=23, minute=59, second=59).astimezone(datetime.timezone.utc).isoformat()
-    else:
-        # Fenêtre de recherche précise de +/- 30 minutes autour de l'heure donnée
-        time_min = (start_dt_obj - datetime.timedelta(minutes=30)).astimezone(datetime.timezone.utc).isoformat()
-        time_max = (start_dt_obj + datetime.timedelta(minutes=30)).astimezone(datetime.timezone.utc).isoformat()
+    is_date_only_query = french_datetime.is_date_only(original_datetime_str)
 
     try:
-        events_result = service.events().list(
-            calendarId='primary', timeMin=time_min, timeMax=time_max,
-            singleEvents=True, orderBy='startTime'
-        ).execute()
-        events = events_result.get('items', [])
+        calendar_store.ensure_fresh()
+        if is_date_only_query:
+            # Fenêtre de recherche pour la journée entière (heure de Paris)
+            entries = calendar_store.on_day(start_dt_obj.date())
+        else:
+            # Fenêtre de recherche précise de +/- 30 minutes autour de l'heure donnée
+            entries = calendar_store.overlapping(start_dt_obj - datetime.timedelta(minutes=30), start_dt_obj + datetime.timedelta(minutes=30))
         
         # Filtrer par le titre
-        matching_events = [event for event in events if summary_hint_lower in event.get('summary', '').lower()]
+        matching_events = [entry.event for entry in entries if summary_hint_lower in entry.summary_lower]
         
         if len(matching_events) == 0:
             return 'not_found', None
@@ -879,9 +699,9 @@ def delete_calendar_event(summary, datetime_str):
     if not start_dt_obj: return f"Date '{datetime_str}' non comprise."
 
     try:
-        service = build('calendar', 'v3', credentials=creds)
+        service = google_services.get_service('calendar', 'v3', credentials=creds)
         # On passe maintenant la chaîne de caractères originale pour analyse
-        status, data = find_event_id(service, summary, start_dt_obj, datetime_str)
+        status, data = find_event_id(summary, start_dt_obj, datetime_str)
         
         if status == 'not_found':
             return f"Événement '{summary}' non trouvé pour le {start_dt_obj.strftime('%d %B %Y')}."
@@ -901,6 +721,7 @@ def delete_calendar_event(summary, datetime_str):
         if status == 'success':
             event_id = data
             service.events().delete(calendarId='primary', eventId=event_id).execute()
+            calendar_store.remove(event_id)
             return f"Événement '{summary}' supprimé avec succès."
             
     except Exception as e:
@@ -920,10 +741,10 @@ def update_calendar_event(old_summary, old_datetime_str, new_summary, new_dateti
         return "Veuillez spécifier un nouveau titre ou une nouvelle date/heure pour la modification."
 
     try:
-        service = build('calendar', 'v3', credentials=creds)
+        service = google_services.get_service('calendar', 'v3', credentials=creds)
         
         # APPEL CORRIGÉ : On passe maintenant old_datetime_str comme 4ème argument
-        status, data = find_event_id(service, old_summary, old_start_dt, old_datetime_str)
+        status, data = find_event_id(old_summary, old_start_dt, old_datetime_str)
         
         # GESTION DES ERREURS : On gère les différents retours de find_event_id
         if status == 'not_found':
@@ -938,7 +759,7 @@ def update_calendar_event(old_summary, old_datetime_str, new_summary, new_dateti
         if status == 'success':
             event_id = data
             # On récupère l'événement à modifier
-            event = service.events().get(calendarId='primary', eventId=event_id).execute()
+            event = calendar_store.get(event_id) or service.events().get(calendarId='primary', eventId=event_id).execute()
             
             if new_summary:
                 event['summary'] = new_summary
@@ -956,41 +777,55 @@ def update_calendar_event(old_summary, old_datetime_str, new_summary, new_dateti
                 event['end']['dateTime'] = (new_start_dt + duration).isoformat()
 
             updated_event = service.events().update(calendarId='primary', eventId=event_id, body=event).execute()
+            calendar_store.upsert(updated_event)
             return f"Événement mis à jour : '{updated_event.get('summary', 'Sans titre')}'."
 
     except Exception as e:
         traceback.print_exc()
         return f"Erreur lors de la mise à jour de l'événement : {e}"
 
-def find_task_id(service, task_title):
-    """Trouve l'ID d'une tâche par son titre exact (insensible à la casse)."""
+def find_task_id(task_title):
+    """Trouve l'ID d'une tâche active par son titre exact (insensible à la casse), via l'index de tasks_store."""
     try:
-        tasklists = service.tasklists().list().execute().get('items', [])
-        if not tasklists: return None, None
-        
-        for tasklist in tasklists:
-            tasks = service.tasks().list(tasklist=tasklist['id'], showCompleted=False).execute().get('items', [])
-            for task in tasks:
-                if task.get('title', '').lower() == task_title.lower():
-                    return task['id'], tasklist['id']
-        return None, None
+        return tasks_store.find(task_title)
     except Exception as e:
         print(f"Erreur lors de la recherche de l'ID de la tâche : {e}")
         return None, None
 
+def _task_gone(error):
+    return isinstance(error, HttpError) and error.resp.status in (404, 410)
+
+def _call_on_task(title, call):
+    """
+    Appelle call(task_id, tasklist_id) sur la tâche trouvée dans l'index local. Si elle a disparu
+    entre-temps (404), l'index est resynchronisé et l'appel réessayé une fois.
+    Retourne (résultat, task_id, tasklist_id), ou (None, None, None) si la tâche est introuvable.
+    """
+    for attempt in range(2):
+        task_id, tasklist_id = find_task_id(title)
+        if not task_id:
+            return None, None, None
+        try:
+            return call(task_id, tasklist_id), task_id, tasklist_id
+        except HttpError as error:
+            if not _task_gone(error) or attempt:
+                raise
+            tasks_store.mark_stale(task_id)
+    return None, None, None
+
 def delete_google_task(title):
     """Supprime une tâche de Google Tasks."""
     creds = get_google_credentials()
     if not creds: return "Authentification Google requise."
     
     try:
-        service = build('tasks', 'v1', credentials=creds)
-        task_id, tasklist_id = find_task_id(service, title)
+        service = google_services.get_service('tasks', 'v1', credentials=creds)
+        _, task_id, _ = _call_on_task(title, lambda task_id, tasklist_id: service.tasks().delete(tasklist=tasklist_id, task=task_id).execute())
         
         if not task_id:
             return f"Tâche '{title}' non trouvée dans les listes actives."
             
-        service.tasks().delete(tasklist=tasklist_id, task=task_id).execute()
+        tasks_store.remove(task_id)
         return f"Tâche '{title}' supprimée."
     except Exception as e:
         traceback.print_exc()
@@ -1002,20 +837,130 @@ def update_google_task(old_title, new_title):
     if not creds: return "Authentification Google requise."
 
     try:
-        service = build('tasks', 'v1', credentials=creds)
-        task_id, tasklist_id = find_task_id(service, old_title)
+        service = google_services.get_service('tasks', 'v1', credentials=creds)
+        # Utiliser patch est plus efficace car il n'envoie que les champs modifiés
+        updated_task, task_id, tasklist_id = _call_on_task(old_title, lambda task_id, tasklist_id: service.tasks().patch(
+            tasklist=tasklist_id, task=task_id, body={'id': task_id, 'title': new_title}).execute())
         
         if not task_id:
             return f"Tâche '{old_title}' non trouvée."
             
-        task_body = {'id': task_id, 'title': new_title}
-        # Utiliser patch est plus efficace car il n'envoie que les champs modifiés
-        updated_task = service.tasks().patch(tasklist=tasklist_id, task=task_id, body=task_body).execute()
+        tasks_store.upsert(updated_task, tasklist_id)
         return f"Tâche renommée en '{updated_task['title']}'."
     except Exception as e:
         traceback.print_exc()
         return f"Erreur lors de la mise à jour de la tâche : {e}"    
 
+# --- Opérations groupées sur les tâches (une seule requête batch HTTP) ---
+def _task_titles(value):
+    """Titre ou liste de titres (entités Gemini) -> liste sans doublon ni titre vide."""
+    if isinstance(value, str):
+        value = [value]
+    return list(dict.fromkeys(title.strip() for title in value or [] if isinstance(title, str) and title.strip()))
+
+def _bulk_task_report(header, titles, failures):
+    """Résultat par élément, une ligne '✔ titre' ou '✘ titre : raison' (affiché dans le panneau Tâches)."""
+    lines = [header]
+    for title in titles:
+        lines.append(f"✘ {title} : {failures[title]}" if title in failures else f"✔ {title}")
+    return "\n".join(lines)
+
+def _batch_error_reason(exception):
+    if isinstance(exception, HttpError):
+        return f"erreur {exception.resp.status} ({exception.resp.reason})"
+    return f"erreur {type(exception).__name__}"
+
+def _bulk_task_http_error(error, operation):
+    error_content = error.content.decode('utf-8') if error.content else "Aucun détail."
+    print(f"Erreur API Tasks ({operation} groupée): {error.resp.status} - {error.resp.reason} - {error_content}")
+    if error.resp.status == 401 or 'invalid_grant' in str(error).lower():
+        google_credential_manager.invalidate()
+        return "Identifiants Tasks invalides/révoqués. Réauthentifiez-vous."
+    return f"Erreur lors de l'opération groupée sur les tâches ({error.resp.status}): {error_content}."
+
+def create_google_tasks(titles, notes=None):
+    """Crée plusieurs tâches dans la liste par défaut en une seule requête batch."""
+    creds = get_google_credentials()
+    if not creds: return "Authentification Google requise pour créer des tâches. Veuillez autoriser via /authorize_google."
+    titles = _task_titles(titles)
+    if not titles: return "Le titre de la tâche ne peut pas être vide."
+    try:
+        service = google_services.get_service('tasks', 'v1', credentials=creds)
+        default_list = tasks_store.default_list()
+        if not default_list:
+            return "Authentification Google requise pour créer des tâches. Veuillez autoriser via /authorize_google."
+        tasklist_id, tasklist_title = default_list
+
+        def insert_request(title):
+            body = {'title': title}
+            if notes and notes.strip(): body['notes'] = notes
+            return lambda: service.tasks().insert(tasklist=tasklist_id, body=body)
+
+        # Les request_id sont des index : un titre peut contenir des caractères refusés dans un en-tête MIME
+        results, errors = google_batch.execute(service, {str(i): insert_request(title) for i, title in enumerate(titles)})
+        failures = {titles[int(i)]: _batch_error_reason(exception) for i, exception in errors.items()}
+        for created_task in results.values():
+            tasks_store.upsert(created_task, tasklist_id)
+        return _bulk_task_report(f"{len(results)} tâche(s) sur {len(titles)} ajoutée(s) à la liste '{tasklist_title}' :", titles, failures)
+    except HttpError as error:
+        return _bulk_task_http_error(error, "création")
+    except Exception as e:
+        print(f"Erreur inattendue lors de la création groupée de tâches (Tasks): {e}")
+        traceback.print_exc()
+        return f"Erreur inattendue lors de la création des tâches: {type(e).__name__}"
+
+def _apply_to_google_tasks(titles, operation):
+    """Termine (operation='complete') ou supprime (operation='delete') plusieurs tâches en une requête batch."""
+    creds = get_google_credentials()
+    if not creds: return "Authentification Google requise."
+    titles = _task_titles(titles)
+    if not titles: return "Quelles tâches sont concernées ?"
+    try:
+        service = google_services.get_service('tasks', 'v1', credentials=creds)
+
+        def request(task_id, tasklist_id):
+            if operation == "complete":
+                return lambda: service.tasks().patch(tasklist=tasklist_id, task=task_id, body={'status': 'completed'})
+            return lambda: service.tasks().delete(tasklist=tasklist_id, task=task_id)
+
+        failures, pending = {}, titles
+        for attempt in range(2):
+            targets = {}
+            for title in pending:
+                task_id, tasklist_id = find_task_id(title) # Index local : aucun appel API par titre
+                if task_id:
+                    targets[str(len(targets))] = (title, task_id, tasklist_id)
+                else:
+                    failures[title] = "non trouvée dans les listes actives"
+            results, errors = {}, {}
+            if targets:
+                results, errors = google_batch.execute(service, {i: request(task_id, tasklist_id) for i, (_, task_id, tasklist_id) in targets.items()})
+            pending = []
+            for i, (title, task_id, _) in targets.items():
+                if i in errors and _task_gone(errors[i]) and attempt == 0:
+                    # Disparue depuis la dernière synchro : index resynchronisé, nouvel essai dans un second batch
+                    tasks_store.mark_stale(task_id)
+                    pending.append(title)
+                elif i in errors:
+                    failures[title] = _batch_error_reason(errors[i])
+                else:
+                    tasks_store.remove(task_id) # Terminée ou supprimée : plus active
+            if not pending:
+                break
+        verb = "terminée(s)" if operation == "complete" else "supprimée(s)"
+        return _bulk_task_report(f"{len(titles) - len(failures)} tâche(s) sur {len(titles)} {verb} :", titles, failures)
+    except HttpError as error:
+        return _bulk_task_http_error(error, "complétion" if operation == "complete" else "suppression")
+    except Exception as e:
+        traceback.print_exc()
+        return f"Erreur lors de l'opération groupée sur les tâches : {e}"
+
+def complete_google_tasks(titles):
+    return _apply_to_google_tasks(titles, "complete")
+
+def delete_google_tasks(titles):
+    return _apply_to_google_tasks(titles, "delete")
+
 # --- Fonctions Google Maps et Recherche Web ---
 def get_directions_from_google_maps_api(origin, destination):
     global google_maps_api_key
@@ -1081,10 +1026,24 @@ def get_directions_from_google_maps_api(origin, destination):
         }
 
 
+def _custom_search_items(query, num_results):
+    """Appel à Custom Search ; seuls les champs utilisés sont gardés (ce sont eux qui vont en cache)."""
+    service = google_services.get_service("customsearch", "v1", developer_key=google_custom_search_api_key)
+    results = service.cse().list(
+        q=query,
+        cx=google_custom_search_cx,
+        num=num_results,
+        hl='fr',
+        gl='fr'
+    ).execute()
+    return [{field: item[field] for field in ('title', 'snippet', 'link', 'displayLink') if field in item}
+            for item in results.get('items', [])]
+
 def _perform_raw_web_search(query, num_results=6):
     """
     Effectue une recherche web BRUTE et retourne les résultats non traités.
     C'est une fonction interne appelée par handle_web_search.
+    Les résultats passent par search_cache (TTL, quota quotidien, requêtes simultanées partagées).
     Retourne un dictionnaire avec les résultats bruts.
     """
     global google_custom_search_available, google_custom_search_api_key, google_custom_search_cx
@@ -1092,19 +1051,13 @@ def _perform_raw_web_search(query, num_results=6):
         return {"raw_results": "Service de recherche web Google Custom Search non configuré.", "top_source_name": "N/A"}
 
     try:
-        service = build("customsearch", "v1", developerKey=google_custom_search_api_key)
         num_results_api = min(num_results, 10)
-        results = service.cse().list(
-            q=query,
-            cx=google_custom_search_cx,
-            num=num_results_api,
-            hl='fr',
-            gl='fr'
-        ).execute()
-
-        search_items = results.get('items', [])
+        search_items, origin = search_cache.get_or_fetch(
+            query, "fr-FR", num_results_api, lambda: _custom_search_items(query, num_results_api))
+        if origin != "miss":
+            print(f"INFO [web_search]: Résultats de '{query}' servis par le cache ({origin}).")
         if not search_items:
-            return {"raw_results": f"Aucun résultat pertinent trouvé pour '{query}'.", "top_source_name": "N/A"}
+            return {"raw_results": f"Aucun résultat pertinent trouvé pour '{query}'.", "top_source_name": "N/A", "items": []}
 
         # Formatage des résultats bruts pour le panel
         summary_details_text = f"Résultats web bruts pour '{query}':\n\n"
@@ -1117,17 +1070,46 @@ def _perform_raw_web_search(query, num_results=6):
             summary_details_text += f"   Source: {link}\n\n"
         
         top_source_name = search_items[0].get('displayLink', "Source inconnue")
-        return {"raw_results": summary_details_text.strip(), "top_source_name": top_source_name}
-
+        return {"raw_results": summary_details_text.strip(), "top_source_name": top_source_name, "items": search_items}
+
+    except QuotaExceeded as e:
+        print(f"AVERTISSEMENT [web_search]: {e}")
+        return {"raw_results": "Erreur : quota quotidien de recherche web atteint, réessayez demain.", "top_source_name": "N/A"}
+    except HttpError as e:
+        if e.resp.status == 429:
+            search_cache.exhaust_quota()
+            return {"raw_results": "Erreur : quota de recherche web Google épuisé, réessayez plus tard.", "top_source_name": "N/A"}
+        print(f"Erreur HTTP lors de la recherche web brute: {e}")
+        return {"raw_results": f"Erreur lors de la recherche web (HTTP {e.resp.status}).", "top_source_name": "Erreur"}
     except Exception as e:
         print(f"Erreur inattendue lors de la recherche web brute: {e}")
         traceback.print_exc()
         return {"raw_results": f"Erreur inattendue lors de la recherche web: {type(e).__name__}", "top_source_name": "Erreur"}
 
+DEEP_READ_MAX_BYTES = 2 * 1024 * 1024 # Au-delà, la page est tronquée (le début suffit au résumé)
+
+def _fetch_page_text(url, deadline):
+    """Main text of an HTML result page for the deep web search; gives up at `deadline` (time.monotonic())."""
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        return ""
+    with http_client.stream(url, timeout=(min(remaining, 3.0), remaining), deadline=deadline) as response:
+        response.raise_for_status()
+        if 'html' not in response.headers.get('content-type', '').lower():
+            return ""
+        body = bytearray()
+        for chunk in response.iter_content(64 * 1024):
+            body.extend(chunk)
+            if len(body) > DEEP_READ_MAX_BYTES or time.monotonic() > deadline:
+                break
+    return extract_main_text(bytes(body))
+
 def handle_web_search(entities):
     """
     Orchestre la recherche web et la synthèse de la réponse.
     Appelle la recherche brute, puis envoie les résultats à Gemini pour la synthèse.
+    En mode approfondi (`deep`), les premières pages de résultats sont lues en parallèle
+    (voir web_digest.py) et leur contenu condensé est ajouté au prompt de synthèse.
     """
     query = entities.get("query")
     if not query:
@@ -1141,15 +1123,29 @@ def handle_web_search(entities):
     if "Erreur" in raw_search_results or "Aucun résultat" in raw_search_results or "non configuré" in raw_search_results:
         return {"synthesized_answer": raw_search_results, "raw_results": raw_search_results, "top_source_name": "N/A"}
 
+    # 1 bis. Lecture approfondie des meilleures pages, dans un budget de temps global
+    pages_digest = ""
+    deep = entities.get("deep") in (True, "true", "oui", 1)
+    if deep and url_processing_available:
+        items = search_result_dict.get("items", [])[:web_digest.DEEP_PAGES]
+        pages = web_digest.read_pages([item["link"] for item in items if item.get("link")], _fetch_page_text)
+        pages_digest = web_digest.build_digest(items, pages)
+        raw_search_results += f"\n\n(Lecture approfondie : {len(pages)} page(s) lue(s) sur {len(items)}.)"
+
     # 2. Préparer un prompt pour la synthèse
     synthesis_prompt = (
         f"En te basant EXCLUSIVEMENT sur les résultats de recherche suivants pour la question de l'utilisateur \"{query}\", "
         "fournis une réponse directe et concise. Ne mentionne pas que tu te bases sur des résultats de recherche, "
         "énonce simplement le fait comme si tu le savais. Ignore tes connaissances antérieures.\n\n"
         "--- RÉSULTATS DE RECHERCHE ---\n"
-        f"{raw_search_results}\n\n"
-        "--- TA RÉPONSE SYNTHÉTISÉE ---\n"
+        f"{search_result_dict.get('raw_results')}\n\n"
     )
+    if pages_digest:
+        synthesis_prompt += (
+            "--- CONTENU DES PAGES (numérotées comme les résultats) ---\n"
+            f"{pages_digest}\n\n"
+        )
+    synthesis_prompt += "--- TA RÉPONSE SYNTHÉTISÉE ---\n"
 
     # 3. Envoyer le prompt de synthèse à Gemini
     try:
@@ -1305,33 +1301,88 @@ def handle_create_calendar_event(entities):
             return f"Je n'ai pas pu interpréter la date et l'heure '{datetime_str}'. Pouvez-vous reformuler plus clairement (ex: '15 juin à 14h30') ?"
     return "Pour créer un événement, j'ai besoin d'un titre et d'une date/heure (ex: 'Réunion projet demain à 10h')."
 
+_DURATION_RE = re.compile(r"(?:(\d+)\s*h(?:eures?)?)?\s*(?:(\d+)\s*(?:min(?:utes?)?)?)?", re.IGNORECASE)
+
+def _duration_minutes(value, default=30):
+    """Durée en minutes d'une entité Gemini : 45, "45", "30 minutes", "1h", "1h30" ; `default` si absente ou illisible."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return int(value) if value > 0 else default
+    match = _DURATION_RE.fullmatch(str(value or "").strip())
+    if not match or not any(match.groups()):
+        return default
+    minutes = int(match.group(1) or 0) * 60 + int(match.group(2) or 0)
+    return minutes or default
+
+def handle_check_availability(entities):
+    """Répond à « suis-je libre ... ? » et propose des créneaux libres, tous agendas confondus."""
+    creds = get_google_credentials()
+    if not creds:
+        return "Authentification Google requise. Veuillez autoriser via /authorize_google."
+
+    start_str = entities.get("start_datetime_str")
+    end_str = entities.get("end_datetime_str")
+    duration_minutes = _duration_minutes(entities.get("duration_minutes"))
+    if not start_str:
+        return "Pour vérifier vos disponibilités, indiquez un jour ou un créneau (ex: 'jeudi de 14h à 18h')."
+
+    start_dt = parse_french_datetime(start_str)
+    if not start_dt:
+        return f"Je n'ai pas compris la date/heure '{start_str}'."
+    period = french_datetime.period_window(start_str)
+    if period:
+        # Moment de la journée (« jeudi après-midi ») : sa plage horaire
+        start_dt = start_dt.replace(hour=period[0], minute=0)
+        end_dt = start_dt.replace(hour=period[1])
+    elif french_datetime.is_date_only(start_str):
+        # Journée entière : on regarde les heures ouvrées
+        start_dt = start_dt.replace(hour=freebusy.WORKDAY_START_HOUR, minute=0)
+        end_dt = start_dt.replace(hour=freebusy.WORKDAY_END_HOUR)
+    elif end_str:
+        end_dt = parse_french_datetime(end_str)
+        if not end_dt:
+            return f"Je n'ai pas compris la date/heure de fin '{end_str}'."
+        if french_datetime.is_time_only(end_str): # Heure seule ('18h') : même jour que le début
+            end_dt = datetime.datetime.combine(start_dt.date(), end_dt.time())
+    else:
+        end_dt = start_dt + datetime.timedelta(minutes=max(duration_minutes, 60))
+    if end_dt <= start_dt:
+        return "La fin du créneau doit être après son début."
+
+    try:
+        busy = free_busy.busy(start_dt, end_dt)
+        window_desc = f"le {start_dt.strftime('%d %B')} entre {start_dt.strftime('%Hh%M')} et {end_dt.strftime('%Hh%M')}"
+        if not busy:
+            return f"Vous êtes libre {window_desc}."
+
+        busy_desc = ", ".join(f"{b_start.strftime('%Hh%M')}-{b_end.strftime('%Hh%M')}" for b_start, b_end in busy)
+        slots = freebusy.free_slots(busy, start_dt.replace(tzinfo=PARIS_TZ), end_dt.replace(tzinfo=PARIS_TZ), min_duration=datetime.timedelta(minutes=duration_minutes))
+        response_text = f"Vous êtes occupé {window_desc} ({busy_desc})."
+        if slots:
+            response_text += " Créneaux libres : " + ", ".join(f"{s_start.strftime('%Hh%M')}-{s_end.strftime('%Hh%M')}" for s_start, s_end in slots[:5]) + "."
+        else:
+            response_text += f" Aucun créneau libre d'au moins {duration_minutes} minutes sur cette période."
+        return response_text
+    except HttpError as error:
+        error_content = error.content.decode('utf-8') if error.content else "Aucun détail d'erreur."
+        print(f"Erreur API Calendar (disponibilités): Status={error.resp.status}, Raison={error.resp.reason}, Détails={error_content}")
+        if error.resp.status == 401 or 'invalid_grant' in str(error).lower():
+            google_credential_manager.invalidate()
+            return "Identifiants Calendar invalides/révoqués. Réauthentifiez-vous."
+        return f"Erreur lors de la vérification des disponibilités ({error.resp.status}): {error_content}"
+    except Exception as e:
+        print(f"Erreur inattendue Calendar (disponibilités): {e}")
+        traceback.print_exc()
+        return f"Erreur inattendue lors de la vérification des disponibilités: {type(e).__name__}"
+
 def handle_list_calendar_events(entities):
     creds = get_google_credentials()
     if not creds:
         return "Authentification Google requise. Veuillez autoriser via /authorize_google."
 
     try:
-        service = build('calendar', 'v3', credentials=creds)
-        now_utc_dt = datetime.datetime.utcnow()
-
-        # Determine Paris timezone offset (simplified)
-        is_dst = time.localtime().tm_isdst > 0
-        paris_tz_offset_hours = 2 if is_dst else 1
-        # paris_tz = datetime.timezone(datetime.timedelta(hours=paris_tz_offset_hours)) # Not directly used for API call min/max
-
-        # Time range for the query (e.g., next 90 days from now)
-        time_min_utc_iso = now_utc_dt.isoformat() + 'Z' # 'Z' indicates UTC
-        time_max_utc_iso = (now_utc_dt + datetime.timedelta(days=90)).isoformat() + 'Z'
-
-        events_result = service.events().list(
-            calendarId='primary',
-            timeMin=time_min_utc_iso,
-            timeMax=time_max_utc_iso, # Look ahead 90 days
-            maxResults=250, # Get a decent number of events if many exist
-            singleEvents=True,
-            orderBy='startTime'
-        ).execute()
-        all_events = events_result.get('items', [])
+        # Lecture depuis la copie locale : au plus une synchro incrémentale (syncToken) si elle n'est plus fraîche
+        calendar_store.ensure_fresh()
+        all_events = calendar_store.upcoming(days=90, limit=250)
 
         if not all_events:
             return "Aucun événement à venir trouvé dans les 90 prochains jours."
@@ -1351,62 +1402,16 @@ def handle_list_calendar_events(entities):
         filtered_events = []
 
         if event_summary_hint or parsed_specific_datetime_naive_local:
-            for event in all_events:
-                summary_match = False
-                datetime_match = False
-                event_summary_lower = event.get('summary', '').lower()
-
-                # Check for summary match
-                if event_summary_hint and event_summary_hint in event_summary_lower:
-                    summary_match = True
-
-                # Check for datetime match
-                if parsed_specific_datetime_naive_local:
-                    event_start_str = event['start'].get('dateTime', event['start'].get('date'))
-                    event_end_str = event['end'].get('dateTime', event['end'].get('date'))
-                    try:
-                        # Convert event start/end to naive local Paris time for comparison
-                        # Google API returns 'dateTime' in RFC3339 format (often UTC or with offset)
-                        # and 'date' for all-day events.
-
-                        # Determine event start time (UTC, then convert to Paris local naive)
-                        if 'Z' in event_start_str: event_start_utc = datetime.datetime.fromisoformat(event_start_str.replace('Z', '+00:00'))
-                        elif '+' in event_start_str[10:] or '-' in event_start_str[10:]: event_start_utc = datetime.datetime.fromisoformat(event_start_str) # Already has offset
-                        elif 'T' in event_start_str: event_start_utc = datetime.datetime.fromisoformat(event_start_str).replace(tzinfo=datetime.timezone.utc) # Assume UTC if no offset
-                        else: event_start_utc = datetime.datetime.strptime(event_start_str, "%Y-%m-%d").replace(tzinfo=datetime.timezone.utc) # All-day event
-
-                        # Determine event end time (UTC, then convert to Paris local naive)
-                        if 'Z' in event_end_str: event_end_utc = datetime.datetime.fromisoformat(event_end_str.replace('Z', '+00:00'))
-                        elif '+' in event_end_str[10:] or '-' in event_end_str[10:]: event_end_utc = datetime.datetime.fromisoformat(event_end_str)
-                        elif 'T' in event_end_str: event_end_utc = datetime.datetime.fromisoformat(event_end_str).replace(tzinfo=datetime.timezone.utc)
-                        else: event_end_utc = (datetime.datetime.strptime(event_end_str, "%Y-%m-%d") + datetime.timedelta(days=1)).replace(tzinfo=datetime.timezone.utc) # All-day events end at midnight next day
-
-                        event_start_local_paris_naive = event_start_utc.astimezone(datetime.timezone(datetime.timedelta(hours=paris_tz_offset_hours))).replace(tzinfo=None)
-                        event_end_local_paris_naive = event_end_utc.astimezone(datetime.timezone(datetime.timedelta(hours=paris_tz_offset_hours))).replace(tzinfo=None)
-
-                        # If the query was for a specific date (without time), match if event occurs on that day
-                        query_is_date_only = parsed_specific_datetime_naive_local.time() == datetime.time(0,0) and not (specific_datetime_str and 'h' in specific_datetime_str.lower())
-
-                        if query_is_date_only:
-                            # Event starts on or before the query date AND ends on or after the query date
-                            if event_start_local_paris_naive.date() <= parsed_specific_datetime_naive_local.date() < event_end_local_paris_naive.date():
-                                datetime_match = True
-                        else: # Query includes a specific time
-                            # Event is ongoing at the queried datetime
-                            if event_start_local_paris_naive <= parsed_specific_datetime_naive_local < event_end_local_paris_naive:
-                                datetime_match = True
-                            # Or event starts exactly at the queried datetime (for very short events or precise queries)
-                            elif event_start_local_paris_naive == parsed_specific_datetime_naive_local:
-                                datetime_match = True
-                    except ValueError as ve:
-                        print(f"Error parsing event date for filtering: {ve} for event {event.get('summary')}")
-                        continue # Skip this event if its date format is problematic
-
-                # Combine matches based on what filters were provided
-                if event_summary_hint and parsed_specific_datetime_naive_local:
-                    if summary_match and datetime_match: filtered_events.append(event)
-                elif event_summary_hint and summary_match: filtered_events.append(event)
-                elif parsed_specific_datetime_naive_local and datetime_match: filtered_events.append(event)
+            if parsed_specific_datetime_naive_local:
+                # If the query was for a specific date (without time), match if event occurs on that day
+                if french_datetime.is_date_only(specific_datetime_str):
+                    candidates = calendar_store.on_day(parsed_specific_datetime_naive_local.date())
+                else: # Query includes a specific time: event ongoing at (or starting exactly at) that instant
+                    candidates = calendar_store.overlapping(parsed_specific_datetime_naive_local)
+            else:
+                now_paris = datetime.datetime.now(PARIS_TZ)
+                candidates = calendar_store.overlapping(now_paris, now_paris + datetime.timedelta(days=90))
+            filtered_events = [entry.event for entry in candidates if not event_summary_hint or event_summary_hint in entry.summary_lower]
 
             # Prepare response based on filtered events
             if not filtered_events:
@@ -1414,7 +1419,7 @@ def handle_list_calendar_events(entities):
                 if event_summary_hint: response_text += f"'{entities.get('event_summary_hint')}'"
                 if event_summary_hint and parsed_specific_datetime_naive_local: response_text += " pour "
                 if parsed_specific_datetime_naive_local:
-                    is_specific_time_query = specific_datetime_str and 'h' in specific_datetime_str.lower()
+                    is_specific_time_query = not french_datetime.is_date_only(specific_datetime_str)
                     time_format = "%d %B %Y à %Hh%M" if is_specific_time_query else "%d %B %Y"
                     response_text += f"le {parsed_specific_datetime_naive_local.strftime(time_format)}"
                 response_text += "."
@@ -1443,7 +1448,7 @@ def handle_list_calendar_events(entities):
         error_content = error.content.decode('utf-8') if error.content else "Aucun détail d'erreur."
         print(f"Erreur API Calendar (liste événements): Status={error.resp.status}, Raison={error.resp.reason}, Détails={error_content}")
         if error.resp.status == 401 or 'invalid_grant' in str(error).lower():
-            if os.path.exists(TOKEN_PICKLE_FILE): os.remove(TOKEN_PICKLE_FILE)
+            google_credential_manager.invalidate()
             return "Identifiants Calendar invalides/révoqués. Réauthentifiez-vous."
         return f"Erreur lors de la récupération des événements ({error.resp.status}): {error_content}"
     except Exception as e:
@@ -1463,32 +1468,48 @@ def handle_get_contact_emails(entities):
     contact_identifier = entities.get("contact_identifier")
     retrieve_mode = entities.get("retrieve_mode", "summary") # Default to summary
     subject_filter = entities.get("subject_filter")
+    search_text = entities.get("search_text") # Mots recherchés dans le sujet ou le corps
+    date_from = entities.get("date_from") # AAAA-MM-JJ inclus
+    date_to = entities.get("date_to") # AAAA-MM-JJ inclus
     max_summaries = int(entities.get("max_summaries", 5))
 
     if not contact_identifier:
         return "Veuillez spécifier un nom de contact ou une adresse e-mail."
 
+    try:
+        after_dt = datetime.datetime.strptime(date_from, "%Y-%m-%d") if date_from else None
+        before_dt = datetime.datetime.strptime(date_to, "%Y-%m-%d") + datetime.timedelta(days=1) if date_to else None
+    except ValueError:
+        return "Format de date invalide pour la recherche d'emails (attendu : AAAA-MM-JJ)."
+
     contact_email, contact_display_name = None, contact_identifier
     if "@" not in contact_identifier: # Assume it's a name, try to find in address book
-        email_from_book, display_name_from_book = get_contact_email(contact_identifier)
-        if email_from_book:
-            contact_email = email_from_book
-            contact_display_name = display_name_from_book # Use the display name from book
+        contact, confirmation = resolve_contact(contact_identifier)
+        if contact:
+            contact_email = contact["email"]
+            contact_display_name = contact["display_name"] # Use the display name from book
+        elif confirmation:
+            return confirmation
         else:
             return f"Contact '{contact_identifier}' non trouvé dans le carnet d'adresses. Veuillez fournir une adresse e-mail."
     else: # It's an email address
         contact_email = contact_identifier
         # Try to find a display name for the email if it exists in contacts
-        for name_key, info in CONTACT_BOOK.items():
-            if info["email"] == contact_email:
-                contact_display_name = info["display_name"]
-                break
+        known_contact = contact_store.get_by_email(contact_email)
+        if known_contact:
+            contact_display_name = known_contact["display_name"]
 
     try:
-        service = build('gmail', 'v1', credentials=creds)
+        service = google_services.get_service('gmail', 'v1', credentials=creds)
         query_parts = [f"from:{contact_email}"]
         if subject_filter:
             query_parts.append(f"subject:({subject_filter})") # Use parentheses for multi-word subjects
+        if search_text:
+            query_parts.append(f"({search_text})")
+        if after_dt:
+            query_parts.append(f"after:{after_dt.strftime('%Y/%m/%d')}")
+        if before_dt:
+            query_parts.append(f"before:{before_dt.strftime('%Y/%m/%d')}")
 
         # Search in INBOX, not just UNREAD for specific contact queries
         query_parts.append("in:inbox")
@@ -1497,22 +1518,48 @@ def handle_get_contact_emails(entities):
 
         num_results_to_fetch = max_summaries if retrieve_mode == "summary" else 1
 
-        list_request = service.users().messages().list(userId='me', q=final_query, maxResults=num_results_to_fetch)
-        response = list_request.execute()
-        messages = response.get('messages', [])
+        mirror_rows, mirror_complete = [], False
+        if gmail_mirror.is_ready():
+            gmail_mirror.ensure_fresh()
+            # Index plein texte local : termes français normalisés. Le dernier e-mail est le plus récent
+            # des messages trouvés ; le résumé est classé par pertinence s'il y a des termes de recherche.
+            # Même portée que la recherche en ligne (in:inbox).
+            ranked = bool(search_text or subject_filter) and retrieve_mode != "full_last"
+            mirror_rows = gmail_mirror.search(
+                text=search_text, subject_text=subject_filter, senders=[contact_email],
+                after=after_dt, before=before_dt, label_ids=("INBOX",), limit=num_results_to_fetch, by_date=not ranked,
+            )
+            # Classement par pertinence : seul un miroir couvrant toute la période fait foi
+            mirror_complete = gmail_mirror.is_complete(after=after_dt, rows=None if ranked else mirror_rows, limit=num_results_to_fetch)
+        if mirror_complete:
+            messages = [{'id': row['id']} for row in mirror_rows]
+        else:
+            # Miroir pas encore amorcé, ou période plus ancienne que celle qu'il couvre : recherche en ligne
+            list_request = service.users().messages().list(userId='me', q=final_query, maxResults=num_results_to_fetch)
+            response = list_request.execute()
+            messages = response.get('messages', [])
 
         if not messages:
-            return f"Aucun email trouvé pour '{contact_display_name}'" + (f" avec sujet '{subject_filter}'." if subject_filter else ".")
+            filters_desc = []
+            if subject_filter: filters_desc.append(f"sujet '{subject_filter}'")
+            if search_text: filters_desc.append(f"contenant '{search_text}'")
+            if date_from or date_to: filters_desc.append(f"entre {date_from or '…'} et {date_to or '…'}")
+            return f"Aucun email trouvé pour '{contact_display_name}'" + (f" ({', '.join(filters_desc)})." if filters_desc else ".")
 
         if retrieve_mode == "full_last":
             message_id = messages[0]['id'] # Get the latest one
-            msg = service.users().messages().get(userId='me', id=message_id, format='full').execute()
-            body = get_email_body_from_payload(msg.get('payload', {}))
+            # Un message déjà lu est servi depuis le cache, sans appel API ni décodage
+            cached = email_body.cache.get(message_id)
+            if cached is None:
+                msg = service.users().messages().get(userId='me', id=message_id, format='full').execute()
+                cached = (
+                    gmail_batch.get_header(msg, 'Subject', 'Sans objet'),
+                    gmail_batch.get_header(msg, 'Date'),
+                    get_email_body_from_payload(msg.get('payload', {})),
+                )
+                email_body.cache.put(message_id, cached)
+            subject, date_str_raw, body = cached
             if body:
-                # Get subject and date for context
-                headers = msg.get('payload', {}).get('headers', [])
-                subject = next((h['value'] for h in headers if h['name'].lower() == 'subject'), 'Sans objet')
-                date_str_raw = next((h['value'] for h in headers if h['name'].lower() == 'date'), None)
                 date_formatted = "Date inconnue"
                 if date_str_raw:
                     try:
@@ -1533,11 +1580,12 @@ def handle_get_contact_emails(entities):
 
         else: # retrieve_mode == "summary"
             email_summaries = []
-            for msg_ref in messages:
-                msg = service.users().messages().get(userId='me', id=msg_ref['id'], format='metadata', metadataHeaders=['Subject', 'Date', 'From']).execute()
-                headers = msg.get('payload', {}).get('headers', [])
-                subject = next((h['value'] for h in headers if h['name'].lower() == 'subject'), 'Sans objet')
-                date_str_raw = next((h['value'] for h in headers if h['name'].lower() == 'date'), None)
+            if mirror_complete:
+                summary_headers = [(row['subject'] or 'Sans objet', row['date_header']) for row in mirror_rows]
+            else:
+                fetched = gmail_batch.fetch_messages(service, [m['id'] for m in messages], metadata_headers=['Subject', 'Date', 'From'])
+                summary_headers = [(gmail_batch.get_header(msg, 'Subject', 'Sans objet'), gmail_batch.get_header(msg, 'Date')) for msg in fetched if msg]
+            for subject, date_str_raw in summary_headers:
                 # From header might be different if it's an alias, but we queried by a specific contact_email
                 # sender_info = next((h['value'] for h in headers if h['name'].lower() == 'from'), contact_display_name)
 
@@ -1559,7 +1607,9 @@ def handle_get_contact_emails(entities):
 
             response_str = f"Emails trouvés pour '{contact_display_name}'"
             if subject_filter: response_str += f" (sujet: '{subject_filter}')"
-            response_str += f" (les {len(email_summaries)} plus récents):\n"
+            if search_text: response_str += f" (contenu: '{search_text}')"
+            ranked_by = "plus pertinents" if mirror_complete and (search_text or subject_filter) else "plus récents"
+            response_str += f" (les {len(email_summaries)} {ranked_by}):\n"
             response_str += "\n".join(email_summaries)
             return response_str
 
@@ -1567,7 +1617,7 @@ def handle_get_contact_emails(entities):
         error_content = error.content.decode('utf-8') if error.content else "Aucun détail."
         print(f"Erreur API Gmail (get_contact_emails): {error.resp.status} - {error.resp.reason} - {error_content}")
         if error.resp.status == 401 or 'invalid_grant' in str(error).lower():
-            if os.path.exists(TOKEN_PICKLE_FILE): os.remove(TOKEN_PICKLE_FILE)
+            google_credential_manager.invalidate()
             return "Identifiants Gmail invalides/révoqués. Réauthentifiez-vous."
         return f"Erreur lors de la recherche d'emails ({error.resp.status}): {error_content}"
     except Exception as e:
@@ -1595,19 +1645,26 @@ def handle_send_email(entities):
         return "Quel est le message que vous souhaitez envoyer ?"
 
     to_address = None
-    if re.match(r"[^@]+@[^@]+\.[^@]+", recipient_name_or_email):
+    if EMAIL_RE.match(recipient_name_or_email):
         to_address = recipient_name_or_email
     else:
-        to_address, _ = get_contact_email(recipient_name_or_email)
-        if not to_address:
+        contact, confirmation = resolve_contact(recipient_name_or_email)
+        if confirmation:
+            return confirmation # Plusieurs candidats : l'utilisateur précise et la commande est renvoyée
+        if not contact:
             return f"Je n'ai pas trouvé le contact '{recipient_name_or_email}' dans votre carnet d'adresses."
+        to_address = contact["email"]
 
     # Appel de la fonction send_email mise à jour avec tous les paramètres
     return send_email(to_address, subject, body, thread_id=thread_id, in_reply_to=in_reply_to, references=references)
 
 def handle_create_task(entities):
-    title = entities.get("title")
+    title = entities.get("titles") or entities.get("title")
     notes = entities.get("notes") # Optional notes
+    if isinstance(title, list):
+        if len(title) > 1:
+            return create_google_tasks(title, notes) # Liste d'éléments : un seul aller-retour
+        title = title[0] if title else None
     if title:
         return create_google_task(title, notes)
     return "Quel est le titre de la tâche que vous souhaitez ajouter ?"
@@ -1801,45 +1858,49 @@ if __name__ == '__main__':
 """
 
 # --- Handlers for new functionalities ---
-def handle_process_audio(entities):
+def handle_process_audio(entities, on_partial=None):
     """
-    Handles the 'process_audio' action. Transcribes the audio file using Whisper.
+    Handles the 'process_audio' action. Transcribes the audio using Whisper.
+    L'audio reçu par WebSocket arrive en mémoire ('audio_bytes') et n'est jamais écrit sur disque ;
+    'file_path' reste accepté pour un fichier déjà présent sur le serveur.
+    L'audio est découpé sur les silences et les segments sont transcrits en parallèle ;
+    `on_partial(index, start_s, end_s, text)` reçoit chaque segment dès qu'il est prêt.
     """
-    global whisper_available, whisper_model
+    global whisper_available, whisper_transcriber
     if not whisper_available:
         return "La fonctionnalité de transcription audio n'est pas disponible sur le serveur."
     
+    audio_bytes = entities.get("audio_bytes")
     file_path = entities.get("file_path")
     
     # Enhanced error checking
-    if not file_path:
-        print(f"ERREUR [handle_process_audio]: Action 'process_audio' appelée sans l'entité 'file_path'. Entités reçues: {entities}")
-        return "Chemin du fichier audio manquant pour la transcription."
-
-    print(f"INFO [handle_process_audio]: Tentative de transcription du fichier au chemin : {file_path}")
+    if not audio_bytes and not file_path:
+        print(f"ERREUR [handle_process_audio]: Action 'process_audio' appelée sans audio ni 'file_path'. Entités reçues: {list(entities)}")
+        return "Aucun fichier audio à transcrire. Joignez un fichier audio à votre message."
 
-    if not os.path.exists(file_path):
+    if not audio_bytes and not os.path.exists(file_path):
         print(f"ERREUR [handle_process_audio]: Le chemin du fichier n'existe pas sur le serveur: '{file_path}'")
         return f"Fichier audio non trouvé au chemin spécifié. Le chemin '{os.path.basename(file_path)}' est peut-être invalide ou le fichier a été supprimé."
     
     try:
-        print(f"INFO: [handle_process_audio] Début de la transcription pour: {file_path}")
-        result = whisper_model.transcribe(file_path, fp16=False)
-        transcribed_text = result["text"]
-        print(f"INFO: [handle_process_audio] Transcription terminée.")
-        
-        # Clean up the temporary file
-        try:
-            os.remove(file_path)
-            print(f"INFO: [handle_process_audio] Fichier temporaire supprimé: {file_path}")
-        except Exception as e:
-            print(f"AVERTISSEMENT: [handle_process_audio] Échec de la suppression du fichier temporaire {file_path}: {e}")
-            
-        return transcribed_text
+        if audio_bytes:
+            print(f"INFO: [handle_process_audio] Début de la transcription en mémoire ({len(audio_bytes)} octets).")
+            audio = transcription.decode_audio_bytes(audio_bytes) # float32 mono 16 kHz
+        else:
+            print(f"INFO: [handle_process_audio] Début de la transcription pour: {file_path}")
+            audio = transcription.load_audio(file_path)
+        segments = whisper_transcriber.transcribe(audio, on_segment=on_partial)
+        transcribed_text = transcription.stitch_segments(segments)
+        print(f"INFO: [handle_process_audio] Transcription terminée ({len(segments)} segment(s)).")
+        return transcribed_text or "Aucune parole détectée dans l'audio."
     except Exception as e:
         print(f"ERREUR: [handle_process_audio] Erreur lors de la transcription avec Whisper: {e}")
         traceback.print_exc()
         return f"Une erreur est survenue lors de la transcription de l'audio: {type(e).__name__}"
+    finally:
+        # Les fichiers déposés dans le répertoire temporaire sont supprimés même en cas d'échec
+        if file_path and os.path.dirname(os.path.abspath(file_path)) == TEMP_AUDIO_DIR:
+            cleanup_temp_file(file_path, delay=0)
 
 def handle_execute_python_code(entities):
     code_to_execute = entities.get("code")
@@ -1878,16 +1939,8 @@ def handle_execute_python_code(entities):
         return f"ATTENTION : L'exécution de code Python peut être risquée.\nErreur lors de l'exécution du code Python:\n{traceback.format_exc()}"
 
 def cleanup_temp_file(path, delay=2.0):
-    """Waits for a delay then deletes a file."""
-    def target():
-        time.sleep(delay)
-        try:
-            os.remove(path)
-            # print(f"INFO: Fichier temporaire de visualisation nettoyé: {path}")
-        except OSError as e:
-            print(f"ERREUR lors du nettoyage du fichier temporaire {path}: {e}")
-
-    threading.Thread(target=target).start()
+    """Schedules the deletion of a file after a delay (handled by the shared temp_reaper)."""
+    temp_reaper.schedule(path, delay)
 
 # REMPLACEZ L'ANCIENNE FONCTION PAR CELLE-CI
 def handle_generate_3d_object(entities):
@@ -1999,8 +2052,7 @@ def handle_open_youtube_video(entities):
         print(f"INFO: [YouTube] Recherche sur l'URL : {search_url}")
 
         # 2. Récupérer la page de résultats
-        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
-        response = requests.get(search_url, headers=headers, timeout=10)
+        response = http_client.get(search_url, timeout=10)
         response.raise_for_status()
 
         # 3. Parser la page pour trouver le premier lien de vidéo
@@ -2025,6 +2077,23 @@ def handle_open_youtube_video(entities):
         traceback.print_exc()
         return f"Une erreur est survenue lors de la recherche de la vidéo : {type(e).__name__}"
 
+def extract_main_text(html):
+    """Main readable text of an HTML page (navigation, scripts and styles removed)."""
+    soup = BeautifulSoup(html, 'html.parser')
+    for script_or_style in soup(["script", "style", "header", "footer", "nav", "aside"]): # Remove more non-content tags
+        script_or_style.decompose()
+
+    # Try to find main content areas
+    main_content_tags = soup.find_all(['main', 'article', 'div.content', 'div.main-content', 'div.post-body'])
+    if main_content_tags:
+        text = "\n".join(tag.get_text(separator='\n', strip=True) for tag in main_content_tags)
+    else: # Fallback to body or all text
+        body = soup.find('body')
+        text = body.get_text(separator='\n', strip=True) if body else soup.get_text(separator='\n', strip=True)
+
+    text = re.sub(r'\n\s*\n+', '\n', text) # Reduce multiple newlines effectively
+    return text.strip()
+
 def fetch_url_content_for_processing(url_to_fetch):
     """
     Fetches and extracts text content from a given URL.
@@ -2034,26 +2103,12 @@ def fetch_url_content_for_processing(url_to_fetch):
     if not url_processing_available:
         return "La fonctionnalité de traitement d'URL est désactivée car les bibliothèques requises sont manquantes."
     try:
-        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
-        response = requests.get(url_to_fetch, headers=headers, timeout=15, allow_redirects=True) # Increased timeout, allow redirects
+        response = http_client.get(url_to_fetch, timeout=15) # Redirections suivies
         response.raise_for_status()
 
         content_type = response.headers.get('content-type', '').lower()
         if 'html' in content_type:
-            soup = BeautifulSoup(response.content, 'html.parser')
-            for script_or_style in soup(["script", "style", "header", "footer", "nav", "aside"]): # Remove more non-content tags
-                script_or_style.decompose()
-
-            # Try to find main content areas
-            main_content_tags = soup.find_all(['main', 'article', 'div.content', 'div.main-content', 'div.post-body'])
-            if main_content_tags:
-                text = "\n".join(tag.get_text(separator='\n', strip=True) for tag in main_content_tags)
-            else: # Fallback to body or all text
-                body = soup.find('body')
-                text = body.get_text(separator='\n', strip=True) if body else soup.get_text(separator='\n', strip=True)
-
-            text = re.sub(r'\n\s*\n+', '\n', text) # Reduce multiple newlines effectively
-            return text.strip()
+            return extract_main_text(response.content)
         elif 'text/plain' in content_type: # Specifically check for text/plain
             return response.text.strip()
         elif 'text' in content_type: # Broader check for other text/* types
@@ -2165,6 +2220,18 @@ def handle_delete_task(entities):
         return delete_google_task(title)
     return "Quelle tâche souhaitez-vous supprimer ?"
 
+def handle_complete_tasks(entities):
+    titles = entities.get("task_titles") or entities.get("task_title")
+    if titles:
+        return complete_google_tasks(titles)
+    return "Quelles tâches souhaitez-vous marquer comme terminées ?"
+
+def handle_delete_tasks(entities):
+    titles = entities.get("task_titles") or entities.get("task_title")
+    if titles:
+        return delete_google_tasks(titles)
+    return "Quelles tâches souhaitez-vous supprimer ?"
+
 def handle_update_task(entities):
     old_title = entities.get("old_task_title")
     new_title = entities.get("new_task_title")
@@ -2264,6 +2331,7 @@ action_dispatcher = {
     "list_calendar_events": handle_list_calendar_events,
     "update_calendar_event": handle_update_calendar_event,
     "delete_calendar_event": handle_delete_calendar_event,
+    "check_availability": handle_check_availability,
     "send_email": handle_send_email,
     "list_emails": handle_list_emails,
     "get_contact_emails": handle_get_contact_emails,
@@ -2271,6 +2339,8 @@ action_dispatcher = {
     "list_tasks": handle_list_tasks,
     "update_task": handle_update_task,
     "delete_task": handle_delete_task,
+    "complete_tasks": handle_complete_tasks,
+    "delete_tasks": handle_delete_tasks,
     "add_contact": handle_add_contact,
     "list_contacts": handle_list_contacts,
     "remove_contact": handle_remove_contact,
@@ -2296,380 +2366,397 @@ action_dispatcher = {
     "fl_studio_play_sequence": handle_fl_studio_play_sequence,
 }
 
-# --- WebSocket Handler ---
-@sock.route('/api/chat_ws')
-def chat_ws(ws):
+def process_chat_message(ws, data):
+    """
+    Traite un message utilisateur (texte, image, fichier) : appel à Gemini, exécution
+    de l'action éventuelle, puis envoi de la réponse, du panneau et de l'audio sur `ws`.
+    Utilisé par /api/chat_ws et par la transcription vocale en flux (/api/audio_ws).
+    """
     global gemini_conversation_history
-    last_activity_time = time.time()
-    server_ping_interval = 30 # seconds for server to ping client
-    client_receive_timeout = 5 # seconds to wait for client message before server pings
-    # La session est maintenant gérée par Flask, il n'est pas nécessaire de la passer ici
+    current_user_parts_for_gemini = []
+    user_text = data.get('text', '')
+    
+    audio_bytes_from_ws = None
 
-    try:
-        session.pop('last_uploaded_file_path', None)
+    if user_text:
+        current_user_parts_for_gemini.append(user_text)
 
-        while True:
-            current_time = time.time()
-            raw_data = None
+    # --- Handle file data from client ---
+    file_data_b64 = data.get('fileData')
+    file_name = data.get('fileName')
+    file_type = data.get('fileType')
+    
+    if file_data_b64 and file_name and file_type == 'audio':
+        try:
+            header, encoded = file_data_b64.split(",", 1)
+            # Gardé en mémoire : décodé directement par ffmpeg via un pipe si 'process_audio' est demandé
+            audio_bytes_from_ws = base64.b64decode(encoded)
+        except Exception as e:
+            print(f"Erreur lors du traitement du fichier audio base64 '{file_name}': {e}")
+            current_user_parts_for_gemini.append(f"(Erreur: Impossible de traiter le fichier audio '{file_name}')")
+
+    # Handle other file types if no audio file was processed
+    if file_data_b64 and file_name and file_type != 'audio':
+        if file_type == 'image':
             try:
-                # Receive data from client with a timeout
-                raw_data = ws.receive(timeout=client_receive_timeout)
-            except (ConnectionClosed, ConnectionResetError):
-                raise # Re-raise to exit the loop and handler
-            except Exception: # Catches timeout errors
-                pass
+                header, encoded = file_data_b64.split(",", 1)
+                image_bytes = base64.b64decode(encoded)
+                img = Image.open(io.BytesIO(image_bytes))
+                MAX_SIZE = (1024, 1024)
+                img.thumbnail(MAX_SIZE, Image.Resampling.LANCZOS)
+                current_user_parts_for_gemini.append(f"L'utilisateur a joint une image nommée '{file_name}'. Voici l'image :")
+                current_user_parts_for_gemini.append(img)
+            except Exception as e:
+                print(f"Erreur lors du décodage de l'image jointe '{file_name}': {e}")
+                current_user_parts_for_gemini.append(f"(Erreur: Impossible de traiter l'image jointe '{file_name}')")
+        
+        elif file_type == 'text':
+            text_content = file_data_b64
+            current_user_parts_for_gemini.append(f"L'utilisateur a joint un fichier texte nommé '{file_name}'. Voici son contenu :\n```\n{text_content}\n```")
 
-            if raw_data is not None:
-                last_activity_time = current_time 
+    elif data.get('imageData'):
+        image_data_url = data.get('imageData')
+        try:
+            header, encoded = image_data_url.split(",", 1)
+            image_bytes = base64.b64decode(encoded)
+            img = Image.open(io.BytesIO(image_bytes))
+            MAX_SIZE = (1024, 1024)
+            img.thumbnail(MAX_SIZE, Image.Resampling.LANCZOS)
+            current_user_parts_for_gemini.append("L'utilisateur a fourni une image via la webcam. Voici l'image :")
+            current_user_parts_for_gemini.append(img)
+        except Exception as e:
+            print(f"Erreur lors du décodage de l'image webcam: {e}")
+            current_user_parts_for_gemini.append("(Erreur: Impossible de traiter l'image de la webcam)")
+
+
+    # --- Initialize response variables ---
+    final_text_response_for_action = None 
+    action_taken_by_nlu = False
+    parsed_command_action = None
+    chat_display_message = None 
+    panel_data_content = None
+    panel_target_id = None
+    gemini_explanation_text = None 
+    extracted_code_block = None
+
+    # --- Process with Gemini ---
+    if not current_user_parts_for_gemini and not gemini_conversation_history:
+        chat_display_message = "Veuillez fournir une requête ou une image."
+    else:
+        gemini_raw_response = get_gemini_response(current_user_parts_for_gemini)
+
+        extracted_json_command_str = None
+        gemini_explanation_text = str(gemini_raw_response)
+
+        if isinstance(gemini_raw_response, str):
+            match_markdown_json = re.search(r"```json\s*(\{.*?\})\s*```", gemini_raw_response, re.DOTALL | re.IGNORECASE)
+            if match_markdown_json:
+                extracted_json_command_str = match_markdown_json.group(1).strip()
+                pre_text = gemini_raw_response[:match_markdown_json.start()].strip()
+                post_text = gemini_raw_response[match_markdown_json.end():].strip()
+                gemini_explanation_text = f"{pre_text}\n{post_text}".strip() if (pre_text or post_text) else None
+            elif gemini_raw_response.strip().startswith("{") and gemini_raw_response.strip().endswith("}"):
                 try:
-                    data = json.loads(raw_data)
+                    test_parse = json.loads(gemini_raw_response.strip())
+                    if isinstance(test_parse, dict) and "action" in test_parse:
+                        extracted_json_command_str = gemini_raw_response.strip()
+                        gemini_explanation_text = None
                 except json.JSONDecodeError:
-                    print(f"ERREUR: Données WebSocket non JSON reçues: {raw_data}")
-                    ws.send(json.dumps({"type": "error", "message": "Invalid JSON."}))
-                    continue
+                    pass
+
+            if not extracted_json_command_str:
+                match_code = re.search(r"```(?:\w*\s*\n)?([\s\S]*?)\n```", gemini_raw_response, re.DOTALL)
+                if match_code:
+                    extracted_code_block = match_code.group(1).strip()
+                    pre_text = gemini_raw_response[:match_code.start()].strip()
+                    post_text = gemini_raw_response[match_code.end():].strip()
+                    if pre_text or post_text:
+                         gemini_explanation_text = f"{pre_text}\n{post_text}".strip()
+                    else:
+                         gemini_explanation_text = "Code généré."
+                    if not gemini_explanation_text.strip():
+                         gemini_explanation_text = "Code généré et affiché dans l'onglet Code."
+
+
+        # --- Execute Action or Handle Text Response ---
+        parsed_command_obj = None
+        if extracted_json_command_str:
+            try:
+                parsed_command_obj = json.loads(extracted_json_command_str)
+            except json.JSONDecodeError:
+                print(f"WARN: Extracted JSON string failed to parse: {extracted_json_command_str}")
+                if gemini_explanation_text is None : gemini_explanation_text = str(gemini_raw_response)
 
-                current_user_parts_for_gemini = []
-                user_text = data.get('text', '')
-                
-                temp_audio_path_from_ws = None
 
-                if user_text:
-                    current_user_parts_for_gemini.append(user_text)
+        if parsed_command_obj and isinstance(parsed_command_obj, dict) and "action" in parsed_command_obj:
+            parsed_command_action = parsed_command_obj.get("action", "").strip()
+            entities = parsed_command_obj.get("entities", {})
+
+            if parsed_command_action == "process_audio":
+                if audio_bytes_from_ws:
+                    print(f"INFO [chat_ws]: Utilisation de l'audio reçu dans ce tour pour 'process_audio' ({len(audio_bytes_from_ws)} octets).")
+                    entities["audio_bytes"] = audio_bytes_from_ws
+                else:
+                    print("WARN [chat_ws]: 'process_audio' action called but no audio file was sent in this message.")
+
+            if parsed_command_action in action_dispatcher:
+                if parsed_command_action == "process_audio":
+                    # Transcription en flux : chaque segment est envoyé au client dès qu'il est prêt
+                    def send_partial_transcript(index, start_s, end_s, text):
+                        ws.send(json.dumps({
+                            "type": "partial_transcript", "index": index,
+                            "start": start_s, "end": end_s, "segment_text": text
+                        }))
+                    final_text_response_for_action = handle_process_audio(entities, on_partial=send_partial_transcript)
+                else:
+                    final_text_response_for_action = action_dispatcher[parsed_command_action](entities) 
+                action_taken_by_nlu = True
 
-                # --- Handle file data from client ---
-                file_data_b64 = data.get('fileData')
-                file_name = data.get('fileName')
-                file_type = data.get('fileType')
                 
-                if file_data_b64 and file_name and file_type == 'audio':
-                    try:
-                        header, encoded = file_data_b64.split(",", 1)
-                        audio_bytes = base64.b64decode(encoded)
-                        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3", dir=TEMP_AUDIO_DIR) as tmp:
-                            tmp.write(audio_bytes)
-                            temp_audio_path_from_ws = tmp.name
-                    except Exception as e:
-                        print(f"Erreur lors du traitement du fichier audio base64 '{file_name}': {e}")
-                        current_user_parts_for_gemini.append(f"(Erreur: Impossible de traiter le fichier audio '{file_name}')")
-
-                # Handle other file types if no audio file was processed
-                if file_data_b64 and file_name and file_type != 'audio':
-                    if file_type == 'image':
-                        try:
-                            header, encoded = file_data_b64.split(",", 1)
-                            image_bytes = base64.b64decode(encoded)
-                            img = Image.open(io.BytesIO(image_bytes))
-                            MAX_SIZE = (1024, 1024)
-                            img.thumbnail(MAX_SIZE, Image.Resampling.LANCZOS)
-                            current_user_parts_for_gemini.append(f"L'utilisateur a joint une image nommée '{file_name}'. Voici l'image :")
-                            current_user_parts_for_gemini.append(img)
-                        except Exception as e:
-                            print(f"Erreur lors du décodage de l'image jointe '{file_name}': {e}")
-                            current_user_parts_for_gemini.append(f"(Erreur: Impossible de traiter l'image jointe '{file_name}')")
-                    
-                    elif file_type == 'text':
-                        text_content = file_data_b64
-                        current_user_parts_for_gemini.append(f"L'utilisateur a joint un fichier texte nommé '{file_name}'. Voici son contenu :\n```\n{text_content}\n```")
+                # --- LOGIQUE D'AFFICHAGE DU CHAT (CORRIGÉE ET INDENTÉE) ---
 
-                elif data.get('imageData'):
-                    image_data_url = data.get('imageData')
-                    try:
-                        header, encoded = image_data_url.split(",", 1)
-                        image_bytes = base64.b64decode(encoded)
-                        img = Image.open(io.BytesIO(image_bytes))
-                        MAX_SIZE = (1024, 1024)
-                        img.thumbnail(MAX_SIZE, Image.Resampling.LANCZOS)
-                        current_user_parts_for_gemini.append("L'utilisateur a fourni une image via la webcam. Voici l'image :")
-                        current_user_parts_for_gemini.append(img)
-                    except Exception as e:
-                        print(f"Erreur lors du décodage de l'image webcam: {e}")
-                        current_user_parts_for_gemini.append("(Erreur: Impossible de traiter l'image de la webcam)")
-
-
-                # --- Initialize response variables ---
-                final_text_response_for_action = None 
-                action_taken_by_nlu = False
-                parsed_command_action = None
-                chat_display_message = None 
+                # Cas 1: Actions spécifiques où le résultat de l'action est le message direct.
+                if parsed_command_action == "get_current_datetime":
+                    chat_display_message = str(final_text_response_for_action)
+                
+                # Cas 2: La recherche web utilise la synthèse de Gemini.
+                elif parsed_command_action == "web_search":
+                    chat_display_message = final_text_response_for_action.get("synthesized_answer", "Erreur de synthèse.")
+                
+                # Cas 3: La gestion des itinéraires a une logique de formatage complexe.
+                elif parsed_command_action == "get_directions":
+                    if isinstance(final_text_response_for_action, dict):
+                        if final_text_response_for_action.get("status") == "success":
+                            distance = final_text_response_for_action.get("distance", "distance inconnue")
+                            duration = final_text_response_for_action.get("duration", "durée inconnue")
+                            destination_entity = entities.get("destination", "votre destination")
+                            
+                            # On utilise le commentaire de Gemini s'il contient les placeholders, sinon un message par défaut.
+                            if gemini_explanation_text and "{destination}" in gemini_explanation_text:
+                                try:
+                                    chat_display_message = gemini_explanation_text.format(destination=destination_entity, distance=distance, duration=duration)
+                                except KeyError:
+                                    chat_display_message = f"En route pour {destination_entity}! Le trajet de {distance} devrait prendre {duration}."
+                            else:
+                                chat_display_message = f"En route pour {destination_entity}! Le trajet de {distance} devrait prendre {duration}."
+                        else:
+                            # En cas d'erreur de direction, on affiche le résumé de l'erreur dans le chat.
+                            chat_display_message = final_text_response_for_action.get("summary", "Impossible de calculer l'itinéraire.")
+                    else: 
+                        # Fallback si la réponse n'est pas un dictionnaire
+                        chat_display_message = str(final_text_response_for_action)
+                
+                # Cas 4: Pour toutes les autres actions, on privilégie le commentaire concis de Gemini.
+                elif gemini_explanation_text and gemini_explanation_text.strip():
+                    chat_display_message = gemini_explanation_text.strip()
+                
+                # Cas 5 (Fallback): Si aucun des cas ci-dessus ne correspond, on met un message générique.
+                # Ceci évite d'afficher le contenu long d'une liste dans le chat.
+                else:
+                    chat_display_message = "C'est fait. Les informations ont été mises à jour dans le panneau correspondant."
+
+                
+                # --- LOGIQUE D'AFFICHAGE DES PANNEAUX ---
                 panel_data_content = None
                 panel_target_id = None
-                gemini_explanation_text = None 
-                extracted_code_block = None
+                
+                if parsed_command_action == "web_search":
+                    panel_data_content = final_text_response_for_action.get("raw_results", "Aucun résultat brut à afficher.")
+                    panel_target_id = "searchContent"
+                
+                elif parsed_command_action in ["list_calendar_events", "create_calendar_event", "update_calendar_event", "delete_calendar_event", "check_availability"]:
+                    panel_target_id = "calendarContent"
+                    if parsed_command_action not in ["list_calendar_events", "check_availability"]:
+                        if "Erreur" not in str(final_text_response_for_action) and "non trouvé" not in str(final_text_response_for_action):
+                            panel_data_content = handle_list_calendar_events({})
+                    else: 
+                        panel_data_content = str(final_text_response_for_action)
 
-                # --- Process with Gemini ---
-                if not current_user_parts_for_gemini and not gemini_conversation_history:
-                    chat_display_message = "Veuillez fournir une requête ou une image."
-                else:
-                    gemini_raw_response = get_gemini_response(current_user_parts_for_gemini)
-
-                    extracted_json_command_str = None
-                    gemini_explanation_text = str(gemini_raw_response)
-
-                    if isinstance(gemini_raw_response, str):
-                        match_markdown_json = re.search(r"```json\s*(\{.*?\})\s*```", gemini_raw_response, re.DOTALL | re.IGNORECASE)
-                        if match_markdown_json:
-                            extracted_json_command_str = match_markdown_json.group(1).strip()
-                            pre_text = gemini_raw_response[:match_markdown_json.start()].strip()
-                            post_text = gemini_raw_response[match_markdown_json.end():].strip()
-                            gemini_explanation_text = f"{pre_text}\n{post_text}".strip() if (pre_text or post_text) else None
-                        elif gemini_raw_response.strip().startswith("{") and gemini_raw_response.strip().endswith("}"):
-                            try:
-                                test_parse = json.loads(gemini_raw_response.strip())
-                                if isinstance(test_parse, dict) and "action" in test_parse:
-                                    extracted_json_command_str = gemini_raw_response.strip()
-                                    gemini_explanation_text = None
-                            except json.JSONDecodeError:
-                                pass
-
-                        if not extracted_json_command_str:
-                            match_code = re.search(r"```(?:\w*\s*\n)?([\s\S]*?)\n```", gemini_raw_response, re.DOTALL)
-                            if match_code:
-                                extracted_code_block = match_code.group(1).strip()
-                                pre_text = gemini_raw_response[:match_code.start()].strip()
-                                post_text = gemini_raw_response[match_code.end():].strip()
-                                if pre_text or post_text:
-                                     gemini_explanation_text = f"{pre_text}\n{post_text}".strip()
+                elif parsed_command_action == "list_emails":
+                    panel_data_content = str(final_text_response_for_action)
+                    panel_target_id = "emailContent"
+                    
+                elif parsed_command_action == "get_contact_emails":
+                    panel_data_content = str(final_text_response_for_action)
+                    panel_target_id = "emailContent"
+                
+                elif parsed_command_action in ["list_tasks", "create_task", "update_task", "delete_task", "complete_tasks", "delete_tasks"]:
+                    panel_target_id = "taskContent"
+                    if parsed_command_action == "list_tasks":
+                        panel_data_content = str(final_text_response_for_action)
+                    elif re.search(r"^[✔✘] ", str(final_text_response_for_action), re.MULTILINE):
+                        # Opération groupée : résultat par élément, puis la liste à jour
+                        panel_data_content = f"{final_text_response_for_action}\n\n{list_google_tasks()}"
+                    elif "Erreur" not in str(final_text_response_for_action) and "non trouvé" not in str(final_text_response_for_action):
+                        panel_data_content = list_google_tasks()
+
+                elif parsed_command_action == "list_contacts":
+                    panel_data_content = str(final_text_response_for_action)
+                    panel_target_id = "searchContent"
+
+                elif parsed_command_action == "get_directions":
+                    if isinstance(final_text_response_for_action, dict):
+                        panel_data_content = final_text_response_for_action.get("summary", "Détails de l'itinéraire non disponibles.")
+                        panel_target_id = "mapContent"
+
+                        if final_text_response_for_action.get("status") == "success":
+                            distance = final_text_response_for_action.get("distance", "distance inconnue")
+                            duration = final_text_response_for_action.get("duration", "durée inconnue")
+                            destination_entity = entities.get("destination", "votre destination")
+                            default_formatted_message = f"En route pour {destination_entity}! Le trajet est de {distance} et devrait prendre environ {duration}. Bon voyage !"
+                            if gemini_explanation_text and gemini_explanation_text.strip():
+                                if "{distance}" in gemini_explanation_text or "{duration}" in gemini_explanation_text or "{destination}" in gemini_explanation_text:
+                                    try:
+                                        chat_display_message = gemini_explanation_text.format(destination=destination_entity, distance=distance, duration=duration)
+                                    except Exception as e_fmt:
+                                        print(f"WARN: Erreur lors du formatage du message de Gemini pour get_directions: {e_fmt}. Original: '{gemini_explanation_text}'")
+                                        chat_display_message = default_formatted_message
                                 else:
-                                     gemini_explanation_text = "Code généré."
-                                if not gemini_explanation_text.strip():
-                                     gemini_explanation_text = "Code généré et affiché dans l'onglet Code."
+                                    chat_display_message = gemini_explanation_text
+                            else:
+                                chat_display_message = default_formatted_message
+                    elif isinstance(final_text_response_for_action, str): 
+                        panel_data_content = final_text_response_for_action
+                        panel_target_id = "mapContent"
+
+                elif parsed_command_action == "get_weather_forecast":
+                    panel_data_content = str(final_text_response_for_action)
+                    panel_target_id = "weatherForecastContent"
+                elif parsed_command_action == "process_url":
+                    panel_data_content = str(final_text_response_for_action) 
+                    panel_target_id = "searchContent" 
+                    chat_display_message = str(final_text_response_for_action) 
+                elif parsed_command_action == "process_audio":
+                    panel_data_content = str(final_text_response_for_action)
+                    panel_target_id = "searchContent" 
+                    chat_display_message = gemini_explanation_text if gemini_explanation_text and gemini_explanation_text.strip() else "Voici la transcription de l'audio."
+                    panel_data_content = f"**Transcription Audio:**\n\n{final_text_response_for_action}"
+
+                elif parsed_command_action == "execute_python_code":
+                    panel_data_content = str(final_text_response_for_action)
+                    panel_target_id = "codeDisplayContent"
+                elif parsed_command_action == "generate_3d_object":
+                    # La visualisation 3D n'a pas besoin de mettre à jour de panneau
+                    panel_data_content = None
+                    panel_target_id = None
+            else:
+                print(f"WARN [chat_ws] Extracted JSON action not recognized: '{parsed_command_action}'")
+                chat_display_message = gemini_explanation_text if gemini_explanation_text is not None else "Action non reconnue."
+                action_taken_by_nlu = False
 
+        elif extracted_code_block:
+            action_taken_by_nlu = False
+            parsed_command_action = "code_generation"
+            panel_data_content = extracted_code_block
+            panel_target_id = "codeDisplayContent"
+            chat_display_message = gemini_explanation_text if gemini_explanation_text and gemini_explanation_text.strip() else "Code généré et affiché dans l'onglet Code."
 
-                    # --- Execute Action or Handle Text Response ---
-                    parsed_command_obj = None
-                    if extracted_json_command_str:
-                        try:
-                            parsed_command_obj = json.loads(extracted_json_command_str)
-                        except json.JSONDecodeError:
-                            print(f"WARN: Extracted JSON string failed to parse: {extracted_json_command_str}")
-                            if gemini_explanation_text is None : gemini_explanation_text = str(gemini_raw_response)
+        else: 
+            action_taken_by_nlu = False
+            chat_display_message = gemini_explanation_text if gemini_explanation_text is not None else "Je n'ai pas compris la demande."
 
 
-                    if parsed_command_obj and isinstance(parsed_command_obj, dict) and "action" in parsed_command_obj:
-                        parsed_command_action = parsed_command_obj.get("action", "").strip()
-                        entities = parsed_command_obj.get("entities", {})
+    # --- Prepare and Send Response to Client ---
+    if chat_display_message is None:
+        chat_display_message = "Je ne suis pas sûr de pouvoir traiter cette demande."
 
-                        if parsed_command_action == "process_audio":
-                            if temp_audio_path_from_ws:
-                                print(f"INFO [chat_ws]: Utilisation du chemin de fichier de ce tour pour 'process_audio': {temp_audio_path_from_ws}")
-                                entities["file_path"] = temp_audio_path_from_ws
-                            else:
-                                print("WARN [chat_ws]: 'process_audio' action called but no audio file was sent in this message.")
-            
-                        if parsed_command_action in action_dispatcher:
-                            final_text_response_for_action = action_dispatcher[parsed_command_action](entities) 
-                            action_taken_by_nlu = True
+    chat_display_message = str(chat_display_message)
 
-                            
-                            # --- LOGIQUE D'AFFICHAGE DU CHAT (CORRIGÉE ET INDENTÉE) ---
-            
-                            # Cas 1: Actions spécifiques où le résultat de l'action est le message direct.
-                            if parsed_command_action == "get_current_datetime":
-                                chat_display_message = str(final_text_response_for_action)
-                            
-                            # Cas 2: La recherche web utilise la synthèse de Gemini.
-                            elif parsed_command_action == "web_search":
-                                chat_display_message = final_text_response_for_action.get("synthesized_answer", "Erreur de synthèse.")
-                            
-                            # Cas 3: La gestion des itinéraires a une logique de formatage complexe.
-                            elif parsed_command_action == "get_directions":
-                                if isinstance(final_text_response_for_action, dict):
-                                    if final_text_response_for_action.get("status") == "success":
-                                        distance = final_text_response_for_action.get("distance", "distance inconnue")
-                                        duration = final_text_response_for_action.get("duration", "durée inconnue")
-                                        destination_entity = entities.get("destination", "votre destination")
-                                        
-                                        # On utilise le commentaire de Gemini s'il contient les placeholders, sinon un message par défaut.
-                                        if gemini_explanation_text and "{destination}" in gemini_explanation_text:
-                                            try:
-                                                chat_display_message = gemini_explanation_text.format(destination=destination_entity, distance=distance, duration=duration)
-                                            except KeyError:
-                                                chat_display_message = f"En route pour {destination_entity}! Le trajet de {distance} devrait prendre {duration}."
-                                        else:
-                                            chat_display_message = f"En route pour {destination_entity}! Le trajet de {distance} devrait prendre {duration}."
-                                    else:
-                                        # En cas d'erreur de direction, on affiche le résumé de l'erreur dans le chat.
-                                        chat_display_message = final_text_response_for_action.get("summary", "Impossible de calculer l'itinéraire.")
-                                else: 
-                                    # Fallback si la réponse n'est pas un dictionnaire
-                                    chat_display_message = str(final_text_response_for_action)
-                            
-                            # Cas 4: Pour toutes les autres actions, on privilégie le commentaire concis de Gemini.
-                            elif gemini_explanation_text and gemini_explanation_text.strip():
-                                chat_display_message = gemini_explanation_text.strip()
-                            
-                            # Cas 5 (Fallback): Si aucun des cas ci-dessus ne correspond, on met un message générique.
-                            # Ceci évite d'afficher le contenu long d'une liste dans le chat.
-                            else:
-                                chat_display_message = "C'est fait. Les informations ont été mises à jour dans le panneau correspondant."
-
-                            
-                            # --- LOGIQUE D'AFFICHAGE DES PANNEAUX ---
-                            panel_data_content = None
-                            panel_target_id = None
-                            
-                            if parsed_command_action == "web_search":
-                                panel_data_content = final_text_response_for_action.get("raw_results", "Aucun résultat brut à afficher.")
-                                panel_target_id = "searchContent"
-                            
-                            elif parsed_command_action in ["list_calendar_events", "create_calendar_event", "update_calendar_event", "delete_calendar_event"]:
-                                panel_target_id = "calendarContent"
-                                if parsed_command_action != "list_calendar_events":
-                                    if "Erreur" not in str(final_text_response_for_action) and "non trouvé" not in str(final_text_response_for_action):
-                                        panel_data_content = handle_list_calendar_events({})
-                                else: 
-                                    panel_data_content = str(final_text_response_for_action)
-
-                            elif parsed_command_action == "list_emails":
-                                panel_data_content = str(final_text_response_for_action)
-                                panel_target_id = "emailContent"
-                                
-                            elif parsed_command_action == "get_contact_emails":
-                                panel_data_content = str(final_text_response_for_action)
-                                panel_target_id = "emailContent"
-                            
-                            elif parsed_command_action in ["list_tasks", "create_task", "update_task", "delete_task"]:
-                                panel_target_id = "taskContent"
-                                if parsed_command_action != "list_tasks":
-                                     if "Erreur" not in str(final_text_response_for_action) and "non trouvé" not in str(final_text_response_for_action):
-                                        panel_data_content = list_google_tasks() 
-                                else: 
-                                    panel_data_content = str(final_text_response_for_action)
-
-                            elif parsed_command_action == "list_contacts":
-                                panel_data_content = str(final_text_response_for_action)
-                                panel_target_id = "searchContent"
-
-                            elif parsed_command_action == "get_directions":
-                                if isinstance(final_text_response_for_action, dict):
-                                    panel_data_content = final_text_response_for_action.get("summary", "Détails de l'itinéraire non disponibles.")
-                                    panel_target_id = "mapContent"
-
-                                    if final_text_response_for_action.get("status") == "success":
-                                        distance = final_text_response_for_action.get("distance", "distance inconnue")
-                                        duration = final_text_response_for_action.get("duration", "durée inconnue")
-                                        destination_entity = entities.get("destination", "votre destination")
-                                        default_formatted_message = f"En route pour {destination_entity}! Le trajet est de {distance} et devrait prendre environ {duration}. Bon voyage !"
-                                        if gemini_explanation_text and gemini_explanation_text.strip():
-                                            if "{distance}" in gemini_explanation_text or "{duration}" in gemini_explanation_text or "{destination}" in gemini_explanation_text:
-                                                try:
-                                                    chat_display_message = gemini_explanation_text.format(destination=destination_entity, distance=distance, duration=duration)
-                                                except Exception as e_fmt:
-                                                    print(f"WARN: Erreur lors du formatage du message de Gemini pour get_directions: {e_fmt}. Original: '{gemini_explanation_text}'")
-                                                    chat_display_message = default_formatted_message
-                                            else:
-                                                chat_display_message = gemini_explanation_text
-                                        else:
-                                            chat_display_message = default_formatted_message
-                                elif isinstance(final_text_response_for_action, str): 
-                                    panel_data_content = final_text_response_for_action
-                                    panel_target_id = "mapContent"
-
-                            elif parsed_command_action == "get_weather_forecast":
-                                panel_data_content = str(final_text_response_for_action)
-                                panel_target_id = "weatherForecastContent"
-                            elif parsed_command_action == "process_url":
-                                panel_data_content = str(final_text_response_for_action) 
-                                panel_target_id = "searchContent" 
-                                chat_display_message = str(final_text_response_for_action) 
-                            elif parsed_command_action == "process_audio":
-                                panel_data_content = str(final_text_response_for_action)
-                                panel_target_id = "searchContent" 
-                                chat_display_message = gemini_explanation_text if gemini_explanation_text and gemini_explanation_text.strip() else "Voici la transcription de l'audio."
-                                panel_data_content = f"**Transcription Audio:**\n\n{final_text_response_for_action}"
-
-                            elif parsed_command_action == "execute_python_code":
-                                panel_data_content = str(final_text_response_for_action)
-                                panel_target_id = "codeDisplayContent"
-                            elif parsed_command_action == "generate_3d_object":
-                                # La visualisation 3D n'a pas besoin de mettre à jour de panneau
-                                panel_data_content = None
-                                panel_target_id = None
-                        else:
-                            print(f"WARN [chat_ws] Extracted JSON action not recognized: '{parsed_command_action}'")
-                            chat_display_message = gemini_explanation_text if gemini_explanation_text is not None else "Action non reconnue."
-                            action_taken_by_nlu = False
-
-                    elif extracted_code_block:
-                        action_taken_by_nlu = False
-                        parsed_command_action = "code_generation"
-                        panel_data_content = extracted_code_block
-                        panel_target_id = "codeDisplayContent"
-                        chat_display_message = gemini_explanation_text if gemini_explanation_text and gemini_explanation_text.strip() else "Code généré et affiché dans l'onglet Code."
+    if "```json" in chat_display_message and panel_target_id:
+        if gemini_explanation_text and gemini_explanation_text.strip() and extracted_json_command_str and extracted_json_command_str in gemini_raw_response:
+             chat_display_message = gemini_explanation_text.strip() if gemini_explanation_text.strip() else "Action effectuée."
+        elif extracted_code_block :
+             chat_display_message = gemini_explanation_text if gemini_explanation_text and gemini_explanation_text.strip() else "Code affiché dans le panneau dédié."
+        else:
+            chat_display_message = f"Action traitée. Contenu affiché dans le panneau dédié."
+
+
+    message_to_send = {"type": "final_text", "text": chat_display_message}
+    if panel_data_content and panel_target_id:
+        message_to_send["panel_data"] = panel_data_content
+        message_to_send["panel_target_id"] = panel_target_id
+
+    ws.send(json.dumps(message_to_send))
+
+    # --- TTS Logic ---
+    audio_data_url = None
+    text_for_gtts = chat_display_message 
+
+    if action_taken_by_nlu:
+        if parsed_command_action == "get_directions":
+            if isinstance(final_text_response_for_action, dict) and final_text_response_for_action.get("status") == "success":
+                text_for_gtts = chat_display_message
+            elif isinstance(final_text_response_for_action, dict) and final_text_response_for_action.get("summary"):
+                text_for_gtts = final_text_response_for_action["summary"]
+        elif parsed_command_action == "process_url":
+            text_for_gtts = chat_display_message 
+        elif parsed_command_action == "process_audio":
+            text_for_gtts = chat_display_message 
+
+    elif parsed_command_action == "code_generation" and panel_target_id == "codeDisplayContent" and extracted_code_block:
+         text_for_gtts = gemini_explanation_text if gemini_explanation_text and gemini_explanation_text.strip() else "Voici le code que j'ai généré."
+
+    should_speak = True
+    lower_chat_message_for_tts_check = text_for_gtts.lower()
+
+    suppress_audio_keywords = [
+         "client gemini non configuré", "réponse gemini bloquée",
+         "erreur critique", "erreur serveur", "erreur interne",
+         "bibliothèque manquante", "non disponible",
+         "je ne suis pas sûr de comprendre votre demande" ,
+    ]
+    if any(keyword in lower_chat_message_for_tts_check for keyword in suppress_audio_keywords):
+        if text_for_gtts == chat_display_message:
+                should_speak = False
+                
+    if parsed_command_action == "process_audio" and str(final_text_response_for_action) in text_for_gtts:
+        should_speak = False
 
-                    else: 
-                        action_taken_by_nlu = False
-                        chat_display_message = gemini_explanation_text if gemini_explanation_text is not None else "Je n'ai pas compris la demande."
+    if text_for_gtts.strip() == "" or lower_chat_message_for_tts_check == "ok.":
+        should_speak = False
 
 
-                # --- Prepare and Send Response to Client ---
-                if chat_display_message is None:
-                    chat_display_message = "Je ne suis pas sûr de pouvoir traiter cette demande."
+    if should_speak:
+        audio_data_url = get_gtts_audio(text_for_gtts, lang='fr')
 
-                chat_display_message = str(chat_display_message)
+    if audio_data_url:
+        ws.send(json.dumps({"type": "audio_data", "audio": audio_data_url}))
+    else:
+        ws.send(json.dumps({"type": "no_audio_data"}))
 
-                if "```json" in chat_display_message and panel_target_id:
-                    if gemini_explanation_text and gemini_explanation_text.strip() and extracted_json_command_str and extracted_json_command_str in gemini_raw_response:
-                         chat_display_message = gemini_explanation_text.strip() if gemini_explanation_text.strip() else "Action effectuée."
-                    elif extracted_code_block :
-                         chat_display_message = gemini_explanation_text if gemini_explanation_text and gemini_explanation_text.strip() else "Code affiché dans le panneau dédié."
-                    else:
-                        chat_display_message = f"Action traitée. Contenu affiché dans le panneau dédié."
-
-
-                message_to_send = {"type": "final_text", "text": chat_display_message}
-                if panel_data_content and panel_target_id:
-                    message_to_send["panel_data"] = panel_data_content
-                    message_to_send["panel_target_id"] = panel_target_id
-
-                ws.send(json.dumps(message_to_send))
-
-                # --- TTS Logic ---
-                audio_data_url = None
-                text_for_gtts = chat_display_message 
-
-                if action_taken_by_nlu:
-                    if parsed_command_action == "get_directions":
-                        if isinstance(final_text_response_for_action, dict) and final_text_response_for_action.get("status") == "success":
-                            text_for_gtts = chat_display_message
-                        elif isinstance(final_text_response_for_action, dict) and final_text_response_for_action.get("summary"):
-                            text_for_gtts = final_text_response_for_action["summary"]
-                    elif parsed_command_action == "process_url":
-                        text_for_gtts = chat_display_message 
-                    elif parsed_command_action == "process_audio":
-                        text_for_gtts = chat_display_message 
-
-                elif parsed_command_action == "code_generation" and panel_target_id == "codeDisplayContent" and extracted_code_block:
-                     text_for_gtts = gemini_explanation_text if gemini_explanation_text and gemini_explanation_text.strip() else "Voici le code que j'ai généré."
-
-                should_speak = True
-                lower_chat_message_for_tts_check = text_for_gtts.lower()
-
-                suppress_audio_keywords = [
-                     "client gemini non configuré", "réponse gemini bloquée",
-                     "erreur critique", "erreur serveur", "erreur interne",
-                     "bibliothèque manquante", "non disponible",
-                     "je ne suis pas sûr de comprendre votre demande" ,
-                ]
-                if any(keyword in lower_chat_message_for_tts_check for keyword in suppress_audio_keywords):
-                    if text_for_gtts == chat_display_message:
-                            should_speak = False
-                            
-                if parsed_command_action == "process_audio" and str(final_text_response_for_action) in text_for_gtts:
-                    should_speak = False
 
-                if text_for_gtts.strip() == "" or lower_chat_message_for_tts_check == "ok.":
-                    should_speak = False
+# --- WebSocket Handler ---
+@sock.route('/api/chat_ws')
+def chat_ws(ws):
+    last_activity_time = time.time()
+    server_ping_interval = 30 # seconds for server to ping client
+    client_receive_timeout = 5 # seconds to wait for client message before server pings
+    # La session est maintenant gérée par Flask, il n'est pas nécessaire de la passer ici
 
+    try:
+        session.pop('last_uploaded_file_path', None)
 
-                if should_speak:
-                    audio_data_url = get_gtts_audio(text_for_gtts, lang='fr')
+        while True:
+            current_time = time.time()
+            raw_data = None
+            try:
+                # Receive data from client with a timeout
+                raw_data = ws.receive(timeout=client_receive_timeout)
+            except (ConnectionClosed, ConnectionResetError):
+                raise # Re-raise to exit the loop and handler
+            except Exception: # Catches timeout errors
+                pass
 
-                if audio_data_url:
-                    ws.send(json.dumps({"type": "audio_data", "audio": audio_data_url}))
-                else:
-                    ws.send(json.dumps({"type": "no_audio_data"}))
+            if raw_data is not None:
+                last_activity_time = current_time 
+                try:
+                    data = json.loads(raw_data)
+                except json.JSONDecodeError:
+                    print(f"ERREUR: Données WebSocket non JSON reçues: {raw_data}")
+                    ws.send(json.dumps({"type": "error", "message": "Invalid JSON."}))
+                    continue
 
+                process_chat_message(ws, data)
 
             else:
                 if current_time - last_activity_time > server_ping_interval:
@@ -2698,6 +2785,138 @@ def chat_ws(ws):
     finally:
         print(f"[INFO WebSocket Handler] Fin du handler pour un client.")
 
+@sock.route('/api/audio_ws')
+def audio_ws(ws):
+    """
+    Reconnaissance vocale côté serveur, alternative à la Web Speech API du navigateur.
+    Le client envoie des trames audio binaires (PCM 16 bits mono 16 kHz par défaut) ;
+    un message {"type": "start", "format": "pcm16" | "webm" | "ogg"} peut préciser le format
+    et {"type": "stop"} termine l'écoute. Le serveur renvoie des 'interim_transcript' pendant
+    que l'utilisateur parle, puis un 'final_transcript' qui est directement traité comme
+    un tour de conversation (réponse, panneaux et audio arrivent sur cette même connexion).
+    """
+    if not whisper_available:
+        ws.send(json.dumps({"type": "error", "message": "La transcription audio n'est pas disponible sur le serveur."}))
+        return
+
+    stt = None
+    audio_format = "pcm16"
+
+    def emit(events):
+        for kind, text in events:
+            if kind == "interim":
+                ws.send(json.dumps({"type": "interim_transcript", "text": text}))
+            else:
+                ws.send(json.dumps({"type": "final_transcript", "text": text}))
+                process_chat_message(ws, {"text": text})
+
+    try:
+        while True:
+            try:
+                message = ws.receive(timeout=0.1)
+            except (ConnectionClosed, ConnectionResetError):
+                raise
+            except Exception: # Timeout
+                message = None
+
+            if isinstance(message, (bytes, bytearray)):
+                if stt is None:
+                    stt = streaming_stt.StreamingTranscriber(whisper_transcriber.transcribe_single, audio_format)
+                stt.feed(bytes(message))
+            elif isinstance(message, str):
+                try:
+                    control = json.loads(message)
+                except json.JSONDecodeError:
+                    print(f"ERREUR [audio_ws]: Message de contrôle non JSON reçu: {message[:100]}")
+                    continue
+                if control.get("type") == "start":
+                    audio_format = control.get("format", "pcm16")
+                    if stt:
+                        stt.close()
+                    stt = streaming_stt.StreamingTranscriber(whisper_transcriber.transcribe_single, audio_format)
+                elif control.get("type") == "stop" and stt:
+                    events = stt.finish()
+                    stt.close()
+                    stt = None
+                    emit(events)
+
+            if stt:
+                emit(stt.poll())
+
+    except (ConnectionClosed, ConnectionResetError):
+        print(f"[INFO Audio WebSocket] Connexion fermée avec le client.")
+    except Exception as e:
+        print(f"[ERREUR Audio WebSocket] /api/audio_ws: {type(e).__name__} - {e}")
+        traceback.print_exc()
+    finally:
+        if stt:
+            stt.close()
+
+
+# --- Import / export du carnet d'adresses (voir contact_io.py) ---
+@app.route('/api/contacts/import', methods=['POST'])
+def import_contacts():
+    """Multipart form: `file` (vCard or CSV), optional `format` (vcard|csv) and `overwrite` (true/false)."""
+    uploaded = request.files.get('file')
+    if uploaded is None or not uploaded.filename:
+        return jsonify({"error": "Aucun fichier reçu (champ 'file')."}), 400
+    fmt = request.form.get('format') or contact_io.detect_format(uploaded.filename)
+    overwrite = request.form.get('overwrite', '').lower() in ('1', 'true', 'oui')
+    try:
+        # Le flux de l'envoi est lu ligne à ligne (Werkzeug le place sur disque au-delà de 500 Ko)
+        counts = contact_io.import_contacts(contact_store, uploaded.stream, fmt, overwrite=overwrite)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"ERREUR [import_contacts] lors de l'import de '{uploaded.filename}': {type(e).__name__} - {e}")
+        traceback.print_exc()
+        return jsonify({"error": "Import impossible, le carnet est inchangé."}), 500
+    print(f"INFO [import_contacts]: '{uploaded.filename}' importé : {counts}")
+    return jsonify({"result": counts, "contacts": len(contact_store)})
+
+@app.route('/api/contacts/export')
+def export_contacts():
+    fmt = request.args.get('format', 'vcard')
+    if fmt not in contact_io.FORMATS:
+        return jsonify({"error": f"Format inconnu '{fmt}' (attendu : {', '.join(contact_io.FORMATS)})."}), 400
+    return Response(
+        contact_io.iter_export(contact_store.all(), fmt),
+        mimetype=contact_io.MIME_TYPES[fmt],
+        headers={"Content-Disposition": f"attachment; filename=contacts.{contact_io.EXTENSIONS[fmt]}"},
+    )
+
+
+# --- Métriques ---
+# Chaque service expose un dict de compteurs via une fonction sans argument
+METRICS_PROVIDERS = {
+    "temp_reaper": temp_reaper.stats,
+    "google_credentials": google_credential_manager.stats,
+    "google_services": google_services.stats,
+    "google_http": google_http.stats,
+    "gmail_mirror": gmail_mirror.stats,
+    "email_body_cache": email_body.cache.stats,
+    "calendar_store": calendar_store.stats,
+    "freebusy": free_busy.stats,
+    "french_datetime": french_datetime.stats,
+    "tasks_store": tasks_store.stats,
+    "contact_store": contact_store.stats,
+    "contact_matcher": contact_matcher.stats,
+    "people_sync": people_sync.stats,
+    "search_cache": search_cache.stats,
+    "web_digest": web_digest.stats,
+    "http_client": lambda: http_client.stats() if url_processing_available else {"enabled": False},
+}
+
+@app.route('/api/metrics')
+def metrics():
+    result = {}
+    for name, provider in METRICS_PROVIDERS.items():
+        try:
+            result[name] = provider()
+        except Exception as e:
+            result[name] = {"error": f"{type(e).__name__}: {e}"}
+    return jsonify(result)
+
 
 if __name__ == '__main__':
     if not os.path.exists(CLIENT_SECRETS_FILE):
@@ -2708,10 +2927,13 @@ if __name__ == '__main__':
     print("-------------------------------------------")
     print(f"Démarrage du serveur Flask sur http://localhost:5000")
     print(f"Endpoint WebSocket: ws://localhost:5000/api/chat_ws")
+    print(f"Endpoint audio en flux: ws://localhost:5000/api/audio_ws")
+    print(f"Métriques: http://localhost:5000/api/metrics")
+    print(f"Contacts: POST http://localhost:5000/api/contacts/import | GET http://localhost:5000/api/contacts/export?format=vcard|csv")
     print(f"Mode debug Flask: {'Activé' if app.debug else 'Désactivé'}")
     print(f"Modèle Gemini: {gemini_model_name}")
     print(f"gTTS: {'Oui' if gtts_enabled else 'Non'}")
-    print(f"Whisper: {'Oui' if whisper_available else 'Non'}")
+    print(f"Whisper: {'Oui (' + whisper_config.backend + ')' if whisper_available else 'Non'}")
     print(f"Google Custom Search: {'Oui' if google_custom_search_available else 'Non'}") # Modifié ici
     print(f"Google Maps API: {'Oui' if google_maps_api_key else 'Non'}")
     print(f"Traitement d'URL: {'Oui' if url_processing_available else 'Non (requests/BeautifulSoup manquant)'}")
@@ -0,0 +1,207 @@
+# people_sync.py
+"""
+Import des contacts Google (People API) dans le carnet d'adresses local.
+
+Une première synchronisation lit toutes les connexions de l'utilisateur ; les suivantes ne
+transfèrent que les contacts créés, modifiés ou supprimés depuis, grâce au `syncToken`
+conservé sur disque. Un jeton expiré (410) déclenche une nouvelle synchronisation complète.
+Un thread de fond relance la synchronisation à intervalle régulier.
+
+Les contacts importés portent {"source": "google", "resource_name": "people/c..."} : seuls
+ceux-là sont mis à jour ou supprimés par la synchronisation. Un contact saisi à la main
+(commande add_contact) ou une autre personne Google n'est jamais écrasé : un homonyme importé
+est nommé « Nom (adresse) », et une adresse déjà enregistrée sous un autre contact est ignorée.
+"""
+import os
+import json
+import tempfile
+import threading
+
+from googleapiclient.errors import HttpError
+
+from contact_store import EMAIL_RE, normalize_name, normalize_email
+
+SYNC_INTERVAL_S = float(os.getenv("PEOPLE_SYNC_INTERVAL_S", "3600"))
+PAGE_SIZE = 1000 # Maximum accepté par people.connections.list
+PERSON_FIELDS = "names,emailAddresses"
+SOURCE = "google"
+
+
+def _contact_from_person(person):
+    """Contact local d'une personne de l'API (nom affiché + adresse principale), ou None."""
+    names = person.get("names") or []
+    emails = [e for e in person.get("emailAddresses") or [] if EMAIL_RE.match(e.get("value", ""))]
+    if not names or not emails:
+        return None
+    name = next((n for n in names if n.get("metadata", {}).get("primary")), names[0])
+    email = next((e for e in emails if e.get("metadata", {}).get("primary")), emails[0])
+    display_name = (name.get("displayName") or "").strip()
+    if not display_name:
+        return None
+    return {"display_name": display_name, "email": email["value"].strip(), "source": SOURCE, "resource_name": person["resourceName"]}
+
+
+def _replace_same_person_only(existing, new):
+    return existing.get("source") == SOURCE and existing.get("resource_name") == new.get("resource_name")
+
+
+class PeopleSync:
+    """
+    `store` : le ContactStore à alimenter ; `service_factory()` retourne un client People
+    (ou None sans autorisation) ; `on_auth_error()` est appelé quand l'API répond 401.
+    """
+
+    def __init__(self, store, service_factory, state_file, on_auth_error=None, sync_interval_s=SYNC_INTERVAL_S):
+        self.store = store
+        self.service_factory = service_factory
+        self.state_file = state_file
+        self.on_auth_error = on_auth_error
+        self.sync_interval_s = sync_interval_s
+        self._sync_token = self._load_token()
+        self._sync_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._last_result = None
+        self._stats = {"full_syncs": 0, "incremental_syncs": 0, "sync_errors": 0, "people_received": 0, "name_conflicts": 0}
+
+    # --- Cycle de vie ---
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="people-sync", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            self.sync()
+            self._wakeup.wait(self.sync_interval_s)
+            self._wakeup.clear()
+
+    def request_sync(self):
+        """Demande une synchronisation anticipée au thread de fond (ex. juste après l'autorisation Google)."""
+        self._wakeup.set()
+
+    # --- Jeton de synchronisation ---
+    def _load_token(self):
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                return json.load(f).get("sync_token")
+        except (OSError, ValueError):
+            return None
+
+    def _save_token(self, token):
+        directory = os.path.dirname(os.path.abspath(self.state_file))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".people-sync-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({"sync_token": token}, f)
+            os.replace(tmp_path, self.state_file)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._sync_token = token
+
+    # --- Synchronisation ---
+    def sync(self):
+        with self._sync_lock:
+            try:
+                service = self.service_factory()
+                if service is None:
+                    return False # Pas encore d'autorisation Google
+                if self._sync_token is None:
+                    self._sync(service, full=True)
+                else:
+                    try:
+                        self._sync(service, full=False)
+                    except HttpError as error:
+                        if error.resp.status != 410:
+                            raise
+                        print("INFO [people_sync]: syncToken expiré, synchronisation complète.")
+                        self._sync(service, full=True)
+                return True
+            except HttpError as error:
+                self._stats["sync_errors"] += 1
+                if error.resp.status == 401 and self.on_auth_error:
+                    self.on_auth_error()
+                elif error.resp.status == 403:
+                    print("AVERTISSEMENT [people_sync]: Accès aux contacts Google refusé. Réautorisez l'application via /authorize_google (portée contacts.readonly).")
+                else:
+                    print(f"ERREUR [people_sync]: Synchronisation impossible: {error}")
+            except Exception as e:
+                self._stats["sync_errors"] += 1
+                print(f"ERREUR [people_sync]: Synchronisation impossible: {type(e).__name__} - {e}")
+            return False
+
+    def _sync(self, service, full):
+        people, next_sync_token, page_token = [], None, None
+        while True:
+            params = {"resourceName": "people/me", "personFields": PERSON_FIELDS, "pageSize": PAGE_SIZE, "requestSyncToken": True}
+            if page_token:
+                params["pageToken"] = page_token
+            if not full:
+                params["syncToken"] = self._sync_token
+            response = service.people().connections().list(**params).execute()
+            people.extend(response.get("connections", []))
+            next_sync_token = response.get("nextSyncToken", next_sync_token)
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                break
+        self._stats["people_received"] += len(people)
+
+        # Contacts déjà importés, par personne Google : supprimés ou renommés si la personne change.
+        # Propriétaire de chaque nom et adresse du carnet : personne Google, ou None pour un contact manuel.
+        imported, name_owners, email_owners = {}, {}, {}
+        for contact in self.store.all():
+            owner = contact.get("resource_name") if contact.get("source") == SOURCE else None
+            name_owners[normalize_name(contact["display_name"])] = owner
+            email_owners[normalize_email(contact["email"])] = owner
+            if owner is not None:
+                imported.setdefault(owner, []).append(contact["display_name"])
+
+        upserts, removals, seen = [], [], set()
+        for person in people:
+            resource_name = person.get("resourceName")
+            seen.add(resource_name)
+            contact = _contact_from_person(person) if not person.get("metadata", {}).get("deleted") else None
+            if contact is not None:
+                contact = self._claim(contact, name_owners, email_owners)
+            for name in imported.get(resource_name, []):
+                if contact is None or normalize_name(name) != normalize_name(contact["display_name"]):
+                    removals.append(name)
+            if contact is not None:
+                upserts.append(contact)
+        if full: # Personnes disparues depuis le dernier import
+            for resource_name, names in imported.items():
+                if resource_name not in seen:
+                    removals.extend(names)
+
+        result = self.store.bulk_update(upserts, removals, replace=_replace_same_person_only)
+        if next_sync_token:
+            self._save_token(next_sync_token)
+        self._stats["full_syncs" if full else "incremental_syncs"] += 1
+        self._last_result = result
+        if full or result["added"] or result["updated"] or result["removed"]:
+            print(f"INFO [people_sync]: Contacts Google {'importés' if full else 'synchronisés'} : {result}")
+
+    def _claim(self, contact, name_owners, email_owners):
+        """
+        Contact à enregistrer pour cette personne, renommé « Nom (adresse) » si le nom appartient à un autre
+        contact, ou None si l'adresse (ou même le nom renommé) est déjà prise. Réserve le nom et l'adresse.
+        """
+        owner = contact["resource_name"]
+        email_key = email_owners.setdefault(normalize_email(contact["email"]), owner)
+        if email_key != owner:
+            self._stats["name_conflicts"] += 1
+            return None
+        for display_name in (contact["display_name"], f"{contact['display_name']} ({contact['email']})"):
+            if name_owners.setdefault(normalize_name(display_name), owner) == owner:
+                return dict(contact, display_name=display_name)
+            self._stats["name_conflicts"] += 1
+        return None
+
+    def stats(self):
+        stats = dict(self._stats)
+        stats["has_sync_token"] = self._sync_token is not None
+        stats["last_result"] = self._last_result
+        return stats
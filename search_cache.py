@@ -0,0 +1,198 @@
+# search_cache.py
+"""
+Cache des résultats de Google Custom Search, persistant et économe en quota.
+
+La clé est la requête normalisée (casse, accents, ponctuation et espaces ignorés, sauf « + » et
+« # » en fin de mot : « c++ », « c# » et « c » restent distincts) plus la langue / le pays et le
+nombre de résultats : « Météo Paris ? » et « meteo paris » partagent une entrée. Une entrée vit SEARCH_CACHE_TTL_S, ou SEARCH_CACHE_NEWS_TTL_S pour une requête
+d'actualité (« actu », « aujourd'hui », « score »...). Les requêtes identiques simultanées
+partagent un seul appel à l'API (single-flight).
+
+Le compteur d'appels du jour (remise à zéro à minuit, heure du Pacifique, comme le quota
+Google) est conservé avec les entrées dans un fichier JSON écrit de façon atomique. Quota
+épuisé : une entrée périmée est servie s'il en existe une, sinon QuotaExceeded est levée. Les
+entrées périmées sont donc gardées (même au rechargement) jusqu'à leur éviction LRU.
+"""
+import os
+import re
+import json
+import time
+import datetime
+import tempfile
+import threading
+import collections
+from zoneinfo import ZoneInfo
+
+from french_text import fold_accents
+
+TTL_S = float(os.getenv("SEARCH_CACHE_TTL_S", str(24 * 3600)))
+NEWS_TTL_S = float(os.getenv("SEARCH_CACHE_NEWS_TTL_S", "900"))
+DAILY_QUOTA = int(os.getenv("SEARCH_DAILY_QUOTA", "100")) # Offre gratuite de Custom Search
+MAX_ENTRIES = 1000
+QUOTA_TZ = ZoneInfo("America/Los_Angeles") # Les quotas Google sont remis à zéro à minuit, heure du Pacifique
+
+_WORD_RE = re.compile(r"\w+[+#]*") # « c++ », « c# », « f# »
+_NEWS_RE = re.compile(
+    r"\b(?:actus?|actualites?|news|info|infos|aujourd hui|ce soir|ce matin|hier|maintenant|en direct|live"
+    r"|derniere?s?|recente?s?|score|resultats?|match|meteo|bourse|cours|election|sondages?|trafic|breaking)\b"
+)
+
+
+def normalize_query(query):
+    """'  Météo à Paris ?' -> 'meteo a paris' ; 'Tutoriel C++ !' -> 'tutoriel c++'."""
+    return " ".join(_WORD_RE.findall(fold_accents(query or "")))
+
+
+def is_news_query(normalized_query):
+    return bool(_NEWS_RE.search(normalized_query))
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+class _Flight:
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SearchCache:
+    """`path` : fichier JSON de persistance (None : cache en mémoire seulement)."""
+
+    def __init__(self, path, ttl_s=TTL_S, news_ttl_s=NEWS_TTL_S, daily_quota=DAILY_QUOTA, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.ttl_s = ttl_s
+        self.news_ttl_s = news_ttl_s
+        self.daily_quota = daily_quota
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict() # clé -> {"value", "expires"} (horloge murale : survit au redémarrage)
+        self._quota = {"day": self._today(), "used": 0}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "shared": 0, "stale_served": 0, "quota_refusals": 0, "api_calls": 0, "save_errors": 0}
+        self._load()
+
+    # --- Persistance ---
+    def _load(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        # Entrées périmées comprises : servies si le quota est épuisé. Ordre du fichier = ordre LRU.
+        for key, entry in data.get("entries", {}).items():
+            if "value" in entry:
+                self._entries[key] = {"value": entry["value"], "expires": entry.get("expires", 0)}
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        if data.get("quota", {}).get("day") == self._quota["day"]:
+            self._quota["used"] = data["quota"].get("used", 0)
+
+    def _save(self):
+        """Appelé sous verrou. Une erreur d'écriture est comptée mais ne fait pas échouer la recherche."""
+        if not self.path:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".search-cache-", suffix=".tmp")
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump({"quota": self._quota, "entries": self._entries}, f, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        except Exception as e:
+            self._stats["save_errors"] += 1
+            print(f"ERREUR [search_cache]: Écriture de {self.path} impossible: {type(e).__name__} - {e}")
+
+    # --- Quota ---
+    @staticmethod
+    def _today():
+        return datetime.datetime.now(QUOTA_TZ).date().isoformat()
+
+    def _roll_quota(self):
+        today = self._today()
+        if self._quota["day"] != today:
+            self._quota = {"day": today, "used": 0}
+
+    def exhaust_quota(self):
+        """À appeler quand l'API répond 429 : plus d'appel jusqu'à la remise à zéro du quota."""
+        with self._lock:
+            self._roll_quota()
+            self._quota["used"] = max(self._quota["used"], self.daily_quota)
+            self._save()
+
+    # --- Recherche ---
+    def get_or_fetch(self, query, locale, num, fetch):
+        """
+        Résultat en cache pour (requête normalisée, `locale`, `num`), sinon `fetch()` (un seul appel pour
+        les demandes simultanées). Retourne (valeur, "hit" | "miss" | "shared" | "stale"). Les exceptions
+        de `fetch` ne sont pas mises en cache ; lève QuotaExceeded si le quota du jour est atteint.
+        """
+        normalized = normalize_query(query)
+        key = f"{locale}|{num}|{normalized}"
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["expires"] > time.time():
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry["value"], "hit"
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                self._roll_quota()
+                if self._quota["used"] >= self.daily_quota:
+                    self._stats["quota_refusals"] += 1
+                    if entry is not None:
+                        self._stats["stale_served"] += 1
+                        return entry["value"], "stale"
+                    raise QuotaExceeded(f"Quota quotidien de recherche atteint ({self.daily_quota} requêtes).")
+                flight = self._inflight[key] = _Flight()
+                self._quota["used"] += 1 # Compté avant l'appel : deux requêtes différentes ne dépassent pas le quota ensemble
+                self._stats["misses"] += 1
+                self._stats["api_calls"] += 1
+            else:
+                self._stats["shared"] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value, "shared"
+
+        try:
+            flight.value = fetch()
+        except BaseException as e:
+            flight.error = e
+            raise
+        else:
+            ttl = self.news_ttl_s if is_news_query(normalized) else self.ttl_s
+            with self._lock:
+                self._entries[key] = {"value": flight.value, "expires": time.time() + ttl}
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                self._save()
+            return flight.value, "miss"
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+
+    def stats(self):
+        with self._lock:
+            self._roll_quota()
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["quota_day"] = self._quota["day"]
+            stats["quota_used"] = self._quota["used"]
+            stats["quota_limit"] = self.daily_quota
+        return stats
@@ -0,0 +1,190 @@
+# streaming_stt.py
+"""
+Reconnaissance vocale en flux côté serveur.
+
+Le client envoie de petites trames audio : PCM 16 bits mono 16 kHz (AudioWorklet /
+ScriptProcessor), ou un flux WebM/Ogg Opus produit par MediaRecorder, décodé en continu
+par un processus ffmpeg. Le serveur accumule l'énoncé en cours dans un tampon glissant,
+le redécode régulièrement pour produire des transcriptions intermédiaires, et émet une
+transcription finale dès qu'un silence marque la fin de l'énoncé.
+"""
+import os
+import subprocess
+import threading
+import traceback
+import concurrent.futures
+
+import numpy as np
+
+from transcription import SAMPLE_RATE, FRAME_MS, FRAME_SAMPLES
+
+INTERIM_INTERVAL_S = float(os.getenv("STT_INTERIM_INTERVAL_S", "1.0"))
+END_SILENCE_MS = int(os.getenv("STT_END_SILENCE_MS", "700"))
+SPEECH_THRESHOLD = float(os.getenv("STT_SPEECH_THRESHOLD", "0.01")) # Énergie RMS d'une trame de parole
+PRE_ROLL_MS = 300 # Audio conservé avant le début de la parole, pour ne pas couper la première syllabe
+MIN_UTTERANCE_MS = 300
+MAX_UTTERANCE_S = 25.0 # Au-delà, l'énoncé est finalisé même sans silence (fenêtre Whisper de 30 s)
+
+
+class OpusStreamDecoder:
+    """Décode un flux WebM/Ogg Opus au fil de l'eau via un processus ffmpeg persistant."""
+
+    def __init__(self, container="webm"):
+        self.process = subprocess.Popen(
+            [
+                "ffmpeg", "-nostdin", "-loglevel", "error", "-f", container, "-i", "pipe:0",
+                "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1",
+            ],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+        )
+        self._pcm = bytearray()
+        self._lock = threading.Lock()
+        # ffmpeg bloquerait en écriture si personne ne vidait sa sortie
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._reader.start()
+
+    def _read_loop(self):
+        while True:
+            chunk = self.process.stdout.read1(8192)
+            if not chunk:
+                break
+            with self._lock:
+                self._pcm.extend(chunk)
+
+    def feed(self, data):
+        self.process.stdin.write(data)
+        self.process.stdin.flush()
+
+    def read_samples(self):
+        with self._lock:
+            usable = len(self._pcm) - len(self._pcm) % 2
+            raw = bytes(self._pcm[:usable])
+            del self._pcm[:usable]
+        return np.frombuffer(raw, np.int16).astype(np.float32) / 32768.0
+
+    def flush(self, timeout=5):
+        """Fin du flux : ferme l'entrée d'ffmpeg, attend qu'il vide ses tampons et retourne les derniers échantillons."""
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=timeout)
+        except Exception:
+            self.process.kill()
+        self._reader.join(timeout=timeout) # Lit la sortie jusqu'à la fin du processus
+        return self.read_samples()
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=2)
+        except Exception:
+            self.process.kill()
+
+
+class StreamingTranscriber:
+    """
+    Segmente un flux audio en énoncés et produit des événements ("interim", texte)
+    et ("final", texte). Le décodage tourne dans un thread dédié pour ne jamais bloquer
+    la réception des trames ; `poll()` récupère les résultats disponibles.
+    """
+
+    def __init__(self, transcribe_fn, audio_format="pcm16"):
+        self.transcribe_fn = transcribe_fn # audio float32 16 kHz -> texte
+        self.decoder = OpusStreamDecoder(audio_format) if audio_format in ("webm", "ogg") else None
+        self._pending = np.zeros(0, dtype=np.float32) # Reliquat de trame pas encore analysé
+        self._frames = [] # Trames de l'énoncé en cours
+        self._pre_roll = []
+        self._in_speech = False
+        self._silence_ms = 0
+        self._samples_since_interim = 0
+        self._utterances = [] # Énoncés terminés en attente de décodage final
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="stt")
+        self._job = None
+
+    # --- Entrée audio ---
+    def feed(self, data):
+        if self.decoder:
+            self.decoder.feed(data)
+            samples = self.decoder.read_samples()
+        else:
+            usable = len(data) - len(data) % 2
+            samples = np.frombuffer(data[:usable], np.int16).astype(np.float32) / 32768.0
+        self._consume(samples)
+
+    def _consume(self, samples):
+        pending = np.concatenate((self._pending, samples)) if self._pending.size else samples
+        n_frames = len(pending) // FRAME_SAMPLES
+        self._pending = pending[n_frames * FRAME_SAMPLES:]
+        pre_roll_frames = PRE_ROLL_MS // FRAME_MS
+
+        for i in range(n_frames):
+            frame = pending[i * FRAME_SAMPLES:(i + 1) * FRAME_SAMPLES]
+            is_speech = float(np.sqrt(np.mean(frame ** 2))) > SPEECH_THRESHOLD
+            if not self._in_speech:
+                if is_speech:
+                    self._in_speech = True
+                    self._frames = self._pre_roll + [frame]
+                    self._pre_roll = []
+                    self._silence_ms = 0
+                else:
+                    self._pre_roll = (self._pre_roll + [frame])[-pre_roll_frames:]
+                continue
+
+            self._frames.append(frame)
+            self._samples_since_interim += FRAME_SAMPLES
+            self._silence_ms = 0 if is_speech else self._silence_ms + FRAME_MS
+            if self._silence_ms >= END_SILENCE_MS or len(self._frames) * FRAME_MS >= MAX_UTTERANCE_S * 1000:
+                self._end_utterance()
+
+    def _end_utterance(self):
+        speech_ms = len(self._frames) * FRAME_MS - self._silence_ms
+        if speech_ms >= MIN_UTTERANCE_MS:
+            self._utterances.append(np.concatenate(self._frames))
+        self._frames = []
+        self._in_speech = False
+        self._silence_ms = 0
+        self._samples_since_interim = 0
+
+    # --- Décodage ---
+    def _decode(self, kind, audio):
+        try:
+            return kind, self.transcribe_fn(audio).strip()
+        except Exception as e:
+            print(f"ERREUR [streaming_stt]: Échec du décodage ({kind}): {e}")
+            traceback.print_exc()
+            return kind, ""
+
+    def poll(self):
+        """Retourne les événements prêts et lance le décodage suivant si le thread est libre."""
+        events = []
+        if self._job is not None and self._job.done():
+            kind, text = self._job.result()
+            if text:
+                events.append((kind, text))
+            self._job = None
+
+        if self._job is None:
+            if self._utterances:
+                self._job = self._executor.submit(self._decode, "final", self._utterances.pop(0))
+            elif self._in_speech and self._samples_since_interim >= INTERIM_INTERVAL_S * SAMPLE_RATE:
+                # Redécodage du tampon glissant de l'énoncé en cours
+                self._samples_since_interim = 0
+                self._job = self._executor.submit(self._decode, "interim", np.concatenate(self._frames))
+        return events
+
+    def finish(self):
+        """Fin du flux : finalise l'énoncé en cours et attend tous les décodages restants."""
+        if self.decoder:
+            self._consume(self.decoder.flush())
+        if self._in_speech:
+            self._end_utterance()
+        events = []
+        while self._job is not None or self._utterances:
+            if self._job is not None:
+                self._job.result()
+            events.extend(event for event in self.poll() if event[0] == "final")
+        return events
+
+    def close(self):
+        if self.decoder:
+            self.decoder.close()
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,212 @@
+# tasks_store.py
+"""
+Copie locale des listes et tâches Google Tasks.
+
+La liste par défaut (« Ma Liste », « My Tasks »... sinon la première) est résolue une seule
+fois, et un index titre (casefold) -> (tâche, liste) permet de retrouver une tâche sans
+parcourir toutes les listes. Après un chargement complet, les rafraîchissements ne
+demandent que les tâches modifiées depuis la dernière synchro (`updatedMin`, suppressions
+et tâches terminées comprises). Les écritures de l'application (création, renommage,
+suppression) mettent la copie à jour immédiatement : une modification coûte un seul appel.
+Une recherche par titre répond depuis l'index sans synchroniser ; si la tâche a disparu entre
+temps, l'appel de modification répond 404 et l'appelant la signale par `mark_stale()`.
+"""
+import os
+import time
+import datetime
+import threading
+
+MAX_STALENESS_S = float(os.getenv("TASKS_MAX_STALENESS_S", "30")) # Au-delà, une lecture déclenche une synchro incrémentale
+TASKLISTS_TTL_S = float(os.getenv("TASKLISTS_TTL_S", "3600")) # Les listes elles-mêmes changent rarement
+PAGE_SIZE = 100 # Maximum accepté par tasks.list
+UPDATED_MIN_MARGIN_S = 60 # Marge contre les écarts d'horloge avec le serveur
+PREFERRED_LIST_TITLES = ("ma liste", "my tasks", "tâches", "tasks")
+DEFAULT_LIST_TITLE = "Ma Liste"
+
+
+def _title_key(title):
+    return " ".join((title or "").split()).casefold()
+
+
+def _rfc3339(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def _is_active(task):
+    return not task.get("deleted") and not task.get("hidden") and task.get("status") != "completed"
+
+
+class TasksStore:
+    """`service_factory()` retourne un client Tasks, ou None sans autorisation."""
+
+    def __init__(self, service_factory, max_staleness_s=MAX_STALENESS_S):
+        self.service_factory = service_factory
+        self.max_staleness_s = max_staleness_s
+        self._lists = {} # id -> titre
+        self._lists_time = 0.0
+        self._default_list = None # (id, titre)
+        self._tasks = {} # id -> (tâche, id de liste), tâches actives uniquement
+        self._by_title = {} # titre casefold -> {id de tâche: id de liste}
+        self._synced_at = None # Horloge murale du début de la dernière synchro (updatedMin suivant)
+        self._last_sync = 0.0
+        self._lock = threading.RLock()
+        self._stats = {"full_syncs": 0, "incremental_syncs": 0, "changes_received": 0, "local_writes": 0, "list_refreshes": 0, "stale_hits": 0}
+
+    # --- Listes ---
+    def _refresh_lists(self, service):
+        lists, page_token = {}, None
+        while True:
+            response = service.tasklists().list(maxResults=PAGE_SIZE, pageToken=page_token).execute()
+            lists.update((item["id"], item.get("title", "")) for item in response.get("items", []))
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                break
+        if not lists:
+            created = service.tasklists().insert(body={"title": DEFAULT_LIST_TITLE}).execute()
+            print(f"INFO [tasks_store]: Aucune liste de tâches, liste '{created['title']}' créée.")
+            lists[created["id"]] = created.get("title", DEFAULT_LIST_TITLE)
+        previous, self._lists, self._lists_time = self._lists, lists, time.monotonic()
+        self._stats["list_refreshes"] += 1
+        if self._default_list is None or self._default_list[0] not in lists:
+            preferred = [(list_id, title) for list_id, title in lists.items() if title.lower() in PREFERRED_LIST_TITLES]
+            self._default_list = preferred[0] if preferred else next(iter(lists.items()))
+        for list_id in set(task_list for _, task_list in self._tasks.values()) - set(lists):
+            self._drop_list(list_id)
+        return set(lists) - set(previous)
+
+    def default_list(self):
+        """(id, titre) de la liste par défaut, ou None sans autorisation. Peut lever HttpError."""
+        with self._lock:
+            if self._default_list is None and not self.ensure_fresh():
+                return None
+            return self._default_list
+
+    # --- Synchronisation ---
+    def ensure_fresh(self, force=False):
+        """Synchronise si la copie n'a jamais été chargée, est périmée, ou si `force`. Peut lever HttpError."""
+        with self._lock:
+            if not force and self._synced_at is not None and time.monotonic() - self._last_sync < self.max_staleness_s:
+                return True
+            service = self.service_factory()
+            if service is None:
+                return False
+            started_at = time.time()
+            new_lists = set()
+            if not self._lists or time.monotonic() - self._lists_time > TASKLISTS_TTL_S:
+                new_lists = self._refresh_lists(service)
+            if self._synced_at is None:
+                self._tasks, self._by_title = {}, {}
+                for list_id in self._lists:
+                    for task in self._list_tasks(service, list_id, showCompleted=False):
+                        self._apply(task, list_id)
+                self._stats["full_syncs"] += 1
+                print(f"INFO [tasks_store]: Synchronisation complète, {len(self._tasks)} tâche(s) active(s) dans {len(self._lists)} liste(s).")
+            else:
+                updated_min = _rfc3339(self._synced_at - UPDATED_MIN_MARGIN_S)
+                for list_id in self._lists:
+                    if list_id in new_lists: # Liste apparue depuis la dernière synchro : chargement complet
+                        params = {"showCompleted": False}
+                    else:
+                        params = {"updatedMin": updated_min, "showCompleted": True, "showHidden": True, "showDeleted": True}
+                    for task in self._list_tasks(service, list_id, **params):
+                        self._apply(task, list_id)
+                        self._stats["changes_received"] += 1
+                self._stats["incremental_syncs"] += 1
+            self._synced_at, self._last_sync = started_at, time.monotonic()
+            return True
+
+    def _list_tasks(self, service, list_id, **params):
+        page_token = None
+        while True:
+            response = service.tasks().list(tasklist=list_id, maxResults=PAGE_SIZE, pageToken=page_token, **params).execute()
+            yield from response.get("items", [])
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                return
+
+    def _apply(self, task, list_id):
+        self._discard(task["id"])
+        if _is_active(task):
+            self._tasks[task["id"]] = (task, list_id)
+            self._by_title.setdefault(_title_key(task.get("title")), {})[task["id"]] = list_id
+
+    def _discard(self, task_id):
+        previous = self._tasks.pop(task_id, None)
+        if previous is not None:
+            key = _title_key(previous[0].get("title"))
+            same_title = self._by_title.get(key, {})
+            same_title.pop(task_id, None)
+            if not same_title:
+                self._by_title.pop(key, None)
+
+    def _drop_list(self, list_id):
+        for task_id in [task_id for task_id, (_, task_list) in self._tasks.items() if task_list == list_id]:
+            self._discard(task_id)
+
+    # --- Écritures locales (après un appel réussi à l'API) ---
+    def upsert(self, task, list_id):
+        with self._lock:
+            self._apply(task, list_id)
+            self._stats["local_writes"] += 1
+
+    def remove(self, task_id):
+        with self._lock:
+            self._discard(task_id)
+            self._stats["local_writes"] += 1
+
+    def mark_stale(self, task_id):
+        """La tâche n'existe plus côté Google (404) : retirée de l'index, et la prochaine lecture resynchronise."""
+        with self._lock:
+            self._discard(task_id)
+            self._last_sync = 0.0
+            self._stats["stale_hits"] += 1
+
+    # --- Lectures ---
+    def find(self, title):
+        """
+        (id de tâche, id de liste) de la tâche active portant ce titre, liste par défaut d'abord ; (None, None) sinon.
+        Répond depuis l'index local sans appel API ; seul un titre inconnu déclenche une synchro.
+        """
+        key = _title_key(title)
+        for attempt in range(2):
+            with self._lock:
+                loaded = self._synced_at is not None
+            # Titre inconnu : une synchro forcée rattrape une tâche créée ailleurs depuis la dernière synchro
+            if (attempt > 0 or not loaded) and not self.ensure_fresh(force=attempt > 0):
+                return None, None
+            with self._lock:
+                matches = self._by_title.get(key)
+                if matches:
+                    default_id = self._default_list[0] if self._default_list else None
+                    task_id = next((task_id for task_id, list_id in matches.items() if list_id == default_id), next(iter(matches)))
+                    return task_id, matches[task_id]
+        return None, None
+
+    def active_tasks(self, list_id=None, limit=None):
+        """Tâches actives d'une liste (défaut : liste par défaut), dans l'ordre d'affichage de Google Tasks."""
+        if not self.ensure_fresh():
+            return None
+        with self._lock:
+            list_id = list_id or self._default_list[0]
+            tasks = [task for task, task_list in self._tasks.values() if task_list == list_id]
+        # Ordre de Google Tasks : tâches de premier niveau par position, sous-tâches sous leur parent
+        children = {}
+        for task in sorted(tasks, key=lambda task: task.get("position", "")):
+            children.setdefault(task.get("parent"), []).append(task)
+        ordered = []
+        for task in children.get(None, []):
+            ordered.append(task)
+            ordered.extend(children.get(task["id"], []))
+        return ordered[:limit] if limit else ordered
+
+    def list_title(self, list_id):
+        with self._lock:
+            return self._lists.get(list_id, "inconnue")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["lists"] = len(self._lists)
+            stats["active_tasks"] = len(self._tasks)
+            stats["synced"] = self._synced_at is not None
+        return stats
@@ -0,0 +1,127 @@
+# temp_reaper.py
+"""
+Nettoyage centralisé des fichiers temporaires.
+
+Un seul thread démon gère toutes les suppressions : les fichiers dont l'échéance est connue
+sont placés dans un tas (min-heap) trié par date d'expiration, et un balayage périodique du
+répertoire temporaire supprime les fichiers orphelins trop anciens, puis les plus anciens
+tant que le quota de taille totale est dépassé. Un premier balayage au démarrage élimine
+ce qu'une exécution précédente a laissé.
+"""
+import os
+import time
+import heapq
+import threading
+
+MAX_AGE_S = float(os.getenv("TEMP_MAX_AGE_S", "3600"))
+MAX_TOTAL_MB = float(os.getenv("TEMP_MAX_TOTAL_MB", "500"))
+SWEEP_INTERVAL_S = float(os.getenv("TEMP_SWEEP_INTERVAL_S", "300"))
+
+
+class TempFileReaper:
+    """Supprime les fichiers planifiés à échéance et balaie périodiquement un répertoire."""
+
+    def __init__(self, directory, max_age_s=MAX_AGE_S, max_total_bytes=MAX_TOTAL_MB * 1024 * 1024,
+                 sweep_interval_s=SWEEP_INTERVAL_S):
+        self.directory = directory
+        self.max_age_s = max_age_s
+        self.max_total_bytes = max_total_bytes
+        self.sweep_interval_s = sweep_interval_s
+        self._heap = [] # (échéance monotone, chemin)
+        self._cond = threading.Condition()
+        self._next_sweep = 0.0 # Balayage immédiat au démarrage
+        self._thread = None
+        self._stats = {
+            "scheduled": 0, "deleted": 0, "delete_errors": 0, "sweeps": 0,
+            "swept_by_age": 0, "swept_by_quota": 0, "bytes_freed": 0,
+        }
+
+    def start(self):
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="temp-reaper", daemon=True)
+                self._thread.start()
+        return self
+
+    def schedule(self, path, delay=2.0):
+        """Planifie la suppression de `path` dans `delay` secondes."""
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic() + delay, path))
+            self._stats["scheduled"] += 1
+            self._cond.notify() # La nouvelle échéance est peut-être la plus proche
+        self.start()
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats["pending"] = len(self._heap)
+        return stats
+
+    # --- Thread de nettoyage ---
+    def _run(self):
+        while True:
+            with self._cond:
+                now = time.monotonic()
+                due = []
+                while self._heap and self._heap[0][0] <= now:
+                    due.append(heapq.heappop(self._heap)[1])
+                sweep_due = now >= self._next_sweep
+                if not due and not sweep_due:
+                    next_deadline = self._heap[0][0] if self._heap else self._next_sweep
+                    self._cond.wait(timeout=min(next_deadline, self._next_sweep) - now)
+                    continue
+                if sweep_due:
+                    self._next_sweep = now + self.sweep_interval_s
+
+            # Les suppressions se font hors du verrou pour ne pas bloquer schedule()
+            for path in due:
+                self._delete(path)
+            if sweep_due:
+                self._sweep()
+
+    def _delete(self, path, reason=None):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            return False # Déjà supprimé ailleurs
+        except OSError as e:
+            print(f"ERREUR lors du nettoyage du fichier temporaire {path}: {e}")
+            with self._cond:
+                self._stats["delete_errors"] += 1
+            return False
+        with self._cond:
+            self._stats["deleted"] += 1
+            self._stats["bytes_freed"] += size
+            if reason:
+                self._stats[reason] += 1
+        return True
+
+    def _sweep(self):
+        """Supprime les fichiers plus vieux que max_age_s, puis les plus anciens au-delà du quota."""
+        try:
+            entries = [entry for entry in os.scandir(self.directory) if entry.is_file(follow_symlinks=False)]
+        except FileNotFoundError:
+            return
+        with self._cond:
+            self._stats["sweeps"] += 1
+            pending = {path for _, path in self._heap}
+
+        now = time.time()
+        remaining = []
+        for entry in entries:
+            try:
+                stat = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            if entry.path not in pending and now - stat.st_mtime > self.max_age_s:
+                self._delete(entry.path, "swept_by_age")
+            else:
+                remaining.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in remaining)
+        for _, size, path in sorted(remaining):
+            if total <= self.max_total_bytes:
+                break
+            if self._delete(path, "swept_by_quota"):
+                total -= size
@@ -0,0 +1,378 @@
+# transcription.py
+"""
+Transcription audio pour EVA.
+
+Les enregistrements longs sont découpés sur les silences par un détecteur
+d'activité vocale (VAD) basé sur l'énergie, puis chaque segment est transcrit
+en parallèle sur les cœurs CPU par un pool de processus Whisper. Les segments
+sont recollés dans l'ordre avec leurs horodatages, et un callback permet de
+diffuser le texte partiel dès qu'un segment est prêt.
+
+Le moteur de transcription est choisi par configuration (.env) :
+- "openai" : implémentation de référence PyTorch (openai-whisper) ;
+- "ctranslate2" : faster-whisper, quantifié en int8, bien plus rapide sur CPU.
+"""
+import os
+import sys
+import abc
+import json
+import queue
+import struct
+import subprocess
+import concurrent.futures
+import threading
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+FRAME_MS = 30
+FRAME_SAMPLES = SAMPLE_RATE * FRAME_MS // 1000
+
+# Réglages du découpage (surchargeables via .env)
+MIN_SILENCE_MS = int(os.getenv("WHISPER_VAD_MIN_SILENCE_MS", "500"))
+SPEECH_PAD_MS = int(os.getenv("WHISPER_VAD_SPEECH_PAD_MS", "200"))
+TARGET_SEGMENT_S = float(os.getenv("WHISPER_VAD_TARGET_SEGMENT_S", "25"))
+MAX_SEGMENT_S = 30.0 # Fenêtre native de Whisper
+MAX_WORKERS = int(os.getenv("WHISPER_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+
+
+# --- Configuration et moteurs de transcription ---
+class TranscriptionConfig:
+    """Paramètres du moteur de transcription, lus depuis l'environnement."""
+
+    def __init__(self, backend="openai", model_size="base", compute_type="int8", beam_size=1, language="fr"):
+        self.backend = backend
+        self.model_size = model_size
+        self.compute_type = compute_type
+        self.beam_size = beam_size
+        self.language = language or None # None = détection automatique de la langue
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            backend=os.getenv("WHISPER_BACKEND", "openai").lower(),
+            model_size=os.getenv("WHISPER_MODEL_SIZE", "base"),
+            compute_type=os.getenv("WHISPER_COMPUTE_TYPE", "int8"),
+            beam_size=int(os.getenv("WHISPER_BEAM_SIZE", "1")),
+            language=os.getenv("WHISPER_LANGUAGE", "fr"),
+        )
+
+    def to_dict(self):
+        return {
+            "backend": self.backend, "model_size": self.model_size, "compute_type": self.compute_type,
+            "beam_size": self.beam_size, "language": self.language,
+        }
+
+
+class WhisperBackend(abc.ABC):
+    """Interface commune des moteurs : transcrit un signal float32 mono 16 kHz en texte."""
+    name = "abstract"
+
+    @abc.abstractmethod
+    def transcribe(self, audio):
+        """Texte transcrit de `audio` (numpy float32, mono, 16 kHz)."""
+
+
+class OpenAIWhisperBackend(WhisperBackend):
+    """Implémentation de référence (PyTorch)."""
+    name = "openai"
+
+    def __init__(self, config, cpu_threads=0):
+        import torch
+        import whisper
+        if cpu_threads:
+            torch.set_num_threads(cpu_threads)
+        self.config = config
+        self.model = whisper.load_model(config.model_size)
+
+    def transcribe(self, audio):
+        options = {"fp16": False, "language": self.config.language}
+        if self.config.beam_size > 1:
+            options["beam_size"] = self.config.beam_size
+        return self.model.transcribe(audio, **options)["text"].strip()
+
+
+class CTranslate2WhisperBackend(WhisperBackend):
+    """Moteur CTranslate2 (faster-whisper), quantifié en int8 par défaut pour le CPU."""
+    name = "ctranslate2"
+
+    def __init__(self, config, cpu_threads=0):
+        from faster_whisper import WhisperModel
+        self.config = config
+        self.model = WhisperModel(
+            config.model_size, device="cpu", compute_type=config.compute_type, cpu_threads=cpu_threads
+        )
+
+    def transcribe(self, audio):
+        segments, _info = self.model.transcribe(
+            audio, beam_size=self.config.beam_size, language=self.config.language
+        )
+        return "".join(segment.text for segment in segments).strip()
+
+
+BACKENDS = {
+    OpenAIWhisperBackend.name: OpenAIWhisperBackend,
+    CTranslate2WhisperBackend.name: CTranslate2WhisperBackend,
+}
+
+def load_backend(config, cpu_threads=0):
+    """Instancie le moteur demandé. Lève ImportError si sa bibliothèque n'est pas installée."""
+    backend_class = BACKENDS.get(config.backend)
+    if backend_class is None:
+        raise ValueError(f"Moteur de transcription inconnu: '{config.backend}'. Choix possibles: {', '.join(BACKENDS)}.")
+    return backend_class(config, cpu_threads=cpu_threads)
+
+
+def _ffmpeg_decode(source, input_bytes=None):
+    command = [
+        "ffmpeg", "-nostdin", "-threads", "0", "-i", source,
+        "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(SAMPLE_RATE), "-",
+    ]
+    # communicate() lit stdout pendant l'écriture de stdin : pas d'interblocage sur les gros fichiers
+    result = subprocess.run(command, input=input_bytes, capture_output=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Échec du décodage audio par ffmpeg: {result.stderr.decode('utf-8', errors='replace')[-300:]}")
+    return np.frombuffer(result.stdout, np.int16).astype(np.float32) / 32768.0
+
+def load_audio(file_path):
+    """Décode un fichier audio quelconque en float32 mono 16 kHz via ffmpeg."""
+    return _ffmpeg_decode(file_path)
+
+def decode_audio_bytes(audio_bytes):
+    """
+    Décode des octets audio (mp3, wav, ogg, webm...) en float32 mono 16 kHz, entièrement
+    en mémoire : les octets passent par le stdin d'un unique ffmpeg, sans fichier temporaire.
+    """
+    return _ffmpeg_decode("pipe:0", input_bytes=audio_bytes)
+
+
+# --- Détection d'activité vocale ---
+def _frame_energies(audio):
+    """Retourne l'énergie RMS de chaque trame de FRAME_MS millisecondes."""
+    n_frames = len(audio) // FRAME_SAMPLES
+    if n_frames == 0:
+        return np.zeros(0, dtype=np.float32)
+    frames = audio[:n_frames * FRAME_SAMPLES].reshape(n_frames, FRAME_SAMPLES)
+    return np.sqrt(np.mean(frames.astype(np.float32) ** 2, axis=1))
+
+def detect_speech_regions(audio, min_silence_ms=MIN_SILENCE_MS):
+    """
+    Détecte les zones de parole d'un signal mono 16 kHz.
+    Retourne une liste de tuples (début, fin) en échantillons.
+    """
+    energies = _frame_energies(audio)
+    if energies.size == 0:
+        return []
+
+    # Seuil adaptatif : au-dessus du bruit de fond estimé (10e percentile), avec un plancher absolu
+    noise_floor = float(np.percentile(energies, 10))
+    threshold = max(noise_floor * 3.0, 0.005)
+    is_speech = energies > threshold
+
+    min_silence_frames = max(1, min_silence_ms // FRAME_MS)
+    regions = []
+    start = None
+    silence_run = 0
+    for i, speech in enumerate(is_speech):
+        if speech:
+            if start is None:
+                start = i
+            silence_run = 0
+        elif start is not None:
+            silence_run += 1
+            if silence_run >= min_silence_frames:
+                regions.append((start, i - silence_run + 1))
+                start = None
+                silence_run = 0
+    if start is not None:
+        regions.append((start, len(is_speech)))
+
+    pad = SPEECH_PAD_MS * SAMPLE_RATE // 1000
+    return [
+        (max(0, s * FRAME_SAMPLES - pad), min(len(audio), e * FRAME_SAMPLES + pad))
+        for s, e in regions
+    ]
+
+def split_on_silence(audio, target_s=TARGET_SEGMENT_S, max_s=MAX_SEGMENT_S):
+    """
+    Regroupe les zones de parole en segments d'environ `target_s` secondes,
+    sans jamais dépasser `max_s` (les zones trop longues sont coupées net).
+    Retourne une liste de tuples (début, fin) en échantillons.
+    """
+    target = int(target_s * SAMPLE_RATE)
+    max_len = int(max_s * SAMPLE_RATE)
+
+    regions = detect_speech_regions(audio)
+    if not regions and audio.size and float(np.abs(audio).max()) > 0.005:
+        # Signal sans silence détectable (musique, bruit constant) : on le traite d'un bloc
+        regions = [(0, len(audio))]
+
+    segments = []
+    for start, end in regions:
+        # Coupe dure des zones de parole sans silence exploitable
+        while end - start > max_len:
+            segments.append((start, start + max_len))
+            start += max_len
+        if segments and end - segments[-1][0] <= target:
+            # Fusion avec le segment précédent : Whisper traite des fenêtres de 30 s,
+            # des segments trop courts coûteraient autant sans rien apporter.
+            segments[-1] = (segments[-1][0], end)
+        else:
+            segments.append((start, end))
+    return segments
+
+
+# --- Pool de processus Whisper ---
+# Chaque worker est un sous-processus `python transcription.py --worker <modèle>` qui garde
+# son modèle en mémoire. On évite volontairement multiprocessing : en mode "spawn"
+# (seul mode disponible sous Windows), il réimporterait main.py dans chaque worker.
+# Protocole sur stdin/stdout : entier de 4 octets (taille) suivi des données brutes
+# (float32 en entrée, texte UTF-8 en sortie). Le worker charge le même moteur que
+# le processus principal, d'après la configuration transmise en argument.
+def _write_frame(stream, payload):
+    stream.write(struct.pack("<I", len(payload)))
+    stream.write(payload)
+    stream.flush()
+
+def _read_frame(stream):
+    header = stream.read(4)
+    if len(header) < 4:
+        return None
+    (size,) = struct.unpack("<I", header)
+    return stream.read(size)
+
+
+class _WhisperWorker:
+    def __init__(self, config):
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--worker", json.dumps(config.to_dict())],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+        )
+
+    def transcribe(self, segment_audio):
+        _write_frame(self.process.stdin, np.ascontiguousarray(segment_audio, dtype=np.float32).tobytes())
+        payload = _read_frame(self.process.stdout)
+        if payload is None:
+            raise RuntimeError("Le worker Whisper s'est arrêté de manière inattendue.")
+        return payload.decode("utf-8")
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=5)
+        except Exception:
+            self.process.kill()
+
+
+class ParallelTranscriber:
+    """
+    Transcrit un signal audio en le découpant sur les silences et en répartissant
+    les segments sur un pool de processus Whisper créé à la première utilisation.
+    """
+
+    def __init__(self, backend, config, max_workers=MAX_WORKERS):
+        self.backend = backend # Moteur du processus principal, utilisé pour les audios courts
+        self.config = config
+        self.max_workers = max_workers
+        self._idle_workers = queue.Queue()
+        self._executor = None
+        self._pool_lock = threading.Lock()
+        self._backend_lock = threading.Lock() # Le moteur principal n'est pas réentrant
+
+    def _get_executor(self):
+        with self._pool_lock:
+            if self._executor is None:
+                print(f"INFO: [transcription] Démarrage du pool Whisper ({self.max_workers} processus).")
+                for _ in range(self.max_workers):
+                    self._idle_workers.put(_WhisperWorker(self.config))
+                # Un thread par worker : il ne fait qu'attendre les E/S du sous-processus
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="whisper-worker"
+                )
+            return self._executor
+
+    def _run_on_worker(self, segment_audio):
+        worker = self._idle_workers.get()
+        try:
+            text = worker.transcribe(segment_audio)
+        except Exception:
+            worker.close()
+            worker = _WhisperWorker(self.config) # Remplace le worker défaillant
+            raise
+        finally:
+            self._idle_workers.put(worker)
+        return text
+
+    def transcribe(self, audio, on_segment=None):
+        """
+        Transcrit `audio` (float32 mono 16 kHz).
+        `on_segment(index, start_s, end_s, text)` est appelé dans l'ordre, dès que chaque segment est prêt.
+        Retourne la liste des segments sous forme de dicts {start, end, text}.
+        """
+        bounds = split_on_silence(audio)
+        if not bounds:
+            return []
+
+        if len(bounds) == 1 or self.max_workers <= 1:
+            # Un seul segment (ou pas de parallélisme) : pas la peine de solliciter le pool
+            jobs = [None] * len(bounds)
+        else:
+            executor = self._get_executor()
+            jobs = [executor.submit(self._run_on_worker, audio[s:e]) for s, e in bounds]
+
+        segments = []
+        for index, ((s, e), job) in enumerate(zip(bounds, jobs)):
+            if job is None:
+                text = self.transcribe_single(audio[s:e])
+            else:
+                text = job.result()
+            segment = {"start": s / SAMPLE_RATE, "end": e / SAMPLE_RATE, "text": text}
+            segments.append(segment)
+            if on_segment and text:
+                on_segment(index, segment["start"], segment["end"], text)
+        return segments
+
+    def transcribe_single(self, audio):
+        """Transcrit un court extrait d'un bloc, avec le moteur du processus principal."""
+        with self._backend_lock:
+            return self.backend.transcribe(audio)
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+            while not self._idle_workers.empty():
+                self._idle_workers.get_nowait().close()
+
+
+def format_timestamp(seconds):
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}" if hours else f"{minutes:02d}:{secs:02d}"
+
+def stitch_segments(segments):
+    """Assemble les segments transcrits en un texte horodaté."""
+    non_empty = [seg for seg in segments if seg["text"]]
+    if len(non_empty) <= 1:
+        return non_empty[0]["text"] if non_empty else ""
+    return "\n".join(f"[{format_timestamp(seg['start'])}] {seg['text']}" for seg in non_empty)
+
+
+def _worker_main(config_json):
+    """Boucle d'un worker : lit des segments sur stdin, renvoie leur transcription sur stdout."""
+    proto_in, proto_out = sys.stdin.buffer, sys.stdout.buffer
+    sys.stdout = sys.stderr # Les logs du moteur ne doivent pas polluer le protocole
+    # Un cœur par worker : le parallélisme vient du nombre de workers
+    backend = load_backend(TranscriptionConfig(**json.loads(config_json)), cpu_threads=1)
+    while True:
+        payload = _read_frame(proto_in)
+        if payload is None:
+            break
+        segment_audio = np.frombuffer(payload, dtype=np.float32)
+        _write_frame(proto_out, backend.transcribe(segment_audio).encode("utf-8"))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--worker":
+        _worker_main(sys.argv[2])
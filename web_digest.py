@@ -0,0 +1,89 @@
+# web_digest.py
+"""
+Lecture approfondie des meilleurs résultats d'une recherche Web avant la synthèse.
+
+Les pages sont téléchargées en parallèle dans un budget de temps global : à l'échéance, les
+pages encore en cours sont abandonnées et la synthèse part avec celles déjà lues. Leur texte
+est ensuite condensé en un résumé borné en tokens (estimés à ~4 caractères par token),
+réparti équitablement entre les pages : une page courte cède sa part inutilisée aux autres.
+"""
+import os
+import time
+import threading
+import concurrent.futures
+
+DEEP_PAGES = int(os.getenv("WEB_SEARCH_DEEP_PAGES", "3"))
+DEEP_BUDGET_S = float(os.getenv("WEB_SEARCH_DEEP_BUDGET_S", "5"))
+DIGEST_MAX_TOKENS = int(os.getenv("WEB_SEARCH_DIGEST_MAX_TOKENS", "3000"))
+CHARS_PER_TOKEN = 4 # Estimation pour du texte français ; évite un appel count_tokens par page
+MAX_WORKERS = 8
+
+_executor = concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="deep-read")
+_stats_lock = threading.Lock()
+_stats = {"deep_reads": 0, "pages_requested": 0, "pages_read": 0, "pages_failed": 0, "pages_cut": 0}
+
+
+def _count(**increments):
+    with _stats_lock:
+        for name, value in increments.items():
+            _stats[name] += value
+
+
+def read_pages(urls, fetch_text, budget_s=DEEP_BUDGET_S):
+    """
+    {url: texte} des pages lues avant l'échéance. `fetch_text(url, deadline)` retourne le texte
+    principal de la page (ou lève une exception) ; `deadline` est en temps time.monotonic() :
+    la fonction doit régler ses propres délais réseau pour ne pas la dépasser.
+    """
+    deadline = time.monotonic() + budget_s
+    futures = {_executor.submit(fetch_text, url, deadline): url for url in urls}
+    done, pending = concurrent.futures.wait(futures, timeout=budget_s)
+    pages, failed = {}, 0
+    for future in done:
+        try:
+            text = future.result()
+        except Exception as e:
+            failed += 1
+            print(f"INFO [web_digest]: Page ignorée {futures[future]}: {type(e).__name__} - {e}")
+            continue
+        if text:
+            pages[futures[future]] = text
+    for future in pending:
+        future.cancel() # Pas encore démarrée : n'occupe pas de thread ; sinon son résultat est ignoré
+    _count(deep_reads=1, pages_requested=len(urls), pages_read=len(pages), pages_failed=failed, pages_cut=len(pending))
+    return pages
+
+
+def _truncate(text, max_chars):
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    sentence_end = max(cut.rfind(". "), cut.rfind(".\n"))
+    if sentence_end > max_chars // 2:
+        cut = cut[:sentence_end + 1]
+    return cut.rstrip() + " […]"
+
+
+def build_digest(items, pages, max_tokens=DIGEST_MAX_TOKENS):
+    """Résumé « [n] titre (site) + texte » des pages lues, dans l'ordre des résultats, d'au plus ~max_tokens tokens."""
+    sources = []
+    for index, item in enumerate(items, 1):
+        text = pages.get(item.get("link"))
+        if text:
+            header = f"[{index}] {item.get('title', 'Sans titre')} ({item.get('displayLink', item.get('link'))})\n"
+            sources.append((header, text))
+    if not sources:
+        return ""
+    budget = max_tokens * CHARS_PER_TOKEN - sum(len(header) for header, _ in sources)
+    shares, left = {}, max(budget, 0)
+    # Les textes les plus courts sont servis d'abord : leur reste est redistribué aux suivants
+    by_length = sorted(range(len(sources)), key=lambda i: len(sources[i][1]))
+    for position, i in enumerate(by_length):
+        shares[i] = min(len(sources[i][1]), left // (len(sources) - position))
+        left -= shares[i]
+    return "\n\n".join(header + _truncate(text, shares[i]) for i, (header, text) in enumerate(sources))
+
+
+def stats():
+    with _stats_lock:
+        return dict(_stats)